@@ -4,7 +4,9 @@ from payments.models import OrderItem, Transaction, UserProfile
 
 
 class ProductSerializer(serializers.ModelSerializer):
-    
+    # Stock menos las reservas de pedidos pendientes (anotado por with_available_stock)
+    available_stock = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Product
         fields = '__all__'
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, company_dashboard, get_all_orders, get_all_transactions, get_all_users, get_transaction_detail, get_transaction_order_items, get_transactions_by_wallet, get_user_by_wallet, get_users_transactions_summary, run_check_pending_transactions, update_order_item_status, validate_cart
+from .views import ProductViewSet, company_dashboard, export_data, get_all_orders, get_all_transactions, get_all_users, get_transaction_detail, get_transaction_order_items, get_transactions_by_wallet, get_user_by_wallet, get_users_transactions_summary, run_check_pending_transactions, update_order_item_status, validate_cart
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
@@ -19,6 +19,7 @@ urlpatterns = [
     path('get-user-by-wallet/<str:wallet_address>', get_user_by_wallet, name='get_user_by_wallet'),
     path('get-transaction-detail/<str:transaction_hash>/', get_transaction_detail, name='get_transaction_detail'),
     path('update-order-item-status/<int:order_item_id>/', update_order_item_status, name='update-order-item-status'),   
+    path('export/<str:dataset>/<str:file_format>', export_data, name='export_data'),
     path('run-check_pending-transactions/<str:transaction_hash>/', run_check_pending_transactions, name='run_check_pending_transactions'),
 ]
 
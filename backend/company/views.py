@@ -1,7 +1,8 @@
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAdminUser, AllowAny
 from .serializers import OrderItemSerializer, ProductSerializer, UserProfileSerializer, TransactionSerializer
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
@@ -13,6 +14,10 @@ from django.db.models.functions import TruncDay
 from django.utils import timezone
 from datetime import timedelta
 from payments.management.commands.check_pending_transactions import Command
+from payments._services.exports import FORMATS, ExportError, astream, stream_export
+from payments._services.inventory import with_available_stock
+from payments._services.pagination import PaginationError, keyset_page
+from payments._services.web3_client import provider_is_healthy
 import logging
 import asyncio
 
@@ -28,6 +33,19 @@ class ProductViewSet(viewsets.ModelViewSet):
             return [AllowAny()]  # Permite GET sin login
         return [IsAdminUser()]  # Protege POST, PUT, DELETE
 
+    def get_queryset(self):
+        # El catálogo muestra lo que se puede comprar: stock menos reservas de pedidos pendientes
+        return with_available_stock(super().get_queryset())
+
+    def perform_create(self, serializer):
+        serializer.save()
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        # Se vuelve a leer para que available_stock refleje el nuevo stock_quantity
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -36,21 +54,27 @@ def validate_cart(request):
         items = request.data 
         invalid = []
 
+        requested = {}
         for item in items:
             product_id = item.get("id")
             quantity_requested = item.get("quantity")
             if not product_id or not isinstance(quantity_requested, int):
                 continue
+            requested[int(product_id)] = quantity_requested
 
-            try:
-                product = Product.objects.get(id=product_id)
-                if quantity_requested > product.stock_quantity:
-                    invalid.append({
-                        "id": product_id,
-                        "available": product.stock_quantity 
-                    })
-            except Product.DoesNotExist:
+        # Stock disponible (descontando reservas vivas) de todos los productos en una consulta
+        available = dict(
+            with_available_stock(Product.objects.filter(id__in=requested)).values_list('id', 'available_stock')
+        )
+
+        for product_id, quantity_requested in requested.items():
+            if product_id not in available:
                 invalid.append({ "id": product_id, "available": 0 })
+            elif quantity_requested > available[product_id]:
+                invalid.append({
+                    "id": product_id,
+                    "available": max(available[product_id], 0)
+                })
 
         return JsonResponse({"invalid": invalid})
 
@@ -62,8 +86,13 @@ def validate_cart(request):
 @permission_classes([IsAdminUser])
 def get_all_users(request):
     # Solo usuarios con perfil (filtra staff/admin si es necesario)
-    profiles = UserProfile.objects.all().select_related('user')
+    try:
+        profiles, page = keyset_page(request, UserProfile.objects.select_related('user'), status_field=None)
+    except PaginationError as e:
+        return Response({"success": False, "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     data = {
+        **page,
         'users': [
             {
                 'username': profile.user.username,
@@ -82,12 +111,12 @@ def get_all_users(request):
 @permission_classes([IsAdminUser])
 def get_transactions_by_wallet(request, wallet_address):
     try:
-        transactions = Transaction.objects.filter(wallet_address=wallet_address).order_by('-created_at')
-
-    except Transaction.DoesNotExist:
-        return Response({"success": False, "error": "No se han encontrado transacciones."}, status=status.HTTP_404_NOT_FOUND)
+        transactions, page = keyset_page(request, Transaction.objects.filter(wallet_address=wallet_address))
+    except PaginationError as e:
+        return Response({"success": False, "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     data = {
+        **page,
         'transactions': [
             {
                 'id': transaction.id,
@@ -110,12 +139,12 @@ def get_transactions_by_wallet(request, wallet_address):
 def get_all_transactions(request):
 
     try:
-        transactions = Transaction.objects.all().order_by('-created_at')
-
-    except Transaction.DoesNotExist:
-        return Response({"success": False, "error": "No se han encontrado transacciones."}, status=status.HTTP_404_NOT_FOUND)
+        transactions, page = keyset_page(request, Transaction.objects.all())
+    except PaginationError as e:
+        return Response({"success": False, "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     data = {
+        **page,
         'transactions': [
             {
                 'id': transaction.id,
@@ -228,17 +257,20 @@ def company_dashboard(request):
 @permission_classes([IsAdminUser])
 def get_all_orders(request):
     try:
-        # Obtener todas las órdenes ordenadas por fecha descendente
-        orders = OrderItem.objects.select_related(
-            'product', 
+        # Órdenes ordenadas por fecha descendente, una página cada vez
+        orders, page = keyset_page(request, OrderItem.objects.select_related(
+            'product',
             'transaction'
-        ).order_by('-created_at')
-        
+        ))
+
         serializer = OrderItemSerializer(orders, many=True)
         return Response({
             'success': True,
-            'orders': serializer.data
+            'orders': serializer.data,
+            **page,
         })
+    except PaginationError as e:
+        return Response({'success': False, 'message': str(e)}, status=400)
     except Exception as e:
         return Response({
             'success': False,
@@ -295,7 +327,14 @@ def get_user_by_wallet(request, wallet_address):
     try:
         user_profile = UserProfile.objects.get(wallet_address__iexact=wallet_address)
         serializer = UserProfileSerializer(user_profile)
-        return Response({'data': serializer.data})
+        # Recuento por estado en una consulta (índice wallet + estado): el listado de transacciones va por páginas
+        counts = Transaction.objects.filter(
+            wallet_address=user_profile.wallet_address
+        ).values('status').annotate(total=Count('id'))
+        return Response({
+            'data': serializer.data,
+            'transaction_counts': {row['status']: row['total'] for row in counts},
+        })
     except UserProfile.DoesNotExist:
         return Response({'error': 'Usuario no encontrado'}, status=status.HTTP_404_NOT_FOUND)
     
@@ -328,6 +367,13 @@ def update_order_item_status(request, order_item_id):
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def run_check_pending_transactions(request, transaction_hash=None):
+    # Fallo rápido con el estado cacheado del proveedor antes de lanzar la verificación
+    if not provider_is_healthy():
+        return Response({
+            'status': 'error',
+            'message': 'No se pudo conectar a la red Ethereum',
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
     try:
         cmd = Command()
         # Ejecutar handler async desde vista sincrónica
@@ -354,4 +400,25 @@ def run_check_pending_transactions(request, transaction_hash=None):
             'status': 'error',
             'message': 'Error interno del servidor',
             'error': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_data(request, dataset, file_format):
+    """
+    Exportación completa en streaming (ndjson, csv o parquet) de transactions,
+    order_items o user_summary. Admite los filtros status, created_from y created_to.
+    """
+    try:
+        chunks = stream_export(dataset, file_format, request.query_params)
+    except ExportError as e:
+        return Response({'success': False, 'message': str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except PaginationError as e:
+        return Response({'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    content_type, extension = FORMATS[file_format]
+    if settings.SERVER_PROFILE == 'asgi':
+        chunks = astream(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{dataset}-{timezone.now():%Y%m%d%H%M%S}.{extension}"'
+    return response
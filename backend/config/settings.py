@@ -2,6 +2,7 @@ import os
 from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -13,6 +14,10 @@ load_dotenv(BASE_DIR / ".env")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 DEBUG = os.getenv("DEBUG", "False") == "True"
 
+# 'wsgi' (gunicorn, workers síncronos) o 'asgi' (uvicorn, vistas de pago async)
+SERVER_PROFILE = os.getenv("SERVER_PROFILE", "wsgi")
+PAYMENTS_ASYNC_VIEWS = SERVER_PROFILE == "asgi"
+
 # ========== SEGURIDAD ==========
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "").split(",")
@@ -41,14 +46,82 @@ else:
 # ========== WEB3 ==========
 WEB3_PROVIDER = os.getenv('WEB3_PROVIDER')
 WEB3_WS_PROVIDER = os.getenv('WEB3_WS_PROVIDER')
+# El listener se suscribe a todos a la vez (separados por comas); por defecto solo WEB3_WS_PROVIDER
+WEB3_WS_PROVIDERS = [url.strip() for url in os.getenv('WEB3_WS_PROVIDERS', '').split(',') if url.strip()] or (
+    [WEB3_WS_PROVIDER] if WEB3_WS_PROVIDER else []
+)
+WEB3_WS_MAX_LAG = int(os.getenv('WEB3_WS_MAX_LAG', '3'))  # bloques de retraso antes de desconectar un endpoint
 PAYMENT_CONTRACT_ADDRESS = os.getenv('PAYMENT_CONTRACT_ADDRESS')
 
+# Cliente HTTP compartido por worker (ver payments/_services/web3_client.py)
+WEB3_PROVIDER_TIMEOUT = int(os.getenv('WEB3_PROVIDER_TIMEOUT', '10'))  # segundos
+WEB3_HTTP_POOL_SIZE = int(os.getenv('WEB3_HTTP_POOL_SIZE', '10'))
+WEB3_HEALTH_TTL = int(os.getenv('WEB3_HEALTH_TTL', '30'))  # segundos con el proveedor sano
+WEB3_UNHEALTHY_TTL = int(os.getenv('WEB3_UNHEALTHY_TTL', '5'))  # segundos con el proveedor caído
+
+# Circuit breaker del proveedor (estado compartido entre workers vía CACHES)
+WEB3_CIRCUIT_FAILURE_RATE = float(os.getenv('WEB3_CIRCUIT_FAILURE_RATE', '0.5'))
+WEB3_CIRCUIT_MIN_CALLS = int(os.getenv('WEB3_CIRCUIT_MIN_CALLS', '10'))
+WEB3_CIRCUIT_WINDOW = int(os.getenv('WEB3_CIRCUIT_WINDOW', '60'))  # segundos
+WEB3_CIRCUIT_SLOW_CALL = float(os.getenv('WEB3_CIRCUIT_SLOW_CALL', '5'))  # segundos
+WEB3_CIRCUIT_OPEN_SECONDS = int(os.getenv('WEB3_CIRCUIT_OPEN_SECONDS', '30'))
+
+# Caché de recibos/transacciones on-chain (ver payments/_services/chain_cache.py)
+WEB3_FINALITY_DEPTH = int(os.getenv('WEB3_FINALITY_DEPTH', '64'))  # bloques hasta considerar un recibo final
+RECEIPT_NEGATIVE_TTL = int(os.getenv('RECEIPT_NEGATIVE_TTL', '5'))  # segundos para hashes aún no minados
+RECEIPT_UNFINALIZED_TTL = int(os.getenv('RECEIPT_UNFINALIZED_TTL', '15'))  # segundos para recibos no finales
+
+# Verificador de transacciones pendientes (check_pending_transactions)
+CHECKER_CONCURRENCY = int(os.getenv('CHECKER_CONCURRENCY', '20'))  # consultas RPC simultáneas
+CHECKER_RPC_TIMEOUT = float(os.getenv('CHECKER_RPC_TIMEOUT', '10'))  # segundos por llamada RPC
+LOG_SCAN_MAX_BLOCKS = int(os.getenv('LOG_SCAN_MAX_BLOCKS', '2000'))  # bloques máximos por eth_getLogs
+
+# Listener de eventos: bloque desde el que rellenar la primera vez (sin checkpoint guardado).
+# Si no se define, el primer arranque revisa los recibos de las transacciones pendientes.
+LISTENER_START_BLOCK = int(os.getenv('LISTENER_START_BLOCK')) if os.getenv('LISTENER_START_BLOCK') else None
+# Eventos cuya transacción aún no existe: se resuelven al guardarse la transacción
+PENDING_EVENT_TTL = int(os.getenv('PENDING_EVENT_TTL', '180'))  # segundos antes de descartarlos
+PENDING_EVENT_POLL = float(os.getenv('PENDING_EVENT_POLL', '1'))  # segundos entre revisiones (y consultas sin PostgreSQL)
+# Confirmaciones exigidas antes de pasar de 'confirming' a 'confirmed' (0: confirmar al recibir el evento,
+# como antes de existir 'confirming'). 12 bloques son unos 2,5 minutos en Ethereum: cubren las
+# reorganizaciones de uno o dos bloques que aún se dan sin esperar a la finalidad (WEB3_FINALITY_DEPTH,
+# unos 13 minutos). Mientras tanto el stock sigue reservado (STOCK_RESERVATION_TTL, más abajo).
+CONFIRMATION_DEPTH = int(os.getenv('CONFIRMATION_DEPTH', '12'))
+# Un pago que salió de la cadena en una reorganización sigue en 'confirming' esperando a reincluirse;
+# el verificador lo da por fallido si pasado este tiempo desde su creación su recibo no aparece
+CONFIRMING_TIMEOUT = timedelta(minutes=int(os.getenv('CONFIRMING_TIMEOUT_MINUTES', '60')))
+
+# Etapas del listener: cola acotada entre la suscripción y los consumidores que guardan por lotes
+LISTENER_QUEUE_SIZE = int(os.getenv('LISTENER_QUEUE_SIZE', '1000'))
+LISTENER_WORKERS = int(os.getenv('LISTENER_WORKERS', '4'))  # consumidores, cada uno con su hilo y su conexión (uno solo con SQLite)
+LISTENER_BATCH_SIZE = int(os.getenv('LISTENER_BATCH_SIZE', '100'))
+LISTENER_METRICS_INTERVAL = int(os.getenv('LISTENER_METRICS_INTERVAL', '60'))  # segundos entre métricas
+# Listener repartido en procesos: cada uno procesa los eventos con transactionId % LISTENER_SHARDS == su shard.
+# Un proceso con otro LISTENER_SHARDS espera a que paren (o caduquen) las reservas del despliegue anterior.
+LISTENER_SHARDS = int(os.getenv('LISTENER_SHARDS', '1'))
+LISTENER_LEASE_TTL = int(os.getenv('LISTENER_LEASE_TTL', '30'))  # segundos sin latido hasta que otro proceso toma el shard
+
 TOKEN_ADDRESSES = {
     'USDC': os.getenv('USDC_ADDRESS'),
     'USDT': os.getenv('USDT_ADDRESS'),
     'LINK': os.getenv('LINK_ADDRESS'),
     'ETH': os.getenv('ETH_ADDRESS', '0x0000000000000000000000000000000000000000'),
 }
+# Decimales de cada token: los eventos traen el importe en la unidad mínima (wei para ETH)
+TOKEN_DECIMALS = {
+    'USDC': 6,
+    'USDT': 6,
+    'LINK': 18,
+    'ETH': 18,
+}
+
+# ========== PAGOS ==========
+# Tiempo que una transacción pendiente retiene el stock de su carrito
+STOCK_RESERVATION_TTL = timedelta(minutes=int(os.getenv('STOCK_RESERVATION_TTL_MINUTES', '15')))
+# Tiempo que se guarda la respuesta asociada a una cabecera Idempotency-Key
+IDEMPOTENCY_KEY_TTL = timedelta(hours=int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', '24')))
+# Lo que dura una clave mientras su petición está en curso: algo más que el timeout de una petición
+IDEMPOTENCY_LEASE = timedelta(seconds=int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '60')))
 
 # ========== CORS ==========
 CORS_ALLOWED_ORIGINS = [
@@ -62,6 +135,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:5173",
 ]
 
+# Los reintentos del frontend envían la cabecera Idempotency-Key
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
+
 CSRF_TRUSTED_ORIGINS = [ 
     'https://easycryptobuy.jaterli.com',
     'https://www.easycryptobuy.jaterli.com',
@@ -81,6 +157,15 @@ STATIC_ROOT = '/app/staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/app/media'
 
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    # PDFs de facturas ya generados (invoices/<id>/<versión>.pdf); por defecto bajo MEDIA_ROOT
+    "invoices": {
+        "BACKEND": os.getenv('INVOICE_STORAGE_BACKEND', "django.core.files.storage.FileSystemStorage"),
+    },
+}
+
 # ========== REST FRAMEWORK ==========
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -91,6 +176,10 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Paginación por cursor de los listados (?page_size=)
+PAGINATION_PAGE_SIZE = int(os.getenv('PAGINATION_PAGE_SIZE', '50'))
+PAGINATION_MAX_PAGE_SIZE = int(os.getenv('PAGINATION_MAX_PAGE_SIZE', '500'))
+
 # ========== JWT ==========
 from datetime import timedelta
 SIMPLE_JWT = {
@@ -0,0 +1,20 @@
+"""
+Tests contra PostgreSQL. Las pruebas de concurrencia del checkout necesitan
+SELECT ... FOR UPDATE y en SQLite se omiten:
+
+    DJANGO_SETTINGS_MODULE=config.test_settings_postgres python manage.py test
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('DB_NAME', 'postgres'),
+        'USER': os.getenv('DB_USER', 'postgres'),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': os.getenv('DB_HOST', 'localhost'),
+        'PORT': os.getenv('DB_PORT', '5432'),
+    }
+}
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.cache import cache
+from web3.exceptions import TransactionNotFound
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = "chain_"
+NOT_FOUND = "__not_found__"
+FINALIZED_BLOCK_KEY = f"{CACHE_KEY_PREFIX}finalized_block"
+FINALIZED_BLOCK_TTL = 12  # segundos (~un bloque)
+LOCK_TTL = 10  # segundos que un worker retiene la consulta de un hash
+LOCK_WAIT = 2.0  # segundos que otro worker espera el resultado antes de consultar él mismo
+
+# Consultas en curso dentro del proceso: {clave: Future}
+_inflight = {}
+_inflight_lock = threading.Lock()
+_async_inflight = {}
+
+
+def _key(kind, tx_hash):
+    if not isinstance(tx_hash, str):
+        tx_hash = tx_hash.hex()
+    tx_hash = tx_hash.lower()
+    if not tx_hash.startswith('0x'):
+        tx_hash = '0x' + tx_hash
+    return f"{CACHE_KEY_PREFIX}{kind}_{tx_hash}"
+
+
+def _unwrap(cached, tx_hash):
+    if cached == NOT_FOUND:
+        raise TransactionNotFound(f"Transacción {tx_hash} no encontrada (caché)")
+    return cached
+
+
+def _timeout_for(value, finalized_block):
+    """
+    Tiempo de vida en caché según el estado del dato:
+    - no minado: RECEIPT_NEGATIVE_TTL (caché negativa corta)
+    - minado pero no final: RECEIPT_UNFINALIZED_TTL, una reorganización podría cambiarlo
+    - final: permanente (None)
+    """
+    if value is None:
+        return settings.RECEIPT_NEGATIVE_TTL
+    block_number = value.get('blockNumber')
+    if block_number is None:
+        return settings.RECEIPT_NEGATIVE_TTL
+    if finalized_block is not None and block_number <= finalized_block:
+        return None
+    return settings.RECEIPT_UNFINALIZED_TTL
+
+
+def _store(key, value, finalized_block):
+    timeout = _timeout_for(value, finalized_block)
+    cache.set(key, NOT_FOUND if value is None else value, timeout=timeout)
+
+
+# ========== Versión síncrona (vistas) ==========
+
+def _finalized_block(w3):
+    block = cache.get(FINALIZED_BLOCK_KEY)
+    if block is None:
+        block = w3.eth.block_number - settings.WEB3_FINALITY_DEPTH
+        cache.set(FINALIZED_BLOCK_KEY, block, timeout=FINALIZED_BLOCK_TTL)
+    return block
+
+
+def _fetch(key, loader, w3, tx_hash):
+    lock_key = f"{key}_lock"
+    locked = cache.add(lock_key, 1, timeout=LOCK_TTL)
+    if not locked:
+        # Otro worker ya está consultando este hash: se espera su resultado
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            cached = cache.get(key)
+            if cached is not None:
+                return _unwrap(cached, tx_hash)
+
+    try:
+        try:
+            value = loader(tx_hash)
+        except TransactionNotFound:
+            value = None
+        _store(key, value, _finalized_block(w3) if value is not None else None)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+    if value is None:
+        raise TransactionNotFound(f"Transacción {tx_hash} no encontrada")
+    return value
+
+
+def _cached_lookup(kind, loader, w3, tx_hash):
+    key = _key(kind, tx_hash)
+    cached = cache.get(key)
+    if cached is not None:
+        return _unwrap(cached, tx_hash)
+
+    # Una sola consulta RPC por hash aunque varios hilos lo pidan a la vez
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not leader:
+        return future.result()
+
+    try:
+        result = _fetch(key, loader, w3, tx_hash)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def get_receipt(w3, tx_hash):
+    """
+    Recibo de una transacción con caché compartida.
+
+    Raises:
+        TransactionNotFound: Si la transacción aún no está minada
+    """
+    return _cached_lookup('receipt', w3.eth.get_transaction_receipt, w3, tx_hash)
+
+
+def get_transaction(w3, tx_hash):
+    """
+    Datos de una transacción con caché compartida.
+
+    Raises:
+        TransactionNotFound: Si el nodo no conoce la transacción
+    """
+    return _cached_lookup('tx', w3.eth.get_transaction, w3, tx_hash)
+
+
+# ========== Versión asíncrona (listener y verificador) ==========
+
+async def _afinalized_block(w3):
+    block = await cache.aget(FINALIZED_BLOCK_KEY)
+    if block is None:
+        block = await w3.eth.block_number - settings.WEB3_FINALITY_DEPTH
+        await cache.aset(FINALIZED_BLOCK_KEY, block, timeout=FINALIZED_BLOCK_TTL)
+    return block
+
+
+async def _afetch(key, loader, w3, tx_hash):
+    lock_key = f"{key}_lock"
+    locked = await cache.aadd(lock_key, 1, timeout=LOCK_TTL)
+    if not locked:
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            cached = await cache.aget(key)
+            if cached is not None:
+                return _unwrap(cached, tx_hash)
+
+    try:
+        try:
+            value = await loader(tx_hash)
+        except TransactionNotFound:
+            value = None
+        finalized_block = await _afinalized_block(w3) if value is not None else None
+        await cache.aset(key, NOT_FOUND if value is None else value, timeout=_timeout_for(value, finalized_block))
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
+
+    if value is None:
+        raise TransactionNotFound(f"Transacción {tx_hash} no encontrada")
+    return value
+
+
+async def _acached_lookup(kind, loader, w3, tx_hash):
+    key = _key(kind, tx_hash)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return _unwrap(cached, tx_hash)
+
+    inflight_key = (id(asyncio.get_running_loop()), key)
+    task = _async_inflight.get(inflight_key)
+    if task is None:
+        task = asyncio.ensure_future(_afetch(key, loader, w3, tx_hash))
+        _async_inflight[inflight_key] = task
+        task.add_done_callback(lambda _: _async_inflight.pop(inflight_key, None))
+    # shield: cancelar a uno de los que esperan no cancela la consulta compartida
+    return await asyncio.shield(task)
+
+
+async def aget_receipt(w3, tx_hash):
+    """Versión asíncrona de get_receipt para AsyncWeb3"""
+    return await _acached_lookup('receipt', w3.eth.get_transaction_receipt, w3, tx_hash)
+
+
+async def aget_transaction(w3, tx_hash):
+    """Versión asíncrona de get_transaction para AsyncWeb3"""
+    return await _acached_lookup('tx', w3.eth.get_transaction, w3, tx_hash)
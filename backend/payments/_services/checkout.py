@@ -0,0 +1,117 @@
+import logging
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from company.models import Product
+from payments.models import OrderItem, Transaction
+from .inventory import reserve_stock, reserved_quantities
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutError(Exception):
+    """Error de validación del checkout, con el código HTTP que debe devolver la vista"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def normalize_cart_items(cart_items):
+    """
+    Agrupa las líneas del carrito por producto.
+
+    Returns:
+        dict: {product_id: quantity} conservando el orden de llegada
+    """
+    quantities = {}
+    for item in cart_items:
+        product_id = item.get('product_id')
+        quantity = item.get('quantity')
+
+        if not product_id or not quantity:
+            raise CheckoutError("Datos de producto inválidos")
+
+        try:
+            product_id = int(product_id)
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise CheckoutError("Datos de producto inválidos")
+
+        if quantity <= 0:
+            raise CheckoutError("Datos de producto inválidos")
+
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def create_pending_transaction(wallet_address, amount, token, cart_items, transaction_hash):
+    """
+    Crea una transacción pendiente con sus OrderItems y reserva el stock.
+
+    El número de consultas es fijo sea cual sea el tamaño del carrito:
+    un SELECT ... FOR UPDATE de todos los productos, una suma agregada de
+    las reservas vivas, un INSERT de la transacción y un bulk_create para
+    los OrderItems y otro para las reservas. El stock no se descuenta hasta
+    que la transacción se confirma (ver inventory.confirm_transactions).
+
+    Raises:
+        CheckoutError: Si el carrito no es válido o no hay stock suficiente
+    """
+    quantities = normalize_cart_items(cart_items)
+    if not quantities:
+        raise CheckoutError("El carrito está vacío")
+
+    try:
+        return _create_pending_transaction(wallet_address, amount, token, quantities, transaction_hash)
+    except IntegrityError:
+        # Dos checkouts simultáneos de la misma wallet chocan en el hash provisional único
+        raise CheckoutError("Hay una transacción pendiente para esta wallet.", status=409)
+
+
+def _create_pending_transaction(wallet_address, amount, token, quantities, transaction_hash):
+    with db_transaction.atomic():
+        # Bloqueo en orden de id para que dos checkouts concurrentes no se interbloqueen
+        products = {
+            product.id: product
+            for product in Product.objects.select_for_update().filter(id__in=quantities).order_by('id')
+        }
+
+        reserved = reserved_quantities(list(products))
+
+        total_usd = Decimal('0')
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if product is None:
+                raise CheckoutError(f"Producto {product_id} no encontrado", status=404)
+            available = product.stock_quantity - reserved.get(product_id, 0)
+            if available < quantity:
+                raise CheckoutError(
+                    f"Stock insuficiente para {product.name}. Disponible: {max(available, 0)}"
+                )
+            total_usd += product.amount_usd * quantity
+
+        tx = Transaction.objects.create(
+            wallet_address=wallet_address,
+            amount=amount,
+            amount_usd=total_usd,
+            transaction_hash=transaction_hash,
+            token=token,
+            status='pending',
+        )
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                transaction=tx,
+                product=products[product_id],
+                quantity=quantity,
+                price_at_sale=products[product_id].amount_usd,
+                status='pending',
+            )
+            for product_id, quantity in quantities.items()
+        ])
+
+        reserve_stock(tx, quantities)
+
+    return tx, len(quantities)
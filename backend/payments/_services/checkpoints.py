@@ -0,0 +1,27 @@
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+
+from payments.models import ListenerCheckpoint
+
+
+def get_checkpoint(name):
+    """Último bloque procesado por el listener, o None si nunca se ha guardado"""
+    return ListenerCheckpoint.objects.filter(name=name).values_list('block_number', flat=True).first()
+
+
+def advance_checkpoint(name, block_number):
+    """
+    Guarda block_number como último bloque procesado. Nunca retrocede: si otro
+    proceso ya guardó un bloque posterior, se conserva el suyo.
+    """
+    updated = ListenerCheckpoint.objects.filter(
+        name=name, block_number__lt=block_number
+    ).update(block_number=block_number, updated_at=timezone.now())
+    if updated:
+        return
+    try:
+        with db_transaction.atomic():
+            ListenerCheckpoint.objects.get_or_create(name=name, defaults={'block_number': block_number})
+    except IntegrityError:
+        # Creado a la vez por otro proceso
+        advance_checkpoint(name, block_number)
@@ -0,0 +1,179 @@
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: la llamada se rechaza sin contactar con el proveedor"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuito '{name}' abierto")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker con estado compartido entre workers a través de la caché de Django.
+
+    - Cerrado: las llamadas pasan y se anotan en ventanas de BUCKET segundos
+      (llamadas, errores, llamadas lentas y llamadas malas, es decir con error
+      o lentas, cada una contada una sola vez) que caducan solas.
+    - Abierto: si en la ventana hay al menos min_calls llamadas y la fracción
+      de llamadas malas supera failure_rate, todas las llamadas se
+      rechazan al instante con CircuitOpenError durante open_seconds.
+    - Semiabierto: pasado ese tiempo un único worker (cache.add) hace una
+      llamada de prueba; si va bien se cierra el circuito y si no se reabre.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    BUCKET = 10  # segundos por cubeta de la ventana deslizante
+    METRICS = ('calls', 'failures', 'slow', 'bad')
+
+    def __init__(self, name, failure_rate=0.5, min_calls=10, window=60, slow_call_seconds=5.0, open_seconds=30):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.prefix = f"circuit:{name}"
+
+    # ----- estado -----
+
+    def _state_key(self):
+        return f"{self.prefix}:open_until"
+
+    def _probe_key(self):
+        return f"{self.prefix}:probe"
+
+    def _bucket_keys(self, metric, now=None):
+        current = int((now or time.time()) // self.BUCKET)
+        buckets = max(1, self.window // self.BUCKET)
+        return [f"{self.prefix}:{metric}:{bucket}" for bucket in range(current - buckets + 1, current + 1)]
+
+    def state(self):
+        open_until = cache.get(self._state_key())
+        if open_until is None:
+            return self.CLOSED
+        if time.time() < open_until:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def is_open(self):
+        """True si las llamadas se rechazarían ahora mismo (abierto o sonda ya en curso)"""
+        state = self.state()
+        return state == self.OPEN or (state == self.HALF_OPEN and cache.get(self._probe_key()) is not None)
+
+    def stats(self):
+        """Totales de la ventana deslizante: {'calls': n, 'failures': n, 'slow': n, 'bad': n}"""
+        totals = {}
+        for metric in self.METRICS:
+            keys = self._bucket_keys(metric)
+            totals[metric] = sum(cache.get_many(keys).values())
+        return totals
+
+    def _incr(self, metric):
+        key = self._bucket_keys(metric)[-1]
+        cache.add(key, 0, timeout=self.window + self.BUCKET)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # La cubeta caducó entre add e incr
+            cache.set(key, 1, timeout=self.window + self.BUCKET)
+
+    def _open(self, reason):
+        cache.set(self._state_key(), time.time() + self.open_seconds, timeout=None)
+        cache.delete(self._probe_key())
+        logger.error(f"Circuito '{self.name}' abierto durante {self.open_seconds}s: {reason}")
+
+    def _close(self):
+        cache.delete_many(
+            [self._state_key(), self._probe_key()]
+            + [key for metric in self.METRICS for key in self._bucket_keys(metric)]
+        )
+        logger.info(f"Circuito '{self.name}' cerrado de nuevo")
+
+    def reset(self):
+        self._close()
+
+    # ----- llamadas -----
+
+    def before_call(self):
+        """
+        Decide si una llamada puede salir.
+
+        Returns:
+            bool: True si la llamada es la sonda del estado semiabierto
+
+        Raises:
+            CircuitOpenError: Si el circuito está abierto
+        """
+        open_until = cache.get(self._state_key())
+        if open_until is None:
+            return False
+
+        now = time.time()
+        if now < open_until:
+            raise CircuitOpenError(self.name, retry_after=int(open_until - now) + 1)
+
+        # Semiabierto: solo un worker consigue hacer la llamada de prueba
+        if not cache.add(self._probe_key(), 1, timeout=max(int(self.slow_call_seconds * 2), 1)):
+            raise CircuitOpenError(self.name, retry_after=1)
+        return True
+
+    def record(self, elapsed, failed, probe=False):
+        slow = elapsed >= self.slow_call_seconds
+
+        if probe:
+            if failed or slow:
+                self._open("falló la llamada de prueba")
+            else:
+                self._close()
+            return
+
+        self._incr('calls')
+        if failed:
+            self._incr('failures')
+        if slow:
+            self._incr('slow')
+
+        bad = failed or slow
+        if bad:
+            # Una llamada con error y además lenta cuenta una sola vez en la tasa
+            self._incr('bad')
+            stats = self.stats()
+            if stats['calls'] >= self.min_calls:
+                rate = stats['bad'] / stats['calls']
+                if rate >= self.failure_rate:
+                    self._open(f"{rate:.0%} de llamadas con error o lentas en {self.window}s")
+
+    def call(self, func, *args, **kwargs):
+        probe = self.before_call()
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record(time.monotonic() - start, failed=True, probe=probe)
+            raise
+        self.record(time.monotonic() - start, failed=False, probe=probe)
+        return result
+
+    async def acall(self, func, *args, **kwargs):
+        """Versión asíncrona de call para corrutinas (AsyncWeb3)"""
+        probe = await sync_to_async(self.before_call, thread_sensitive=False)()
+        start = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            await sync_to_async(self.record, thread_sensitive=False)(time.monotonic() - start, True, probe)
+            raise
+        await sync_to_async(self.record, thread_sensitive=False)(time.monotonic() - start, False, probe)
+        return result
@@ -0,0 +1,168 @@
+import heapq
+import logging
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from web3.exceptions import TransactionNotFound
+
+from payments.models import Transaction
+from payments._services.inventory import confirm_transactions, fail_transactions
+from payments._services.leases import filter_shard
+
+logger = logging.getLogger(__name__)
+
+
+def to_hex(value):
+    """HexBytes o str a '0x…' en minúsculas, como se guarda en la base de datos"""
+    if isinstance(value, str):
+        return value.lower()
+    return '0x' + bytes(value).hex()
+
+
+def accept_payments(payments):
+    """
+    Registra los pagos vistos en la cadena.
+
+    Args:
+        payments (dict): {transaction_id: (hash, número de bloque, hash de bloque)}
+
+    Returns:
+        tuple: (ids confirmados ya, [(bloque, id, hash, hash de bloque)] que
+        quedan en 'confirming' hasta alcanzar CONFIRMATION_DEPTH)
+    """
+    if not settings.CONFIRMATION_DEPTH:
+        hashes = {tx_id: tx_hash for tx_id, (tx_hash, _, _) in payments.items()}
+        return confirm_transactions(list(hashes), hashes), []
+
+    with db_transaction.atomic():
+        transactions = list(
+            Transaction.objects.select_for_update().filter(id__in=payments).exclude(status='confirmed')
+        )
+        for tx in transactions:
+            tx.status = 'confirming'
+            tx.transaction_hash, tx.block_number, tx.block_hash = payments[tx.id]
+        Transaction.objects.bulk_update(transactions, ['status', 'transaction_hash', 'block_number', 'block_hash'])
+
+    return [], [(tx.block_number, tx.id, tx.transaction_hash, tx.block_hash) for tx in transactions]
+
+
+def confirming_transactions(shard=0, shards=1):
+    """Transacciones en 'confirming' (del shard) con su bloque, para reconstruir el tracker al arrancar"""
+    queryset = Transaction.objects.filter(status='confirming', block_number__isnull=False)
+    return list(
+        filter_shard(queryset, shard, shards).values_list('block_number', 'id', 'transaction_hash', 'block_hash')
+    )
+
+
+def settle_confirmations(confirmed, relocated, dropped, reverted):
+    """
+    Aplica en una transacción de base de datos el resultado de un bloque nuevo.
+
+    Args:
+        confirmed: ids con suficientes confirmaciones
+        relocated: [(bloque, id, hash, hash de bloque)] reincluidas en otro bloque
+        dropped: ids cuyo pago ya no está en la cadena: siguen en 'confirming'
+            sin bloque hasta que se reincluya (el listener recibe otra vez su
+            evento) o el verificador lo resuelva. En 'pending' con su hash real
+            el verificador los daría por fallidos al no encontrar el recibo.
+        reverted: ids cuyo pago revirtió en la nueva cadena
+    """
+    with db_transaction.atomic():
+        done = confirm_transactions(confirmed) if confirmed else []
+        moved = Transaction.objects.in_bulk([tx_id for _, tx_id, _, _ in relocated])
+        for block_number, tx_id, _, block_hash in relocated:
+            if tx_id in moved:
+                moved[tx_id].block_number, moved[tx_id].block_hash = block_number, block_hash
+        Transaction.objects.bulk_update(moved.values(), ['block_number', 'block_hash'])
+        if dropped:
+            Transaction.objects.filter(id__in=dropped, status='confirming').update(block_number=None, block_hash=None)
+        if reverted:
+            fail_transactions(reverted, statuses=('confirming',))
+    return done
+
+
+class ConfirmationTracker:
+    """
+    Transacciones en 'confirming' ordenadas por bloque en un heap. Con cada
+    cabecera nueva se sacan las que ya tienen CONFIRMATION_DEPTH
+    confirmaciones, se comprueba que su bloque sigue en la cadena y se
+    confirman en lote. Si la cabecera no continúa la anterior
+    (reorganización) se revisan también las de los últimos bloques.
+    """
+
+    def __init__(self, depth=None):
+        self.depth = settings.CONFIRMATION_DEPTH if depth is None else depth
+        self.head = None  # (número, hash) de la última cabecera procesada
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, block_number, transaction_id, tx_hash, block_hash):
+        heapq.heappush(self._heap, (block_number, transaction_id, tx_hash, block_hash))
+
+    def _pop_until(self, block_number):
+        entries = []
+        while self._heap and self._heap[0][0] <= block_number:
+            entries.append(heapq.heappop(self._heap))
+        return entries
+
+    def _pop_from(self, block_number):
+        entries = [entry for entry in self._heap if entry[0] >= block_number]
+        if entries:
+            self._heap = [entry for entry in self._heap if entry[0] < block_number]
+            heapq.heapify(self._heap)
+        return entries
+
+    async def on_head(self, w3, header):
+        """
+        Procesa una cabecera nueva.
+
+        Returns:
+            tuple: (confirmed, relocated, dropped, reverted) para settle_confirmations
+        """
+        number, block_hash = header['number'], to_hex(header['hash'])
+        reorg = self.head is not None and (
+            number <= self.head[0] or (number == self.head[0] + 1 and to_hex(header['parentHash']) != self.head[1])
+        )
+        self.head = (number, block_hash)
+
+        entries = self._pop_until(number - self.depth + 1)
+        if reorg:
+            logger.warning(f"Reorganización en el bloque {number}: se revisan los últimos {self.depth} bloques")
+            entries += self._pop_from(number - self.depth + 1)
+        if not entries:
+            return [], [], [], []
+
+        # Solo se consulta el hash canónico de los bloques que aún pueden cambiar
+        final = number - settings.WEB3_FINALITY_DEPTH
+        canonical = {
+            block: to_hex((await w3.eth.get_block(block))['hash'])
+            for block in {entry[0] for entry in entries if entry[0] > final}
+        }
+
+        confirmed, relocated, dropped, reverted = [], [], [], []
+        for entry in entries:
+            block, tx_id, tx_hash, entry_block_hash = entry
+            if block in canonical and canonical[block] != entry_block_hash:
+                try:
+                    receipt = await w3.eth.get_transaction_receipt(tx_hash)
+                except TransactionNotFound:
+                    dropped.append(tx_id)
+                    continue
+                if receipt['status'] != 1:
+                    reverted.append(tx_id)
+                    continue
+                entry = (receipt['blockNumber'], tx_id, tx_hash, to_hex(receipt['blockHash']))
+                relocated.append(entry)
+            if number - entry[0] + 1 >= self.depth:
+                confirmed.append(tx_id)
+            else:
+                self.add(*entry)
+
+        if relocated or dropped or reverted:
+            logger.warning(
+                f"Reorganización: {len(relocated)} pagos en otro bloque, {len(dropped)} fuera de la cadena, "
+                f"{len(reverted)} revertidos"
+            )
+        return confirmed, relocated, dropped, reverted
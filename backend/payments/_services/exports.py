@@ -0,0 +1,210 @@
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from payments.models import OrderItem, Transaction
+from users.models import UserProfile
+
+from .pagination import filter_queryset
+
+DEFAULT_CHUNK_SIZE = 2000
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class ExportError(Exception):
+    """Conjunto de datos o formato de exportación desconocido"""
+
+
+def _wallet_subquery(aggregate, output_field=None, **filters):
+    """Agregado de las transacciones de la wallet del perfil de la fila exterior"""
+    return Subquery(
+        Transaction.objects.filter(wallet_address=OuterRef('wallet_address'), **filters)
+        .order_by()
+        .values('wallet_address')
+        .annotate(value=aggregate)
+        .values('value'),
+        output_field=output_field,
+    )
+
+
+def _user_summary_queryset():
+    # Una sola consulta con subconsultas correlacionadas en lugar de 5 consultas por usuario
+    return UserProfile.objects.annotate(
+        confirmed=Coalesce(_wallet_subquery(Count('id'), status='confirmed'), 0, output_field=IntegerField()),
+        pending=Coalesce(_wallet_subquery(Count('id'), status='pending'), 0, output_field=IntegerField()),
+        failed=Coalesce(_wallet_subquery(Count('id'), status='failed'), 0, output_field=IntegerField()),
+        total_spent=_wallet_subquery(Sum('amount'), status='confirmed',
+                                     output_field=Transaction._meta.get_field('amount')),
+        last_transaction=_wallet_subquery(Max('created_at'),
+                                          output_field=Transaction._meta.get_field('created_at')),
+    )
+
+
+# Por conjunto: queryset base, campo de estado para filtrar y columnas (nombre, ruta, tipo Arrow)
+DATASETS = {
+    'transactions': {
+        'queryset': lambda: Transaction.objects.all(),
+        'status_field': 'status',
+        'columns': [
+            ('id', 'id', 'int64'),
+            ('transaction_hash', 'transaction_hash', 'string'),
+            ('wallet_address', 'wallet_address', 'string'),
+            ('token', 'token', 'string'),
+            ('amount', 'amount', ('decimal', 36, 18)),
+            ('amount_usd', 'amount_usd', ('decimal', 10, 2)),
+            ('status', 'status', 'string'),
+            ('created_at', 'created_at', 'timestamp'),
+        ],
+    },
+    'order_items': {
+        'queryset': lambda: OrderItem.objects.all(),
+        'status_field': 'status',
+        'columns': [
+            ('id', 'id', 'int64'),
+            ('transaction_id', 'transaction_id', 'int64'),
+            ('transaction_hash', 'transaction__transaction_hash', 'string'),
+            ('product_id', 'product_id', 'int64'),
+            ('product_name', 'product__name', 'string'),
+            ('quantity', 'quantity', 'int64'),
+            ('price_at_sale', 'price_at_sale', ('decimal', 10, 2)),
+            ('status', 'status', 'string'),
+            ('created_at', 'created_at', 'timestamp'),
+        ],
+    },
+    'user_summary': {
+        'queryset': _user_summary_queryset,
+        'status_field': None,
+        'columns': [
+            ('username', 'user__username', 'string'),
+            ('email', 'user__email', 'string'),
+            ('wallet_address', 'wallet_address', 'string'),
+            ('confirmed', 'confirmed', 'int64'),
+            ('pending', 'pending', 'int64'),
+            ('failed', 'failed', 'int64'),
+            ('total_spent', 'total_spent', ('decimal', 36, 18)),
+            ('last_transaction', 'last_transaction', 'timestamp'),
+        ],
+    },
+}
+
+
+def get_dataset(name, params=None):
+    """
+    Queryset de tuplas ordenado por id y la lista de columnas del conjunto.
+
+    Raises:
+        ExportError: Si el conjunto no existe
+        PaginationError: Si algún filtro es inválido
+    """
+    if name not in DATASETS:
+        raise ExportError(f"Conjunto de datos desconocido: {name}. Opciones: {', '.join(DATASETS)}")
+    dataset = DATASETS[name]
+    queryset = filter_queryset(params or {}, dataset['queryset'](), dataset['status_field'])
+    paths = [path for _, path, _ in dataset['columns']]
+    return queryset.order_by('pk').values_list(*paths), dataset['columns']
+
+
+def _batches(queryset, chunk_size):
+    # iterator() evita la caché del queryset; en PostgreSQL usa un cursor de servidor
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while batch := list(islice(rows, chunk_size)):
+        yield batch
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _ndjson(queryset, columns, chunk_size):
+    names = [name for name, _, _ in columns]
+    for batch in _batches(queryset, chunk_size):
+        yield ''.join(
+            json.dumps(dict(zip(names, map(_plain, row))), ensure_ascii=False) + '\n'
+            for row in batch
+        ).encode()
+
+
+def _csv(queryset, columns, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _, _ in columns])
+    for batch in _batches(queryset, chunk_size):
+        writer.writerows([map(_plain, row) for row in batch])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {'int64': pa.int64(), 'string': pa.string(), 'timestamp': pa.timestamp('us', tz='UTC')}
+    return pa.schema([
+        (name, pa.decimal128(kind[1], kind[2]) if isinstance(kind, tuple) else types[kind])
+        for name, _, kind in columns
+    ])
+
+
+def _parquet(queryset, columns, chunk_size):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(columns)
+    sink = io.BytesIO()
+    # Un row group por lote: lo escrito se envía y se descarta del buffer
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for batch in _batches(queryset, chunk_size):
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)],
+                schema=schema,
+            ))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # Pie del fichero con los metadatos
+    yield sink.getvalue()
+
+
+WRITERS = {'ndjson': _ndjson, 'csv': _csv, 'parquet': _parquet}
+
+
+def stream_export(name, file_format, params=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Generador de bloques de bytes con la exportación completa, un bloque por
+    lote de chunk_size filas, de modo que la memoria no depende del tamaño
+    de la tabla.
+
+    Raises:
+        ExportError: Si el conjunto o el formato no existen
+    """
+    if file_format not in WRITERS:
+        raise ExportError(f"Formato desconocido: {file_format}. Opciones: {', '.join(WRITERS)}")
+    queryset, columns = get_dataset(name, params)
+    return WRITERS[file_format](queryset, columns, chunk_size)
+
+
+async def astream(chunks):
+    """
+    Adapta el generador síncrono para ASGI: cada lote se produce en el hilo
+    del ORM en lugar de que Django consuma (y acumule) todo el iterador.
+    """
+    chunks = iter(chunks)
+    while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+        yield chunk
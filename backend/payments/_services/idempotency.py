@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+
+from payments.models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+# Resultados de claim()
+NEW = 'new'
+REPLAY = 'replay'
+IN_PROGRESS = 'in_progress'
+MISMATCH = 'mismatch'
+
+
+def fingerprint(method, path, body):
+    """Huella de la petición: una misma clave no puede reutilizarse con otro contenido"""
+    payload = json.dumps(
+        {'method': method, 'path': path, 'body': body},
+        sort_keys=True,
+        cls=DjangoJSONEncoder,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def claim(scope, owner, key, request_fingerprint):
+    """
+    Reserva una clave de idempotencia antes de ejecutar la vista.
+
+    Mientras está en curso la clave solo dura IDEMPOTENCY_LEASE: si el worker
+    muere a mitad de la petición, los reintentos vuelven a ejecutarla en
+    cuanto vence en lugar de recibir 409 durante todo IDEMPOTENCY_KEY_TTL.
+
+    Returns:
+        tuple: (resultado, registro) donde resultado es NEW, REPLAY,
+        IN_PROGRESS o MISMATCH
+    """
+    now = timezone.now()
+    # Expiración perezosa: una clave caducada se puede volver a usar
+    IdempotencyKey.objects.filter(scope=scope, owner=owner, key=key, expires_at__lte=now).delete()
+
+    try:
+        with db_transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                scope=scope,
+                owner=owner,
+                key=key,
+                fingerprint=request_fingerprint,
+                expires_at=now + settings.IDEMPOTENCY_LEASE,
+            )
+        return NEW, record
+    except IntegrityError:
+        record = IdempotencyKey.objects.filter(scope=scope, owner=owner, key=key).first()
+
+    if record is None:
+        # La petición original falló y liberó la clave entre medias
+        return claim(scope, owner, key, request_fingerprint)
+    if record.fingerprint != request_fingerprint:
+        return MISMATCH, record
+    if record.response_status is None:
+        return IN_PROGRESS, record
+    return REPLAY, record
+
+
+def complete(record, status_code, body):
+    """
+    Guarda la respuesta de la petición original y extiende la clave a
+    IDEMPOTENCY_KEY_TTL. Los errores 5xx no se guardan: se libera la clave
+    para que el reintento vuelva a ejecutarse.
+
+    Si la reserva venció antes de terminar, la clave puede ser ya de un
+    reintento: no se toca.
+    """
+    if status_code >= 500:
+        release(record)
+        return
+    IdempotencyKey.objects.filter(pk=record.pk, response_status__isnull=True).update(
+        response_status=status_code,
+        response_body=json.loads(json.dumps(body, cls=DjangoJSONEncoder)),
+        expires_at=timezone.now() + settings.IDEMPOTENCY_KEY_TTL,
+    )
+
+
+def release(record):
+    IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+
+def purge_expired_keys(now=None):
+    """Borra en un solo DELETE las claves caducadas"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    if deleted:
+        logger.info(f"Eliminadas {deleted} claves de idempotencia expiradas")
+    return deleted
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from web3.exceptions import Web3RPCError
+
+from payments._services.checkpoints import advance_checkpoint
+from payments._services.confirmations import to_hex
+from payments._services.log_scanner import range_rejected
+from payments._services.payment_events import record_payment_events, record_withdrawal_events
+
+logger = logging.getLogger(__name__)
+
+# Eventos indexados y cómo se guarda cada uno
+EVENTS = {
+    'PaymentReceived': record_payment_events,
+    'Withdrawn': record_withdrawal_events,
+}
+# Reintentos de un tramo ante errores que no son de tamaño (red, límite de peticiones...)
+MAX_ATTEMPTS = 3
+
+
+class ChainIndexer:
+    """
+    Recorre los logs del contrato de pagos entre dos bloques con varios
+    tramos eth_getLogs en paralelo. Cada petición pide a la vez todos los
+    eventos indexados (filtro OR de topics).
+
+    El tamaño de tramo es compartido: si el proveedor rechaza uno, el tramo se
+    parte en dos y los siguientes se piden más pequeños; tras cada respuesta
+    correcta crece sin superar el mayor tamaño que no ha sido rechazado. Los
+    tramos terminan en cualquier orden, pero el checkpoint solo avanza hasta
+    el último bloque con todos los anteriores guardados, así que el proceso se
+    puede cortar y reanudar.
+    """
+
+    def __init__(self, w3, contract, checkpoint_name, workers=4, max_span=None, timeout=None):
+        self.w3 = w3
+        self.contract = contract
+        self.checkpoint_name = checkpoint_name
+        self.workers = workers
+        self.span = self.limit = max_span or settings.LOG_SCAN_MAX_BLOCKS
+        self.timeout = timeout or settings.CHECKER_RPC_TIMEOUT
+        self.events = {
+            getattr(contract.events, name)().topic.lower(): (name, getattr(contract.events, name)()) for name in EVENTS
+        }
+        self.calls = 0
+        self.stored = dict.fromkeys(EVENTS, 0)
+
+    async def run(self, from_block, to_block):
+        """Indexa [from_block, to_block] y devuelve el último bloque guardado de forma contigua"""
+        self.end = to_block
+        self.cursor = from_block
+        self.committed = from_block - 1
+        self.retries = deque()  # tramos partidos o fallidos: se piden antes que los nuevos
+        self.finished = {}  # inicio -> fin de los tramos guardados fuera de orden
+        self.active = 0
+        self.changed = asyncio.Event()
+
+        async with asyncio.TaskGroup() as group:
+            for _ in range(self.workers):
+                group.create_task(self.worker())
+        return self.committed
+
+    def next_range(self):
+        if self.retries:
+            return self.retries.popleft()
+        if self.cursor > self.end:
+            return None
+        start, end = self.cursor, min(self.cursor + self.span - 1, self.end)
+        self.cursor = end + 1
+        return start, end, 1
+
+    async def worker(self):
+        while True:
+            chunk = self.next_range()
+            if chunk is None:
+                if not self.active and not self.retries:
+                    return
+                # Otro worker puede devolver un tramo partido: se espera a que cambie algo
+                self.changed.clear()
+                await self.changed.wait()
+                continue
+
+            self.active += 1
+            try:
+                await self.index_range(*chunk)
+            finally:
+                self.active -= 1
+                self.changed.set()
+
+    async def index_range(self, start, end, attempt):
+        try:
+            logs = await self.get_logs(start, end)
+        except (Web3RPCError, ValueError, asyncio.TimeoutError) as e:
+            too_large = isinstance(e, asyncio.TimeoutError) or range_rejected(e)
+            if too_large and end > start:
+                self.limit = min(self.limit, end - start)
+                self.span = max(1, min(self.span, (end - start + 1) // 2))
+                middle = start + (end - start) // 2
+                self.retries.extendleft([(middle + 1, end, 1), (start, middle, 1)])
+                logger.info(f"Rango {start}-{end} rechazado por el proveedor, se reduce a {self.span} bloques")
+                return
+            if attempt >= MAX_ATTEMPTS:
+                raise
+            logger.warning(f"Error en el rango {start}-{end} (intento {attempt}/{MAX_ATTEMPTS}): {e}")
+            await asyncio.sleep(2 ** attempt)
+            self.retries.append((start, end, attempt + 1))
+            return
+
+        self.span = min(self.limit, self.span * 2)
+        await sync_to_async(self.store)(logs)
+        await self.finish(start, end)
+
+    async def get_logs(self, from_block, to_block):
+        self.calls += 1
+        return await asyncio.wait_for(
+            self.w3.eth.get_logs({
+                'address': self.contract.address,
+                'fromBlock': from_block,
+                'toBlock': to_block,
+                'topics': [list(self.events)],
+            }),
+            timeout=self.timeout,
+        )
+
+    def store(self, logs):
+        decoded = {name: [] for name in EVENTS}
+        for log in logs:
+            name, event = self.events[to_hex(log['topics'][0])]
+            decoded[name].append(event.process_log(log))
+        for name, events in decoded.items():
+            self.stored[name] += EVENTS[name](events)
+
+    async def finish(self, start, end):
+        self.finished[start] = end
+        committed = self.committed
+        while committed + 1 in self.finished:
+            committed = self.finished.pop(committed + 1)
+        if committed != self.committed:
+            self.committed = committed
+            await sync_to_async(advance_checkpoint)(self.checkpoint_name, committed)
+
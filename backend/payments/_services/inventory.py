@@ -0,0 +1,215 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, IntegerField, OuterRef, PositiveIntegerField, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from company.models import Product
+from payments.models import OrderItem, StockReservation, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+def reservation_expiry(now=None):
+    """Fecha de expiración para una reserva creada ahora"""
+    return (now or timezone.now()) + settings.STOCK_RESERVATION_TTL
+
+
+def live_reservations(now=None):
+    """Reservas que siguen reteniendo stock (no expiradas)"""
+    return StockReservation.objects.filter(expires_at__gt=now or timezone.now())
+
+
+def reserved_quantities(product_ids, now=None):
+    """
+    Stock retenido por reservas vivas, en una sola consulta agregada.
+
+    Returns:
+        dict: {product_id: cantidad reservada}
+    """
+    rows = live_reservations(now).filter(
+        product_id__in=product_ids
+    ).values('product_id').annotate(reserved=Sum('quantity'))
+    return {row['product_id']: row['reserved'] for row in rows}
+
+
+def with_available_stock(queryset, now=None):
+    """Anota available_stock = stock_quantity - reservas vivas sobre un queryset de productos"""
+    reserved = live_reservations(now).filter(
+        product_id=OuterRef('pk')
+    ).order_by().values('product_id').annotate(total=Sum('quantity')).values('total')
+    return queryset.annotate(
+        available_stock=F('stock_quantity') - Coalesce(Subquery(reserved, output_field=IntegerField()), Value(0))
+    )
+
+
+def reserve_stock(tx, quantities, now=None):
+    """Crea las reservas de una transacción pendiente: {product_id: quantity}"""
+    expires_at = reservation_expiry(now)
+    StockReservation.objects.bulk_create([
+        StockReservation(transaction=tx, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def release_reservations(transaction_ids):
+    """Libera de golpe las reservas de varias transacciones"""
+    deleted, _ = StockReservation.objects.filter(transaction_id__in=transaction_ids).delete()
+    return deleted
+
+
+def purge_expired_reservations(now=None):
+    """
+    Borra en un solo DELETE las reservas caducadas.
+
+    Las reservas expiradas ya no cuentan para el stock disponible; esto solo
+    mantiene la tabla pequeña.
+    """
+    deleted, _ = StockReservation.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    if deleted:
+        logger.info(f"Eliminadas {deleted} reservas de stock expiradas")
+    return deleted
+
+
+def commit_stock(transaction_ids):
+    """
+    Descuenta definitivamente del stock lo vendido en las transacciones y
+    elimina sus reservas. Un único UPDATE agregado por producto.
+
+    Si un pago se confirma después de caducar su reserva, otro pedido puede
+    haberse llevado esas unidades: el stock queda en 0 y se avisa de las
+    unidades vendidas de más.
+
+    Returns:
+        dict: {product_id: unidades vendidas sin stock}
+    """
+    sold = OrderItem.objects.filter(
+        transaction_id__in=transaction_ids
+    ).values('product_id').annotate(total=Sum('quantity'))
+    quantities = {row['product_id']: row['total'] for row in sold}
+
+    oversold = {}
+    if quantities:
+        # Bloqueo en orden de id, como en el checkout
+        stock = Product.objects.select_for_update().filter(id__in=quantities).order_by('id').values_list(
+            'id', 'stock_quantity'
+        )
+        oversold = {
+            product_id: quantities[product_id] - available
+            for product_id, available in stock
+            if quantities[product_id] > available
+        }
+        if oversold:
+            logger.warning(
+                f"Sobreventa al confirmar las transacciones {sorted(transaction_ids)}: "
+                f"unidades sin stock por producto {oversold}"
+            )
+
+        sold_per_product = Case(
+            *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+            output_field=PositiveIntegerField(),
+        )
+        Product.objects.filter(id__in=quantities).update(
+            stock_quantity=Greatest(F('stock_quantity') - sold_per_product, Value(0))
+        )
+
+    release_reservations(transaction_ids)
+    return oversold
+
+
+def confirm_transactions(transaction_ids, hashes=None):
+    """
+    Marca las transacciones como confirmadas y consume su stock reservado.
+
+    Solo se procesan las que aún no estaban confirmadas, de modo que el stock
+    no se descuenta dos veces aunque el listener y el verificador confirmen
+    la misma transacción.
+
+    Args:
+        transaction_ids (iterable): IDs de las transacciones a confirmar
+        hashes (dict): {transaction_id: hash real} para sustituir el hash provisional
+
+    Returns:
+        list: IDs que han pasado a confirmed en esta llamada
+    """
+    hashes = hashes or {}
+    with db_transaction.atomic():
+        transactions = list(
+            Transaction.objects.select_for_update().filter(id__in=transaction_ids).exclude(status='confirmed')
+        )
+        if not transactions:
+            return []
+
+        for tx in transactions:
+            tx.status = 'confirmed'
+            if hashes.get(tx.id):
+                tx.transaction_hash = hashes[tx.id]
+        Transaction.objects.bulk_update(transactions, ['status', 'transaction_hash'])
+
+        confirmed_ids = [tx.id for tx in transactions]
+        commit_stock(confirmed_ids)
+
+    return confirmed_ids
+
+
+def restore_stock(transaction_ids):
+    """Devuelve al stock lo vendido en transacciones ya confirmadas: un único UPDATE agregado por producto"""
+    sold = OrderItem.objects.filter(
+        transaction_id__in=transaction_ids
+    ).values('product_id').annotate(total=Sum('quantity'))
+    quantities = {row['product_id']: row['total'] for row in sold}
+
+    if quantities:
+        sold_per_product = Case(
+            *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+            output_field=PositiveIntegerField(),
+        )
+        Product.objects.filter(id__in=quantities).update(stock_quantity=F('stock_quantity') + sold_per_product)
+    return quantities
+
+
+def fail_transactions(transaction_ids, statuses=('pending', 'confirming')):
+    """
+    Marca varias transacciones como fallidas con un número fijo de consultas,
+    sea cual sea su número:
+
+    - un UPDATE de sus OrderItems a cancelled
+    - un DELETE de sus reservas: el stock de una pendiente solo estaba
+      reservado, así que no hay que tocar los productos
+    - un UPDATE agregado por producto solo si alguna ya estaba confirmada
+      (su stock se había descontado en confirm_transactions)
+    - un bulk_update de estado y hash (failed_<id>_<timestamp>, para evitar reintentos)
+
+    Args:
+        transaction_ids (iterable): IDs de las transacciones
+        statuses (tuple): Estados desde los que se permite pasar a failed; una
+            transacción confirmada solo se revierte si se incluye 'confirmed'
+
+    Returns:
+        tuple: (IDs marcados como fallidos, reservas liberadas)
+    """
+    with db_transaction.atomic():
+        transactions = list(
+            Transaction.objects.select_for_update().filter(id__in=transaction_ids, status__in=statuses)
+        )
+        if not transactions:
+            return [], 0
+
+        failed_ids = [tx.id for tx in transactions]
+        committed_ids = [tx.id for tx in transactions if tx.status == 'confirmed']
+        if committed_ids:
+            restore_stock(committed_ids)
+
+        OrderItem.objects.filter(transaction_id__in=failed_ids).update(status='cancelled')
+        released = release_reservations(failed_ids)
+
+        timestamp = timezone.now().timestamp()
+        for tx in transactions:
+            tx.status = 'failed'
+            tx.transaction_hash = f"failed_{tx.id}_{timestamp}"
+        Transaction.objects.bulk_update(transactions, ['status', 'transaction_hash'])
+
+    logger.info(f"{len(failed_ids)} transacciones marcadas como fallidas. Se liberaron {released} reservas de inventario.")
+    return failed_ids, released
@@ -0,0 +1,218 @@
+import hashlib
+import io
+import json
+import logging
+import posixpath
+from decimal import Decimal
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from payments.utils.formatters import format_scientific_to_decimal
+
+logger = logging.getLogger(__name__)
+
+# Cambiar al modificar el diseño: invalida todas las facturas guardadas
+LAYOUT_VERSION = 1
+
+
+def invoice_snapshot(transaction, order_items=None):
+    """
+    Datos de la factura como tipos simples (serializables y picklables).
+    Incluye todo lo que se pinta, así que cualquier cambio de estado o de
+    líneas de pedido produce otra versión.
+    """
+    if order_items is None:
+        order_items = transaction.order_items.select_related('product').all()
+    return {
+        'id': transaction.id,
+        'created_at': transaction.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'wallet_address': transaction.wallet_address,
+        'amount': format_scientific_to_decimal(transaction.amount),
+        'token': transaction.token,
+        'transaction_hash': transaction.transaction_hash,
+        'status': transaction.status,
+        'items': [
+            {
+                'name': item.product.name,
+                'quantity': item.quantity,
+                'price_at_sale': str(item.price_at_sale),
+            }
+            for item in order_items
+        ],
+    }
+
+
+def snapshot_version(snapshot):
+    payload = json.dumps({'layout': LAYOUT_VERSION, 'invoice': snapshot}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+# Estilos construidos una sola vez por proceso. Nunca se modifican al renderizar:
+# antes se cambiaba styles['Normal'] en cada factura.
+STYLES = getSampleStyleSheet()
+TITLE_STYLE = STYLES['Title']
+HEADING_STYLE = STYLES['Heading4']
+BODY_STYLE = ParagraphStyle('InvoiceBody', parent=STYLES['Normal'], fontSize=9)
+
+INFO_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.whitesmoke),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+PRODUCTS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('ALIGN', (1, 1), (-1, -2), 'CENTER'),
+    ('ALIGN', (-2, -1), (-1, -1), 'RIGHT'),
+])
+PRODUCTS_HEADER = ['Producto', 'Cantidad', 'Precio Unitario', 'Subtotal']
+
+PRODUCTS_TITLE = "<b>Productos Comprados:</b>"
+NO_PRODUCTS = "<i>No se encontraron productos asociados a esta transacción.</i>"
+THANKS = "<font size=12>Gracias por realizar el pago. Si tiene alguna duda, no dude en ponerse en contacto con nosotros.</font>"
+AUTOGENERATED = "<font size=10><i>Este es un documento generado automáticamente. No requiere firma.</i></font>"
+
+
+def render_invoice(snapshot, output):
+    """
+    Escribe el PDF de la factura en output (fichero o buffer). Los flowables
+    y la plantilla de página guardan estado durante la maquetación, así que
+    se crean en cada llamada; estilos y TableStyle se reutilizan.
+    """
+    token = snapshot['token']
+    doc = SimpleDocTemplate(output, pagesize=letter)
+
+    elements = [
+        Paragraph(f'<font size=18><b>Factura de Pago - #{snapshot["id"]}</b></font>', TITLE_STYLE),
+        Spacer(1, 12),
+        Table([
+            ['ID de Transacción', str(snapshot['id'])],
+            ['Fecha', snapshot['created_at']],
+            ['Wallet', snapshot['wallet_address']],
+            ['Monto', f'{snapshot["amount"]} {token}'],
+            ['Hash de Transacción', Paragraph(snapshot['transaction_hash'], BODY_STYLE)],
+            ['Estado', snapshot['status'].title()],
+        ], colWidths=[200, 350], style=INFO_TABLE_STYLE),
+        Spacer(1, 24),
+    ]
+
+    # Tabla de productos
+    if snapshot['items']:
+        product_data = [PRODUCTS_HEADER]
+        total = 0
+        for item in snapshot['items']:
+            price = Decimal(item['price_at_sale'])
+            subtotal = price * item['quantity']
+            total += subtotal
+            product_data.append([item['name'], str(item['quantity']), f"{price:.2f} {token}", f"{subtotal:.2f} {token}"])
+        product_data.append(['', '', 'Total:', f"{total:.2f} {token}"])
+
+        elements += [
+            Paragraph(PRODUCTS_TITLE, HEADING_STYLE),
+            Spacer(1, 6),
+            Table(product_data, colWidths=[200, 100, 120, 130], style=PRODUCTS_TABLE_STYLE),
+            Spacer(1, 24),
+        ]
+    else:
+        elements += [Paragraph(NO_PRODUCTS, BODY_STYLE), Spacer(1, 24)]
+
+    # Mensaje final
+    elements += [
+        Paragraph(THANKS, BODY_STYLE),
+        Spacer(1, 12),
+        Paragraph(AUTOGENERATED, BODY_STYLE),
+    ]
+
+    doc.build(elements)
+
+
+def warm_up():
+    """Renderiza una factura mínima para cargar fuentes y métricas antes de medir o servir"""
+    render_invoice_bytes({
+        'id': 0, 'created_at': '', 'wallet_address': '', 'amount': '0', 'token': 'USDT',
+        'transaction_hash': '', 'status': 'confirmed',
+        'items': [{'name': '', 'quantity': 1, 'price_at_sale': '0'}],
+    })
+
+
+def render_invoice_bytes(snapshot):
+    buffer = io.BytesIO()
+    render_invoice(snapshot, buffer)
+    return buffer.getvalue()
+
+
+# ========== Caché en almacenamiento ==========
+
+def invoice_storage():
+    return storages['invoices']
+
+
+def invoice_path(transaction_id, version):
+    return f"invoices/{transaction_id}/{version}.pdf"
+
+
+def open_invoice(snapshot, version):
+    """
+    Fichero abierto con el PDF de esta versión. Solo se renderiza si aún no
+    está en el almacenamiento; al guardar una versión nueva se borran las
+    anteriores de la misma transacción. Si el almacenamiento falla, la
+    factura se sirve igualmente desde memoria.
+    """
+    storage = invoice_storage()
+    path = invoice_path(snapshot['id'], version)
+    try:
+        return storage.open(path, 'rb')
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Almacenamiento de facturas no disponible: {e}")
+
+    pdf = render_invoice_bytes(snapshot)
+    try:
+        store_invoice(snapshot['id'], version, pdf)
+    except OSError as e:
+        logger.warning(f"No se pudo guardar la factura {path}: {e}")
+    return io.BytesIO(pdf)
+
+
+def store_invoice(transaction_id, version, pdf):
+    """Guarda el PDF de una versión y borra las anteriores de la transacción"""
+    storage = invoice_storage()
+    path = invoice_path(transaction_id, version)
+    saved = storage.save(path, ContentFile(pdf))
+    if saved != path:
+        # Otro worker guardó la misma versión a la vez: se conserva la suya
+        storage.delete(saved)
+    _prune_old_versions(storage, transaction_id, version)
+    return path
+
+
+def invoice_last_modified(snapshot, version):
+    """Fecha de guardado de la versión en caché, o None si aún no existe"""
+    try:
+        return invoice_storage().get_modified_time(invoice_path(snapshot['id'], version))
+    except (OSError, NotImplementedError):
+        return None
+
+
+def _prune_old_versions(storage, transaction_id, version):
+    directory = posixpath.dirname(invoice_path(transaction_id, version))
+    try:
+        _, files = storage.listdir(directory)
+    except (OSError, NotImplementedError):
+        return
+    for name in files:
+        if name != f"{version}.pdf":
+            storage.delete(posixpath.join(directory, name))
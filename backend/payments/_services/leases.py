@@ -0,0 +1,104 @@
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from payments.models import ListenerLease
+
+
+class ShardLayoutConflict(Exception):
+    """Hay procesos vivos con otro número de shards: repartirían los mismos transactionId de otra forma"""
+
+    def __init__(self, shards, others):
+        self.shards = shards
+        self.others = others
+        super().__init__(
+            f"Hay listeners activos con {', '.join(map(str, others))} shards; este arranca con {shards}"
+        )
+
+
+def live_layouts(shards):
+    """Números de shards, distintos de shards, con alguna reserva viva"""
+    return sorted(set(
+        ListenerLease.objects.filter(expires_at__gt=timezone.now()).exclude(shards=shards)
+        .values_list('shards', flat=True)
+    ))
+
+
+def lease_owner():
+    """Identificador único del proceso: host y pid para localizarlo, más un sufijo por si el pid se reutiliza"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def acquire_shard(owner, shards, ttl=None):
+    """
+    Reserva el primer shard libre (sin dueño o con el latido caducado).
+    Cada intento es un UPDATE condicional, así que dos procesos no pueden
+    quedarse con el mismo shard.
+
+    Las reservas son únicas por (shards, shard): un proceso con otro
+    LISTENER_SHARDS no choca con ellas y procesaría los mismos eventos. Por
+    eso no se reserva nada mientras haya reservas vivas con otro número de
+    shards (hasta que el despliegue anterior pare o sus latidos caduquen).
+
+    Returns:
+        int | None: shard reservado, o None si todos tienen dueño
+
+    Raises:
+        ShardLayoutConflict: si hay procesos vivos con otro número de shards
+    """
+    others = live_layouts(shards)
+    if others:
+        raise ShardLayoutConflict(shards, others)
+
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl or settings.LISTENER_LEASE_TTL)
+    ListenerLease.objects.bulk_create(
+        [ListenerLease(shard=shard, shards=shards, expires_at=now) for shard in range(shards)],
+        ignore_conflicts=True,
+    )
+
+    free = ListenerLease.objects.filter(shards=shards).filter(Q(expires_at__lte=now) | Q(owner=owner))
+    for shard in free.order_by('shard').values_list('shard', flat=True):
+        taken = ListenerLease.objects.filter(
+            Q(expires_at__lte=now) | Q(owner=owner), shards=shards, shard=shard
+        ).update(owner=owner, expires_at=expires_at)
+        if taken:
+            # Un proceso con otro número de shards pudo reservar a la vez: se comprueba ya con el shard tomado
+            others = live_layouts(shards)
+            if others:
+                release_shard(owner, shard, shards)
+                raise ShardLayoutConflict(shards, others)
+            return shard
+    return None
+
+
+def renew_shard(owner, shard, shards, ttl=None):
+    """Latido: amplía la reserva. False si el shard ya no es de este proceso"""
+    expires_at = timezone.now() + timedelta(seconds=ttl or settings.LISTENER_LEASE_TTL)
+    return bool(
+        ListenerLease.objects.filter(shards=shards, shard=shard, owner=owner).update(expires_at=expires_at)
+    )
+
+
+def release_shard(owner, shard, shards):
+    """Libera el shard al parar para que otro proceso lo tome sin esperar a que caduque"""
+    ListenerLease.objects.filter(shards=shards, shard=shard, owner=owner).update(
+        owner='', expires_at=timezone.now()
+    )
+
+
+def in_shard(transaction_id, shard, shards):
+    return shards <= 1 or transaction_id % shards == shard
+
+
+def filter_shard(queryset, shard, shards):
+    """Solo las transacciones del shard (id % shards == shard)"""
+    if shards <= 1:
+        return queryset
+    return queryset.alias(shard_key=Mod('id', shards)).filter(shard_key=shard)
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from web3.exceptions import Web3RPCError
+
+logger = logging.getLogger(__name__)
+
+# Mensajes con los que los proveedores rechazan un rango de eth_getLogs demasiado grande
+RANGE_ERRORS = (
+    'query returned more than',
+    'block range',
+    'range is too large',
+    'range too large',
+    'response size',
+    'is limited to',
+)
+
+
+def range_rejected(error):
+    """True si el proveedor rechazó eth_getLogs por el tamaño del rango o de la respuesta"""
+    message = str(error).lower()
+    return any(fragment in message for fragment in RANGE_ERRORS)
+
+
+def covering_ranges(blocks, max_span):
+    """
+    Agrupa números de bloque en rangos [desde, hasta] de como mucho max_span
+    bloques, de forma que cada bloque quede en exactamente un rango.
+    """
+    ranges = []
+    for block in sorted(set(blocks)):
+        if ranges and block - ranges[-1][0] < max_span:
+            ranges[-1][1] = block
+        else:
+            ranges.append([block, block])
+    return [tuple(r) for r in ranges]
+
+
+class LogScanner:
+    """
+    Lee los logs de un evento por rangos de bloques en lugar de una llamada
+    por transacción. El tamaño de cada petición se adapta al proveedor: si
+    rechaza el rango (demasiados resultados o bloques) se parte por la mitad,
+    y tras cada respuesta correcta se vuelve a ampliar sin superar el mayor
+    tamaño que no ha sido rechazado.
+    """
+
+    def __init__(self, event, max_span=None, timeout=None):
+        self.event = event
+        self.max_span = max_span or settings.LOG_SCAN_MAX_BLOCKS
+        self.span = self.max_span
+        self.limit = self.max_span  # mayor rango que el proveedor no ha rechazado
+        self.timeout = timeout or settings.CHECKER_RPC_TIMEOUT
+        self.calls = 0
+
+    async def _get_logs(self, from_block, to_block, argument_filters):
+        self.calls += 1
+        return await asyncio.wait_for(
+            self.event.get_logs(from_block=from_block, to_block=to_block, argument_filters=argument_filters),
+            timeout=self.timeout,
+        )
+
+    async def scan(self, from_block, to_block, argument_filters=None):
+        """Todos los logs del evento entre from_block y to_block (incluidos)"""
+        logs = []
+        start = from_block
+        while start <= to_block:
+            end = min(start + self.span - 1, to_block)
+            try:
+                logs.extend(await self._get_logs(start, end, argument_filters))
+            except (Web3RPCError, ValueError, asyncio.TimeoutError) as e:
+                too_large = isinstance(e, asyncio.TimeoutError) or range_rejected(e)
+                if not too_large or end == start:
+                    raise
+                # El proveedor no acepta este tamaño: no se volverá a intentar en esta ejecución
+                self.limit = end - start
+                self.span = max(1, (end - start + 1) // 2)
+                logger.info(f"Rango {start}-{end} rechazado por el proveedor, se reduce a {self.span} bloques")
+                continue
+            start = end + 1
+            # Crecimiento gradual tras cada respuesta correcta
+            self.span = min(self.limit, self.span * 2)
+        return logs
+
+    async def scan_blocks(self, blocks, argument_filters=None):
+        """Logs de los rangos que cubren los bloques indicados"""
+        logs = []
+        for from_block, to_block in covering_ranges(blocks, self.max_span):
+            logs.extend(await self.scan(from_block, to_block, argument_filters))
+        return logs
+
+
+def group_by_transaction_id(logs):
+    """{transactionId: [eventos]} para casar eventos con transacciones en memoria"""
+    events = defaultdict(list)
+    for log in logs:
+        events[log['args']['transactionId']].append(log)
+    return events
@@ -0,0 +1,122 @@
+import base64
+import binascii
+import json
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+class PaginationError(Exception):
+    """Parámetros de paginación o filtros inválidos (respuesta 400)"""
+
+
+def encode_cursor(created_at, pk):
+    payload = json.dumps({'created_at': created_at.isoformat(), 'id': pk})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = parse_datetime(payload['created_at'])
+        pk = int(payload['id'])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise PaginationError("Cursor inválido")
+    if created_at is None:
+        raise PaginationError("Cursor inválido")
+    return created_at, pk
+
+
+def _parse_bound(value, end_of_day=False):
+    """Acepta fecha (YYYY-MM-DD) o fecha y hora ISO 8601"""
+    try:
+        moment = parse_datetime(value)
+        day = parse_date(value) if moment is None else None
+    except ValueError:
+        raise PaginationError(f"Fecha inválida: {value}")
+    if moment is None:
+        if day is None:
+            raise PaginationError(f"Fecha inválida: {value}")
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _page_size(value):
+    if value is None:
+        return settings.PAGINATION_PAGE_SIZE
+    try:
+        size = int(value)
+    except ValueError:
+        raise PaginationError("page_size debe ser un número entero")
+    if size < 1:
+        raise PaginationError("page_size debe ser mayor que 0")
+    return min(size, settings.PAGINATION_MAX_PAGE_SIZE)
+
+
+def filter_queryset(params, queryset, status_field='status'):
+    """
+    Filtros comunes de los listados: status (uno o varios separados por
+    comas), created_from y created_to (fecha o fecha y hora ISO 8601).
+
+    Raises:
+        PaginationError: Si alguna fecha es inválida
+    """
+    statuses = params.get('status')
+    if statuses and status_field:
+        queryset = queryset.filter(**{f'{status_field}__in': statuses.split(',')})
+    if params.get('created_from'):
+        queryset = queryset.filter(created_at__gte=_parse_bound(params['created_from']))
+    if params.get('created_to'):
+        queryset = queryset.filter(created_at__lte=_parse_bound(params['created_to'], end_of_day=True))
+    return queryset
+
+
+def seek(queryset, cursor=None):
+    """
+    queryset ordenado por (created_at, id) descendente y, con cursor
+    (created_at, id), solo las filas posteriores a él. Es el orden de los
+    índices (-created_at, -id) de Transaction y OrderItem, así que la
+    consulta lee el índice desde el cursor sin ordenar.
+    """
+    if cursor is not None:
+        created_at, pk = cursor
+        # created_at__lte es redundante pero deja usar el índice como rango
+        queryset = queryset.filter(created_at__lte=created_at).filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+        )
+    return queryset.order_by('-created_at', '-pk')
+
+
+def keyset_page(request, queryset, status_field='status'):
+    """
+    Una página de queryset ordenada por (created_at, id) descendente.
+
+    Parámetros de la query string: cursor, page_size, status (uno o varios
+    separados por comas), created_from y created_to. El cursor apunta a la
+    última fila devuelta, así que las filas nuevas no desplazan las páginas
+    siguientes como ocurriría con OFFSET.
+
+    Returns:
+        tuple: (filas de la página, {'next_cursor': str|None, 'has_more': bool})
+
+    Raises:
+        PaginationError: Si algún parámetro es inválido
+    """
+    params = request.query_params if hasattr(request, 'query_params') else request.GET
+    size = _page_size(params.get('page_size'))
+    queryset = filter_queryset(params, queryset, status_field)
+
+    cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+
+    # Una fila de más para saber si hay otra página sin hacer COUNT
+    rows = list(seek(queryset, cursor)[:size + 1])
+    has_more = len(rows) > size
+    rows = rows[:size]
+
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk) if has_more else None
+    return rows, {'next_cursor': next_cursor, 'has_more': has_more}
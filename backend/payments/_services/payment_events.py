@@ -0,0 +1,66 @@
+from collections import defaultdict
+
+from payments.models import PaymentEvent, WithdrawalEvent
+from payments._services.confirmations import to_hex
+
+# Filas por INSERT al guardar muchos eventos de golpe (relleno o índice)
+INSERT_BATCH_SIZE = 500
+
+
+def payment_event(log):
+    """PaymentEvent (sin guardar) a partir de un log PaymentReceived ya decodificado"""
+    args = log['args']
+    return PaymentEvent(
+        tx_hash=to_hex(log['transactionHash']),
+        log_index=log['logIndex'],
+        block_number=log['blockNumber'],
+        block_hash=to_hex(log['blockHash']),
+        transaction_id=args['transactionId'],
+        sender=args['sender'].lower(),
+        token=args['token'].lower(),
+        currency=args['currency'][:32],
+        amount=args['amount'],
+    )
+
+
+def record_payment_events(logs):
+    """
+    Guarda los eventos en INSERTs por lotes. Los que ya estaban (mismo hash y
+    índice de log) se ignoran, así que el listener, el relleno y el
+    verificador pueden guardar el mismo evento sin coordinarse.
+    """
+    events = [payment_event(log) for log in logs]
+    if events:
+        PaymentEvent.objects.bulk_create(events, batch_size=INSERT_BATCH_SIZE, ignore_conflicts=True)
+    return len(events)
+
+
+def withdrawal_event(log):
+    """WithdrawalEvent (sin guardar) a partir de un log Withdrawn ya decodificado"""
+    args = log['args']
+    return WithdrawalEvent(
+        tx_hash=to_hex(log['transactionHash']),
+        log_index=log['logIndex'],
+        block_number=log['blockNumber'],
+        block_hash=to_hex(log['blockHash']),
+        receiver=args['receiver'].lower(),
+        token=args['token'].lower(),
+        amount=args['amount'],
+    )
+
+
+def record_withdrawal_events(logs):
+    """Como record_payment_events, para los eventos Withdrawn"""
+    events = [withdrawal_event(log) for log in logs]
+    if events:
+        WithdrawalEvent.objects.bulk_create(events, batch_size=INSERT_BATCH_SIZE, ignore_conflicts=True)
+    return len(events)
+
+
+def stored_event_blocks(transaction_ids):
+    """{transactionId: {bloques}} de los eventos ya guardados, sin consultar la cadena"""
+    blocks = defaultdict(set)
+    rows = PaymentEvent.objects.filter(transaction_id__in=transaction_ids).values_list('transaction_id', 'block_number')
+    for transaction_id, block_number in rows:
+        blocks[int(transaction_id)].add(block_number)
+    return blocks
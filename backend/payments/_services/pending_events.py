@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections
+
+from payments.models import Transaction
+
+logger = logging.getLogger(__name__)
+
+# Canal de LISTEN/NOTIFY con el id de cada transacción guardada
+CHANNEL = 'payments_transaction_saved'
+# Estados con los que un evento en espera puede resolverse
+WAITED_STATUSES = ('pending', 'confirming')
+
+
+def announce_transaction(transaction_id):
+    """
+    Avisa a los listeners de que la transacción es visible. En PostgreSQL
+    NOTIFY es transaccional y solo se entrega al hacer commit. En otras bases
+    de datos no se avisa: el listener consulta los ids que espera (ver
+    TransactionNotifications.wait).
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, str(transaction_id)])
+
+
+class PendingEventBuffer:
+    """
+    Eventos PaymentReceived cuya transacción aún no es visible, por
+    transactionId. Cada evento caduca a los ttl segundos.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or settings.PENDING_EVENT_TTL
+        self._events = {}  # transactionId -> (caducidad, evento)
+
+    def __len__(self):
+        return len(self._events)
+
+    def __contains__(self, transaction_id):
+        return transaction_id in self._events
+
+    def ids(self):
+        return list(self._events)
+
+    def add(self, transaction_id, event):
+        self._events[transaction_id] = (time.monotonic() + self.ttl, event)
+
+    def get(self, transaction_id):
+        entry = self._events.get(transaction_id)
+        return entry[1] if entry else None
+
+    def discard(self, transaction_id):
+        self._events.pop(transaction_id, None)
+
+    def oldest_block(self):
+        """Bloque del evento en espera más antiguo, o None si no hay ninguno"""
+        return min((event['blockNumber'] for _, event in self._events.values()), default=None)
+
+    def pop_expired(self):
+        now = time.monotonic()
+        expired = [tx_id for tx_id, (deadline, _) in self._events.items() if deadline <= now]
+        return [(tx_id, self._events.pop(tx_id)[1]) for tx_id in expired]
+
+
+class TransactionNotifications:
+    """
+    Ids de transacciones recién guardadas. En PostgreSQL se escucha el canal
+    con una conexión propia en autocommit y el bucle de eventos la lee cuando
+    tiene datos (loop.add_reader), sin consultas periódicas.
+
+    En otras bases de datos cada espera termina con una consulta por clave
+    primaria de los ids que se están esperando. Un aviso por caché solo
+    llegaría al listener con una caché compartida entre procesos (Redis,
+    Memcached); con LocMemCache, la de desarrollo, cada proceso tiene la suya.
+    """
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self._connection = None
+
+    async def start(self):
+        if connection.vendor != 'postgresql':
+            return
+        self._connection = await sync_to_async(self._listen, thread_sensitive=False)()
+        asyncio.get_running_loop().add_reader(self._connection.fileno(), self._read)
+        logger.info(f"Escuchando el canal {CHANNEL}")
+
+    def _listen(self):
+        wrapper = connections.create_connection('default')
+        raw = wrapper.get_new_connection(wrapper.get_connection_params())
+        raw.autocommit = True
+        with raw.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return raw
+
+    def _read(self):
+        self._connection.poll()
+        while self._connection.notifies:
+            notify = self._connection.notifies.pop(0)
+            self.queue.put_nowait(int(notify.payload))
+
+    async def stop(self):
+        if self._connection is not None:
+            asyncio.get_running_loop().remove_reader(self._connection.fileno())
+            self._connection.close()
+            self._connection = None
+
+    async def catch_up(self, waiting_ids):
+        """
+        Vuelve a avisar de los ids recién puestos en espera que ya son
+        visibles. Su transacción pudo guardarse después de que el consumidor
+        la buscara y antes de que el evento entrara en el buffer: el NOTIFY
+        llegó sin nadie esperándolo. Se llama con los eventos ya en el buffer,
+        así que lo que se guarde después de esta consulta sí lo encuentra.
+        """
+        if self._connection is None:
+            # Sin PostgreSQL cada espera consulta los ids del buffer
+            return
+        for transaction_id in await sync_to_async(self._visible)(waiting_ids):
+            self.queue.put_nowait(transaction_id)
+
+    async def wait(self, waiting_ids, timeout):
+        """Ids guardados en los próximos timeout segundos (sin PostgreSQL, los esperados que ya existen)"""
+        if self._connection is not None:
+            try:
+                saved = [await asyncio.wait_for(self.queue.get(), timeout)]
+            except asyncio.TimeoutError:
+                return []
+            while not self.queue.empty():
+                saved.append(self.queue.get_nowait())
+            return saved
+
+        await asyncio.sleep(timeout)
+        if not waiting_ids:
+            return []
+        return await sync_to_async(self._visible)(waiting_ids)
+
+    def _visible(self, waiting_ids):
+        return list(
+            Transaction.objects.filter(id__in=waiting_ids, status__in=WAITED_STATUSES).values_list('id', flat=True)
+        )
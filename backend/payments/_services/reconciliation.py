@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import BigIntegerField, Case, DecimalField, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from payments.models import PaymentEvent, Transaction
+
+# Filas leídas por viaje a la base de datos
+READ_CHUNK_SIZE = 50000
+# Tolerancia relativa al comparar importes: se comparan como float64
+AMOUNT_RTOL = 1e-9
+# Un transactionId mayor no cabe en un id de Transaction y no puede tener fila:
+# se lee como OUT_OF_RANGE_ID y cada uno de esos eventos es huérfano por sí mismo
+MAX_TRANSACTION_ID = 2 ** 63 - 1
+OUT_OF_RANGE_ID = -1
+
+FLAGS = ['amount_mismatch', 'sender_mismatch', 'missing_event', 'orphan_event']
+
+
+def _frame(queryset, columns, dtypes):
+    rows = queryset.values_list(*columns).iterator(chunk_size=READ_CHUNK_SIZE)
+    # Tipos fijos para que el cruce funcione también con tablas vacías
+    return pd.DataFrame.from_records(rows, columns=columns).astype(dtypes)
+
+
+def load_transactions():
+    """Transacciones como DataFrame. El importe se convierte a float en la consulta, no fila a fila en Python"""
+    queryset = Transaction.objects.annotate(
+        transaction_id=F('id'),
+        amount_float=Cast('amount', FloatField()),
+    )
+    frame = _frame(
+        queryset,
+        ['transaction_id', 'transaction_hash', 'wallet_address', 'token', 'amount_float', 'status'],
+        {'transaction_id': 'int64', 'amount_float': 'float64'},
+    )
+    return frame.rename(columns={'amount_float': 'amount'})
+
+
+def load_payment_events():
+    """Eventos PaymentReceived indexados como DataFrame, con el importe aún en la unidad mínima del token"""
+    queryset = PaymentEvent.objects.annotate(
+        event_transaction_id=Cast(
+            Case(
+                When(transaction_id__gt=MAX_TRANSACTION_ID, then=Value(OUT_OF_RANGE_ID)),
+                default=F('transaction_id'),
+                output_field=DecimalField(max_digits=78, decimal_places=0),
+            ),
+            BigIntegerField(),
+        ),
+        raw_amount=Cast('amount', FloatField()),
+    )
+    frame = _frame(
+        queryset,
+        ['event_transaction_id', 'tx_hash', 'log_index', 'block_number', 'sender', 'currency', 'raw_amount'],
+        {'event_transaction_id': 'int64', 'log_index': 'int64', 'block_number': 'int64', 'raw_amount': 'float64'},
+    )
+    return frame.rename(columns={'event_transaction_id': 'transaction_id'})
+
+
+def reconcile(transactions, events, decimals=None):
+    """
+    Cruza transacciones y eventos por transactionId y marca las diferencias
+    con operaciones sobre columnas completas.
+
+    Si un transactionId se pagó más de una vez se compara el primer evento
+    (por bloque) y el resto se cuenta como duplicado. Los transactionId fuera
+    de rango comparten OUT_OF_RANGE_ID pero no son el mismo pago: no cuentan
+    como duplicados y cada uno queda como huérfano.
+
+    Returns:
+        tuple: (DataFrame con una fila por transactionId y una columna booleana
+        por cada FLAGS, número de eventos duplicados)
+    """
+    decimals = decimals or settings.TOKEN_DECIMALS
+    events = events.sort_values(['block_number', 'log_index'], kind='stable')
+    duplicated = events.duplicated('transaction_id', keep='first') & (events['transaction_id'] != OUT_OF_RANGE_ID)
+    events = events[~duplicated]
+
+    merged = transactions.merge(events, on='transaction_id', how='outer', indicator=True)
+    has_row = merged['_merge'] != 'right_only'
+    has_event = merged['_merge'] != 'left_only'
+    matched = has_row & has_event
+
+    # Importe del evento en unidades del token; un token sin decimales conocidos da NaN y no coincide
+    scale = merged['currency'].str.upper().map(decimals)
+    received = merged['raw_amount'] / np.power(10.0, scale)
+    same_token = merged['currency'].str.upper() == merged['token'].str.upper()
+    same_amount = np.isclose(received, merged['amount'], rtol=AMOUNT_RTOL, atol=0)
+
+    merged['amount_mismatch'] = matched & ~(same_token & same_amount)
+    merged['sender_mismatch'] = matched & (merged['sender'] != merged['wallet_address'].str.lower())
+    merged['missing_event'] = has_row & ~has_event & (merged['status'] == 'confirmed')
+    merged['orphan_event'] = has_event & ~has_row
+    merged['received'] = received
+    return merged.drop(columns='_merge'), int(duplicated.sum())
+
+
+def summarize(report, duplicated=0):
+    """Recuento de cada diferencia"""
+    summary = {flag: int(report[flag].sum()) for flag in FLAGS}
+    summary['duplicate_events'] = duplicated
+    summary['transactions'] = int(report['status'].notna().sum())
+    summary['events'] = int(report['tx_hash'].notna().sum()) + duplicated
+    return summary
+
+
+def discrepancies(report):
+    """Solo las filas con alguna diferencia, con las columnas útiles para revisarlas"""
+    columns = [
+        'transaction_id', 'status', 'transaction_hash', 'wallet_address', 'token', 'amount',
+        'tx_hash', 'block_number', 'sender', 'currency', 'received', *FLAGS,
+    ]
+    return report.loc[report[FLAGS].any(axis=1), columns]
@@ -0,0 +1,214 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from web3 import AsyncHTTPProvider, AsyncWeb3, HTTPProvider, Web3
+
+from .circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+class Web3ProviderNotConfigured(Exception):
+    """WEB3_PROVIDER no está definido en settings"""
+    pass
+
+
+provider_breaker = CircuitBreaker(
+    'web3_provider',
+    failure_rate=settings.WEB3_CIRCUIT_FAILURE_RATE,
+    min_calls=settings.WEB3_CIRCUIT_MIN_CALLS,
+    window=settings.WEB3_CIRCUIT_WINDOW,
+    slow_call_seconds=settings.WEB3_CIRCUIT_SLOW_CALL,
+    open_seconds=settings.WEB3_CIRCUIT_OPEN_SECONDS,
+)
+
+
+class GuardedHTTPProvider(HTTPProvider):
+    """
+    HTTPProvider cuyas peticiones pasan por el circuit breaker del proveedor.
+
+    Sin los reintentos internos de web3 (hasta 5 con backoff): todos correrían
+    dentro de una sola llamada protegida, así que un proveedor colgado
+    bloquearía el worker varias veces el timeout y contaría como un único fallo.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs['exception_retry_configuration'] = None
+        super().__init__(*args, **kwargs)
+
+    def make_request(self, method, params):
+        return provider_breaker.call(super().make_request, method, params)
+
+    def make_batch_request(self, requests):
+        return provider_breaker.call(super().make_batch_request, requests)
+
+
+class GuardedAsyncHTTPProvider(AsyncHTTPProvider):
+    """AsyncHTTPProvider cuyas peticiones HTTP pasan por el mismo circuit breaker, también sin reintentos internos"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs['exception_retry_configuration'] = None
+        super().__init__(*args, **kwargs)
+
+    async def _make_request(self, method, request_data):
+        return await provider_breaker.acall(super()._make_request, method, request_data)
+
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+_async_client = None
+_async_client_pid = None
+_health = {'healthy': False, 'checked_at': 0.0}
+
+
+def _build_session():
+    """Sesión HTTP keep-alive con un pool de conexiones reutilizables hacia el proveedor"""
+    pool_size = settings.WEB3_HTTP_POOL_SIZE
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_web3():
+    """
+    Devuelve el cliente Web3 compartido por el proceso.
+
+    Se crea una única vez por worker con un pool de conexiones persistente,
+    así cada petición evita el handshake TCP/TLS con el proveedor. Si el
+    proceso se ha bifurcado (gunicorn --preload) se crea uno nuevo para no
+    compartir sockets entre procesos.
+
+    Raises:
+        Web3ProviderNotConfigured: Si WEB3_PROVIDER no está configurado
+    """
+    global _client, _client_pid
+
+    provider_url = getattr(settings, 'WEB3_PROVIDER', None)
+    if not provider_url:
+        raise Web3ProviderNotConfigured("WEB3_PROVIDER no está configurado")
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                _client = Web3(GuardedHTTPProvider(
+                    provider_url,
+                    request_kwargs={'timeout': settings.WEB3_PROVIDER_TIMEOUT},
+                    session=_build_session(),
+                ))
+                _client_pid = pid
+                _health.update(healthy=False, checked_at=0.0)
+                logger.info(f"Cliente Web3 compartido creado para el proceso {pid}")
+    return _client
+
+
+def get_async_web3():
+    """
+    Cliente AsyncWeb3 compartido por el proceso (vistas ASGI).
+
+    AsyncHTTPProvider mantiene una sesión aiohttp keep-alive por event loop,
+    así que con uvicorn hay un único pool de conexiones por worker.
+
+    Raises:
+        Web3ProviderNotConfigured: Si WEB3_PROVIDER no está configurado
+    """
+    global _async_client, _async_client_pid
+
+    provider_url = getattr(settings, 'WEB3_PROVIDER', None)
+    if not provider_url:
+        raise Web3ProviderNotConfigured("WEB3_PROVIDER no está configurado")
+
+    pid = os.getpid()
+    if _async_client is None or _async_client_pid != pid:
+        with _lock:
+            if _async_client is None or _async_client_pid != pid:
+                _async_client = AsyncWeb3(GuardedAsyncHTTPProvider(
+                    provider_url,
+                    request_kwargs={'timeout': settings.WEB3_PROVIDER_TIMEOUT},
+                ))
+                _async_client_pid = pid
+    return _async_client
+
+
+def _health_is_fresh():
+    ttl = settings.WEB3_HEALTH_TTL if _health['healthy'] else settings.WEB3_UNHEALTHY_TTL
+    return time.monotonic() - _health['checked_at'] < ttl
+
+
+def _set_health(healthy):
+    _health.update(healthy=healthy, checked_at=time.monotonic())
+    if not healthy:
+        logger.warning("El proveedor Web3 no responde")
+
+
+def provider_is_healthy(force=False):
+    """
+    Estado del proveedor con caché en memoria del worker.
+
+    La comprobación real (is_connected) solo se repite cuando el resultado ha
+    caducado: WEB3_HEALTH_TTL segundos si el proveedor respondía, y un
+    intervalo más corto si no, para detectar pronto que ha vuelto. Con el
+    circuito abierto se responde False sin contactar con el proveedor.
+    """
+    try:
+        web3 = get_web3()
+    except Web3ProviderNotConfigured:
+        return False
+
+    if provider_breaker.is_open():
+        return False
+
+    if not force and _health_is_fresh():
+        return _health['healthy']
+
+    try:
+        healthy = web3.is_connected()
+    except Exception as e:
+        logger.warning(f"Error comprobando el proveedor Web3: {e}")
+        healthy = False
+
+    _set_health(healthy)
+    return healthy
+
+
+async def aprovider_is_healthy(force=False):
+    """Versión asíncrona de provider_is_healthy, comparte el mismo estado cacheado"""
+    try:
+        web3 = get_async_web3()
+    except Web3ProviderNotConfigured:
+        return False
+
+    if await sync_to_async(provider_breaker.is_open, thread_sensitive=False)():
+        return False
+
+    if not force and _health_is_fresh():
+        return _health['healthy']
+
+    try:
+        healthy = await web3.is_connected()
+    except Exception as e:
+        logger.warning(f"Error comprobando el proveedor Web3: {e}")
+        healthy = False
+
+    _set_health(healthy)
+    return healthy
+
+
+def reset_web3_client():
+    """Descarta el cliente compartido (cambio de configuración, benchmarks)"""
+    global _client, _client_pid, _async_client, _async_client_pid
+    with _lock:
+        _client = None
+        _client_pid = None
+        _async_client = None
+        _async_client_pid = None
+        _health.update(healthy=False, checked_at=0.0)
@@ -0,0 +1,104 @@
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from payments._services.confirmations import to_hex
+
+# Eventos y cabeceras recientes que se recuerdan para descartar duplicados
+SEEN_EVENTS = 10000
+RECENT_HEADS = 256
+
+
+class Endpoint:
+    """Un proveedor WebSocket del listener y lo que se ha medido de él"""
+
+    def __init__(self, url):
+        self.url = url
+        # Solo el host en los logs: la ruta suele llevar la clave de API
+        self.name = urlsplit(url).hostname or url
+        self.w3 = None
+        self.session = None  # tarea con la conexión actual
+        self.failures = 0
+        self.head = None
+        self.delays = []  # segundos de retraso frente al primero que anunció cada cabecera
+        self.first = 0  # eventos que llegaron por este endpoint antes que por ningún otro
+
+
+class EndpointPool:
+    """
+    Varios endpoints suscritos a la vez. Cada evento y cada cabecera se
+    procesa solo la primera vez que llega, por el endpoint más rápido, y los
+    endpoints que se quedan más de max_lag bloques por detrás se señalan
+    para desconectarlos.
+    """
+
+    def __init__(self, urls, max_lag=None):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.max_lag = settings.WEB3_WS_MAX_LAG if max_lag is None else max_lag
+        self.best = None  # cabecera más alta vista por cualquier endpoint
+        self._heads = OrderedDict()  # número -> (hash, instante de la primera llegada)
+        self._seen = OrderedDict()
+
+    def connected(self, endpoint, w3, head):
+        endpoint.w3 = w3
+        endpoint.head = head
+        self.best = head if self.best is None else max(self.best, head)
+
+    def disconnected(self, endpoint):
+        endpoint.w3 = None
+        endpoint.head = None
+
+    def first_event(self, endpoint, log):
+        """True si es la primera vez que llega este log (hash de transacción, índice de log)"""
+        key = (to_hex(log['transactionHash']), log['logIndex'])
+        if key in self._seen:
+            return False
+        self._seen[key] = None
+        if len(self._seen) > SEEN_EVENTS:
+            self._seen.popitem(last=False)
+        endpoint.first += 1
+        return True
+
+    def first_head(self, endpoint, header):
+        """Registra la cabecera recibida por el endpoint; True si nadie la había anunciado antes"""
+        number, block_hash = header['number'], to_hex(header['hash'])
+        now = time.monotonic()
+        endpoint.head = number if endpoint.head is None else max(endpoint.head, number)
+
+        known = self._heads.get(number)
+        if known and known[0] == block_hash:
+            endpoint.delays.append(now - known[1])
+            return False
+        self._heads[number] = (block_hash, now)
+        if len(self._heads) > RECENT_HEADS:
+            self._heads.popitem(last=False)
+        self.best = number if self.best is None else max(self.best, number)
+        return True
+
+    def laggards(self):
+        """Endpoints conectados que van más de max_lag bloques por detrás del mejor"""
+        return [
+            endpoint for endpoint in self.endpoints
+            if endpoint.w3 is not None and endpoint.head is not None and self.best - endpoint.head > self.max_lag
+        ]
+
+    def report(self):
+        """Una línea por endpoint con su retraso desde el último informe"""
+        lines = []
+        for endpoint in self.endpoints:
+            if endpoint.w3 is None:
+                lines.append(f"{endpoint.name}: desconectado")
+                continue
+            delay = ''
+            if endpoint.delays:
+                ordered = sorted(endpoint.delays)
+                delay = f", p50 {ordered[len(ordered) // 2] * 1000:.0f} ms tras el más rápido"
+            lines.append(
+                f"{endpoint.name}: {self.best - endpoint.head} bloques por detrás{delay}, "
+                f"{endpoint.first} eventos recibidos primero"
+            )
+            endpoint.delays = []
+            endpoint.first = 0
+        return lines
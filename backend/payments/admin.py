@@ -1,6 +1,21 @@
 from django.contrib import admin
 
-from .models import OrderItem, Transaction
+from .models import (
+    IdempotencyKey,
+    ListenerCheckpoint,
+    ListenerLease,
+    OrderItem,
+    PaymentEvent,
+    StockReservation,
+    Transaction,
+    WithdrawalEvent,
+)
 
 admin.site.register(Transaction)
-admin.site.register(OrderItem)
\ No newline at end of file
+admin.site.register(OrderItem)
+admin.site.register(StockReservation)
+admin.site.register(IdempotencyKey)
+admin.site.register(ListenerCheckpoint)
+admin.site.register(ListenerLease)
+admin.site.register(PaymentEvent)
+admin.site.register(WithdrawalEvent)
@@ -0,0 +1,198 @@
+# Versiones async nativas de los endpoints ligados a la blockchain, para el perfil ASGI (uvicorn).
+# Mismos contratos de entrada/salida que las vistas DRF de views.py.
+import asyncio
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
+
+from users.decorators import async_jwt_required
+from users.models import UserProfile
+from .decorators import aidempotent
+from .models import Transaction
+from .serializers import TransactionSerializer
+from ._services.chain_cache import aget_receipt, aget_transaction
+from ._services.checkout import CheckoutError, create_pending_transaction
+from ._services.circuit_breaker import CircuitOpenError
+from ._services.web3_client import aprovider_is_healthy, get_async_web3, provider_breaker
+
+logger = logging.getLogger(__name__)
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except json.JSONDecodeError:
+        return None
+
+
+def provider_unavailable(retry_after=None):
+    """Respuesta inmediata mientras el circuito del proveedor Ethereum está abierto"""
+    response = JsonResponse(
+        {"success": False, "message": "Proveedor Ethereum no disponible temporalmente"},
+        status=503
+    )
+    response['Retry-After'] = str(retry_after or settings.WEB3_CIRCUIT_OPEN_SECONDS)
+    return response
+
+
+async def _check_provider():
+    """None si el proveedor está disponible; si no, la respuesta de error a devolver"""
+    if not getattr(settings, 'WEB3_PROVIDER', None):
+        return JsonResponse({"success": False, "message": "Servicio WEB3_PROVIDER sin servicio"}, status=500)
+
+    if await sync_to_async(provider_breaker.is_open, thread_sensitive=False)():
+        return provider_unavailable()
+
+    if not await aprovider_is_healthy():
+        return JsonResponse({"success": False, "message": "No se pudo conectar a la red Ethereum"}, status=500)
+    return None
+
+
+@csrf_exempt
+@require_POST
+@async_jwt_required
+@aidempotent('register_transaction')
+async def register_transaction(request):
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({"success": False, "message": "JSON inválido"}, status=400)
+
+    wallet_address = data.get("wallet_address")
+    amount = data.get("amount")
+    token = data.get("token")
+    cart_items_data = data.get("cart_items", [])
+
+    if not all([wallet_address, amount, token]):
+        return JsonResponse({"success": False, "message": "Faltan campos necesarios"}, status=400)
+
+    if not cart_items_data:
+        return JsonResponse({"success": False, "message": "El carrito está vacío"}, status=400)
+
+    try:
+        amount = Decimal(amount)
+    except (TypeError, InvalidOperation):
+        return JsonResponse({"success": False, "message": "El campo 'amount' es inválido"}, status=400)
+
+    error = await _check_provider()
+    if error:
+        return error
+
+    transaction_hash = wallet_address
+
+    if await Transaction.objects.filter(transaction_hash=transaction_hash, status='pending').aexists():
+        return JsonResponse({"success": False, "message": "Hay una transacción pendiente para esta wallet."}, status=409)
+
+    if not await UserProfile.objects.filter(wallet_address=wallet_address).aexists():
+        return JsonResponse({"success": False, "message": "Usuario no encontrado"}, status=404)
+
+    # El checkout necesita transacción y bloqueos de fila: se ejecuta en el hilo del ORM
+    try:
+        tx, items_count = await sync_to_async(create_pending_transaction)(
+            wallet_address=wallet_address,
+            amount=amount,
+            token=token,
+            cart_items=cart_items_data,
+            transaction_hash=transaction_hash,
+        )
+    except CheckoutError as e:
+        return JsonResponse({"success": False, "message": e.message}, status=e.status)
+
+    return JsonResponse({
+        "success": True,
+        "message": "Transacción registrada exitosamente",
+        "transaction_id": tx.id,
+        "hash_placeholder": transaction_hash,
+        "items_count": items_count
+    })
+
+
+@csrf_exempt
+@require_http_methods(["PUT"])
+@async_jwt_required
+@aidempotent('update_transaction')
+async def update_transaction(request, transaction_id):
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({"success": False, "message": "JSON inválido"}, status=400)
+
+    wallet_address = data.get("wallet_address")
+    amount = data.get("amount")
+    transaction_hash = data.get("transaction_hash")
+    token = data.get("token")
+
+    if not all([transaction_id, wallet_address, amount, transaction_hash, token]):
+        return JsonResponse({"success": False, "message": "Faltan campos necesarios"}, status=400)
+
+    try:
+        amount = Decimal(amount)
+    except (TypeError, InvalidOperation):
+        return JsonResponse({"success": False, "message": "El campo 'amount' es inválido"}, status=400)
+
+    error = await _check_provider()
+    if error:
+        return error
+
+    # Recibo y transacción se piden a la vez en lugar de uno tras otro
+    web3 = get_async_web3()
+    tx_receipt, tx_data = await asyncio.gather(
+        aget_receipt(web3, transaction_hash),
+        aget_transaction(web3, transaction_hash),
+        return_exceptions=True,
+    )
+
+    for result in (tx_receipt, tx_data):
+        if isinstance(result, CircuitOpenError):
+            return provider_unavailable(result.retry_after)
+
+    if isinstance(tx_receipt, Exception):
+        return JsonResponse({"success": False, "message": "Transacción no encontrada"}, status=404)
+
+    if tx_receipt is None or tx_receipt.status != 1:
+        return JsonResponse({"success": False, "message": "Transacción fallida o no confirmada"}, status=400)
+
+    if isinstance(tx_data, Exception):
+        return JsonResponse({"success": False, "message": "No se pudo verificar el remitente de la transacción"}, status=500)
+
+    if tx_data['from'].lower() != wallet_address.lower():
+        return JsonResponse({"success": False, "message": "La dirección no coincide con el remitente"}, status=400)
+
+    try:
+        tx = await Transaction.objects.aget(id=transaction_id)
+    except Transaction.DoesNotExist:
+        return JsonResponse({"success": False, "message": "Transacción no encontrada"}, status=404)
+
+    if await Transaction.objects.exclude(id=tx.id).filter(transaction_hash=transaction_hash).aexists():
+        return JsonResponse({"success": False, "message": "El hash ya está registrado en otra transacción"}, status=409)
+
+    # Actualizar campos básicos de la transacción
+    tx.wallet_address = wallet_address
+    tx.amount = amount
+    tx.transaction_hash = transaction_hash
+    tx.token = token
+    await tx.asave()
+
+    return JsonResponse({
+        "success": True,
+        "message": "Transacción actualizada exitosamente",
+        "hash": transaction_hash,
+        "transaction_id": tx.id,
+    })
+
+
+@require_GET
+async def get_transaction_detail(request, tx_hash):
+    try:
+        transaction = await Transaction.objects.prefetch_related(
+            'order_items__product'
+        ).aget(transaction_hash=tx_hash)
+    except Transaction.DoesNotExist:
+        return JsonResponse({'success': False, 'error': f'Transacción con hash {tx_hash} no encontrada'}, status=404)
+
+    serializer = TransactionSerializer(transaction)
+    return JsonResponse({'success': True, 'data': serializer.data})
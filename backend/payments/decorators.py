@@ -0,0 +1,98 @@
+# Decoradores para reintentos seguros de los endpoints de pago con la cabecera Idempotency-Key.
+# Si la cabecera no viene, la vista se ejecuta igual que siempre.
+
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.response import Response
+
+from ._services import idempotency
+
+ERRORS = {
+    idempotency.MISMATCH: (422, "La Idempotency-Key ya se usó con otra petición"),
+    idempotency.IN_PROGRESS: (409, "La petición original con esta Idempotency-Key aún se está procesando"),
+}
+
+
+def _read_key(request):
+    key = request.META.get(idempotency.HEADER)
+    if key is not None and (not key.strip() or len(key) > idempotency.MAX_KEY_LENGTH):
+        return None, True
+    return key, False
+
+
+def idempotent(scope):
+    """
+    Para vistas DRF (debajo de @api_view): un reintento con la misma clave y
+    el mismo cuerpo devuelve la respuesta original sin volver a ejecutar la vista.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            key, invalid = _read_key(request)
+            if invalid:
+                return Response({"success": False, "message": "Idempotency-Key inválida"}, status=400)
+            if key is None:
+                return view_func(request, *args, **kwargs)
+
+            request_fingerprint = idempotency.fingerprint(request.method, request.path, request.data)
+            outcome, record = idempotency.claim(scope, str(request.user.pk), key, request_fingerprint)
+
+            if outcome == idempotency.REPLAY:
+                return Response(record.response_body, status=record.response_status,
+                                headers={'Idempotent-Replayed': 'true'})
+            if outcome in ERRORS:
+                status, message = ERRORS[outcome]
+                return Response({"success": False, "message": message}, status=status)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                idempotency.release(record)
+                raise
+            idempotency.complete(record, response.status_code, response.data)
+            return response
+        return _wrapped_view
+    return decorator
+
+
+def aidempotent(scope):
+    """Equivalente de idempotent para las vistas async (debajo de async_jwt_required)"""
+    def decorator(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            key, invalid = _read_key(request)
+            if invalid:
+                return JsonResponse({"success": False, "message": "Idempotency-Key inválida"}, status=400)
+            if key is None:
+                return await view_func(request, *args, **kwargs)
+
+            try:
+                body = json.loads(request.body or b'{}')
+            except ValueError:
+                body = request.body.decode(errors='replace')
+            request_fingerprint = idempotency.fingerprint(request.method, request.path, body)
+            outcome, record = await sync_to_async(idempotency.claim)(
+                scope, str(request.user.pk), key, request_fingerprint
+            )
+
+            if outcome == idempotency.REPLAY:
+                response = JsonResponse(record.response_body, status=record.response_status, safe=False)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+            if outcome in ERRORS:
+                status, message = ERRORS[outcome]
+                return JsonResponse({"success": False, "message": message}, status=status)
+
+            try:
+                response = await view_func(request, *args, **kwargs)
+            except Exception:
+                await sync_to_async(idempotency.release)(record)
+                raise
+            body = json.loads(response.content or b'null')
+            await sync_to_async(idempotency.complete)(record, response.status_code, body)
+            return response
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,47 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments._services.invoices import render_invoice_bytes, warm_up
+
+SIZES = (1, 10, 100)
+
+
+def sample_snapshot(items):
+    return {
+        'id': 1234,
+        'created_at': '2025-01-31 12:00:00',
+        'wallet_address': '0x' + '1f' * 20,
+        'amount': '0.0123456789',
+        'token': 'USDT',
+        'transaction_hash': '0x' + 'ab' * 32,
+        'status': 'confirmed',
+        'items': [
+            {'name': f'Producto de prueba {n}', 'quantity': n % 5 + 1, 'price_at_sale': '19.99'}
+            for n in range(items)
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Mide las facturas por segundo que renderiza un proceso con 1, 10 y 100 líneas de pedido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duración de cada medición')
+
+    def handle(self, *args, **options):
+        warm_up()
+        for items in SIZES:
+            snapshot = sample_snapshot(items)
+            timings = []
+            deadline = time.perf_counter() + options['seconds']
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                pdf = render_invoice_bytes(snapshot)
+                timings.append(time.perf_counter() - start)
+
+            self.stdout.write(
+                f"{items:>3} líneas: {len(timings) / sum(timings):7.1f} facturas/s | "
+                f"p50 {statistics.median(timings) * 1000:6.2f} ms | {len(pdf) / 1024:.1f} KB"
+            )
@@ -0,0 +1,194 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from company.models import Product
+from payments.models import OrderItem, Transaction
+from payments._services.pagination import seek
+
+BATCH_SIZE = 10_000
+STATUSES = ['confirmed'] * 80 + ['failed'] * 10 + ['pending'] * 7 + ['confirming'] * 3
+
+
+@contextmanager
+def manual_created_at(*models):
+    """Permite fijar created_at en bulk_create (auto_now_add lo sobrescribiría)"""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Siembra transacciones en una base de datos de pruebas desechable y muestra '
+        'el plan (EXPLAIN) y el tiempo de las consultas de los endpoints más usados'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Transacciones a sembrar')
+        parser.add_argument('--wallets', type=int, default=20_000, help='Wallets distintas')
+        parser.add_argument('--repeat', type=int, default=20, help='Ejecuciones por consulta')
+        parser.add_argument('--compare', action='store_true',
+                            help='Repite las mediciones sin los índices de Transaction y OrderItem')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Conserva la base de datos de pruebas (y sus filas) entre ejecuciones')
+
+    def handle(self, *args, **options):
+        # Nunca se siembra la base de datos real: se crea la de pruebas como hace el test runner
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not Transaction.objects.exists():
+                self.seed(options['rows'], options['wallets'])
+            self.wallet = Transaction.objects.values_list('wallet_address', flat=True).first()
+            self.cursors = {
+                'transactions': self.cursor_at(Transaction.objects.all()),
+                'wallet': self.cursor_at(Transaction.objects.filter(wallet_address=self.wallet)),
+                'orders': self.cursor_at(OrderItem.objects.all()),
+            }
+
+            results = self.run_queries(options['repeat'])
+            if options['compare']:
+                with self.without_indexes():
+                    baseline = self.run_queries(options['repeat'], explain=False)
+                self.stdout.write('')
+                for name, median in results.items():
+                    self.stdout.write(
+                        f"{name}: {baseline[name]:.2f} ms sin índices -> {median:.2f} ms con índices "
+                        f"(x{baseline[name] / median:.1f})"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def seed(self, rows, wallets):
+        self.stdout.write(f"Sembrando {rows} transacciones y sus líneas de pedido...")
+        start = time.perf_counter()
+        now = timezone.now()
+        rng = random.Random(42)
+        products = Product.objects.bulk_create([
+            Product(name=f'Producto {i}', amount_usd=Decimal('10.00'), stock_quantity=1_000_000)
+            for i in range(50)
+        ])
+        wallet_addresses = ['0x' + f'{n:040x}' for n in range(1, wallets + 1)]
+
+        with manual_created_at(Transaction, OrderItem):
+            for offset in range(0, rows, BATCH_SIZE):
+                batch = []
+                for n in range(offset, min(offset + BATCH_SIZE, rows)):
+                    batch.append(Transaction(
+                        transaction_hash='0x' + f'{n:064x}',
+                        wallet_address=rng.choice(wallet_addresses),
+                        token='USDT',
+                        amount=Decimal('10'),
+                        amount_usd=Decimal('10.00'),
+                        status=rng.choice(STATUSES),
+                        created_at=now - timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+                    ))
+                transactions = Transaction.objects.bulk_create(batch)
+                if transactions[0].pk is None:
+                    # Backends sin RETURNING: se recuperan los ids por hash
+                    ids = dict(Transaction.objects.filter(
+                        transaction_hash__in=[tx.transaction_hash for tx in transactions]
+                    ).values_list('transaction_hash', 'id'))
+                    for tx in transactions:
+                        tx.pk = ids[tx.transaction_hash]
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        transaction=tx,
+                        product=rng.choice(products),
+                        quantity=1,
+                        price_at_sale=Decimal('10.00'),
+                        created_at=tx.created_at,
+                    )
+                    for tx in transactions
+                ])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f"Siembra completada en {time.perf_counter() - start:.1f}s")
+
+    def cursor_at(self, queryset):
+        """Cursor de la fila central: la página siguiente se pide desde la mitad de la tabla"""
+        rows = seek(queryset).values_list('created_at', 'pk')
+        return rows[rows.count() // 2]
+
+    def queries(self):
+        """Consultas equivalentes a las de los endpoints, por nombre"""
+        now = timezone.now()
+        wallet = self.wallet
+        return {
+            'check_pending_transactions': lambda: Transaction.objects.filter(
+                wallet_address=wallet, status__in=['pending', 'confirming']
+            ).order_by('-created_at'),
+            'get_transactions_by_wallet': lambda: seek(Transaction.objects.filter(wallet_address=wallet))[:50],
+            'get_transactions_by_wallet (página siguiente)': lambda: seek(
+                Transaction.objects.filter(wallet_address=wallet), self.cursors['wallet']
+            )[:50],
+            'checker (pendientes expiradas)': lambda: Transaction.objects.filter(
+                status='pending', created_at__lte=now - timedelta(minutes=1)
+            ),
+            'dashboard (tendencia 7 días)': lambda: Transaction.objects.filter(
+                status='confirmed', created_at__gte=now - timedelta(days=7)
+            ).annotate(day=TruncDay('created_at')).values('day').annotate(
+                daily_amount=Sum('amount_usd'), transaction_count=Count('id')
+            ).order_by('day'),
+            'users summary (por wallet)': lambda: Transaction.objects.filter(
+                wallet_address=wallet
+            ).values('wallet_address').annotate(
+                confirmed=Count('id', filter=Q(status='confirmed')),
+                total_spent=Sum('amount', filter=Q(status='confirmed')),
+                last=Max('created_at'),
+            ),
+            'get_all_transactions': lambda: seek(Transaction.objects.all())[:50],
+            'get_all_transactions (página siguiente)': lambda: seek(
+                Transaction.objects.all(), self.cursors['transactions']
+            )[:50],
+            'get_all_orders': lambda: seek(OrderItem.objects.select_related('product', 'transaction'))[:50],
+            'get_all_orders (página siguiente)': lambda: seek(
+                OrderItem.objects.select_related('product', 'transaction'), self.cursors['orders']
+            )[:50],
+        }
+
+    def run_queries(self, repeat, explain=True):
+        results = {}
+        for name, build in self.queries().items():
+            if explain:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name}"))
+                self.stdout.write(build().explain())
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(build())
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = statistics.median(timings)
+            if explain:
+                self.stdout.write(f"mediana {results[name]:.2f} ms en {repeat} ejecuciones")
+        return results
+
+    @contextmanager
+    def without_indexes(self):
+        indexes = [(model, index) for model in (Transaction, OrderItem) for index in model._meta.indexes]
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.remove_index(model, index)
+        try:
+            yield
+        finally:
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.add_index(model, index)
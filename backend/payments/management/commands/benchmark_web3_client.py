@@ -0,0 +1,132 @@
+import json
+import socket
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from web3 import Web3
+
+from payments._services.web3_client import get_web3, provider_is_healthy, reset_web3_client
+
+TX_HASH = '0x' + 'ab' * 32
+BLOCK_HASH = '0x' + 'cd' * 32
+SENDER = '0x' + '11' * 20
+CONTRACT = '0x' + '22' * 20
+
+RPC_RESULTS = {
+    'web3_clientVersion': 'EasyCryptoBuy/bench',
+    'eth_chainId': '0xaa36a7',
+    'eth_blockNumber': '0x100',
+    'eth_getTransactionReceipt': {
+        'blockHash': BLOCK_HASH, 'blockNumber': '0x100', 'contractAddress': None,
+        'cumulativeGasUsed': '0x5208', 'effectiveGasPrice': '0x3b9aca00', 'from': SENDER,
+        'gasUsed': '0x5208', 'logs': [], 'logsBloom': '0x' + '00' * 256, 'status': '0x1',
+        'to': CONTRACT, 'transactionHash': TX_HASH, 'transactionIndex': '0x0', 'type': '0x2',
+    },
+    'eth_getTransactionByHash': {
+        'blockHash': BLOCK_HASH, 'blockNumber': '0x100', 'from': SENDER, 'gas': '0x5208',
+        'gasPrice': '0x3b9aca00', 'hash': TX_HASH, 'input': '0x', 'nonce': '0x1', 'to': CONTRACT,
+        'transactionIndex': '0x0', 'value': '0x0', 'type': '0x0', 'chainId': '0xaa36a7',
+        'v': '0x1b', 'r': '0x' + '01' * 32, 's': '0x' + '02' * 32,
+    },
+}
+
+
+def make_handler(connect_delay, rpc_delay):
+    """Servidor JSON-RPC mínimo que simula el coste de abrir conexión y de cada llamada"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+
+        def setup(self):
+            # Se ejecuta una vez por conexión TCP: simula el handshake TCP/TLS
+            time.sleep(connect_delay)
+            super().setup()
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            time.sleep(rpc_delay)
+            body = json.dumps({
+                'jsonrpc': '2.0',
+                'id': request['id'],
+                'result': RPC_RESULTS.get(request['method']),
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = 'Compara la latencia por petición de un Web3 nuevo por petición frente al cliente compartido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Peticiones simuladas por escenario')
+        parser.add_argument('--connect-ms', type=float, default=20.0, help='Coste simulado de abrir una conexión')
+        parser.add_argument('--rpc-ms', type=float, default=2.0, help='Coste simulado de cada llamada RPC')
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            make_handler(options['connect_ms'] / 1000, options['rpc_ms'] / 1000),
+        )
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        self.stdout.write(f"Servidor JSON-RPC local en {url}")
+
+        try:
+            with override_settings(WEB3_PROVIDER=url):
+                reset_web3_client()
+                before = self.measure(self.per_request_client, url, options['requests'])
+                after = self.measure(self.shared_client, url, options['requests'])
+        finally:
+            reset_web3_client()
+            server.shutdown()
+
+        self.report('Antes (Web3 por petición + is_connected)', before)
+        self.report('Después (cliente compartido + salud cacheada)', after)
+        self.stdout.write(self.style.SUCCESS(
+            f"Mejora de la latencia media: x{statistics.mean(before) / statistics.mean(after):.1f}"
+        ))
+
+    def per_request_client(self, url):
+        # Lo que hacían update_transaction y register_transaction en cada petición
+        web3 = Web3(Web3.HTTPProvider(url))
+        if not web3.is_connected():
+            raise ConnectionError(url)
+        web3.eth.get_transaction_receipt(TX_HASH)
+        web3.eth.get_transaction(TX_HASH)
+
+    def shared_client(self, url):
+        if not provider_is_healthy():
+            raise ConnectionError(url)
+        web3 = get_web3()
+        web3.eth.get_transaction_receipt(TX_HASH)
+        web3.eth.get_transaction(TX_HASH)
+
+    def measure(self, scenario, url, requests):
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            scenario(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    def report(self, label, latencies):
+        latencies = sorted(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{label}: media {statistics.mean(latencies):.2f} ms | "
+            f"p50 {statistics.median(latencies):.2f} ms | p95 {p95:.2f} ms"
+        )
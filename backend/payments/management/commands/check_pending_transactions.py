@@ -2,214 +2,229 @@ import logging
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
-from web3 import AsyncWeb3, WebSocketProvider
 from django.conf import settings
-from payments.models import Transaction, OrderItem
+from payments.models import Transaction
+from payments._services.chain_cache import aget_receipt
+from payments._services.circuit_breaker import CircuitOpenError
+from payments._services.confirmations import accept_payments, settle_confirmations, to_hex
+from payments._services.idempotency import purge_expired_keys
+from payments._services.inventory import confirm_transactions, fail_transactions, purge_expired_reservations
+from payments._services.log_scanner import LogScanner, group_by_transaction_id
+from payments._services.payment_events import record_payment_events, stored_event_blocks
+from payments._services.web3_client import Web3ProviderNotConfigured, aprovider_is_healthy, get_async_web3
 import asyncio
 import json
 from asgiref.sync import sync_to_async
-from django.db import transaction as db_transaction
-import os
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
     help = 'Verifica transacciones pendientes y marca como fallidas las expiradas'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--transaction-hash', help='Verifica solo la transacción con este hash')
+        parser.add_argument('--concurrency', type=int, default=settings.CHECKER_CONCURRENCY,
+                            help='Transacciones verificadas a la vez')
+        parser.add_argument('--rpc-timeout', type=float, default=settings.CHECKER_RPC_TIMEOUT,
+                            help='Segundos máximos por llamada RPC')
+
     def handle(self, *args, **options):
-        transaction_hash = options.get('transaction_hash')
-        result = asyncio.run(self.async_handler(transaction_hash=transaction_hash))
-        return result
-    
-    async def async_handler(self, transaction_hash=None):
+        result = asyncio.run(self.async_handler(
+            transaction_hash=options.get('transaction_hash'),
+            concurrency=options.get('concurrency'),
+            rpc_timeout=options.get('rpc_timeout'),
+        ))
+        self.stdout.write(json.dumps(result))
+
+    async def async_handler(self, transaction_hash=None, concurrency=None, rpc_timeout=None):
         logger.info("Iniciando verificación de transacciones pendientes...")
-        
-        # Configurar conexión Web3
-        ws_provider_url = os.environ.get('WEB3_WS_PROVIDER')
+        self.rpc_timeout = rpc_timeout or settings.CHECKER_RPC_TIMEOUT
+        semaphore = asyncio.Semaphore(concurrency or settings.CHECKER_CONCURRENCY)
 
-        if not ws_provider_url:
-            logger.error("WEB3_WS_PROVIDER no está configurado")
+        # Cliente compartido del proceso: sus peticiones pasan por el circuit breaker del proveedor
+        try:
+            w3 = get_async_web3()
+        except Web3ProviderNotConfigured as e:
+            logger.error(str(e))
             return {
                 'success': False,
                 'processed': 0,
-                'message': "WEB3_WS_PROVIDER no está configurado"
+                'message': str(e)
+            }
+
+        if not await aprovider_is_healthy():
+            return {
+                'success': False,
+                'processed': 0,
+                'message': "No se pudo conectar a la red Ethereum"
             }
 
-        max_retries = 3
-        retry_delay = 5  # segundos
-
-        for attempt in range(max_retries):
-            try:
-                async with AsyncWeb3(WebSocketProvider(ws_provider_url)) as w3:
-                    if not await w3.is_connected():
-                        raise ConnectionError("No se pudo conectar via WebSocket")
-
-                    logger.info("Conexión WebSocket establecida correctamente")
-                    
-                    contract = w3.eth.contract(
-                        address=settings.PAYMENT_CONTRACT_ADDRESS,
-                        abi=settings.PAYMENT_CONTRACT_ABI
-                    )
-
-                    # Obtener transacciones pendientes con más de X tiempo
-                    expiration_time = timezone.now() - timedelta(minutes=1)
-
-                    filters = {
-                        'status': 'pending',
-                        'created_at__lte': expiration_time,
-                    }
-                    if transaction_hash:
-                        filters['transaction_hash'] = transaction_hash
-
-                    # Aplicar filtros al queryset
-                    pending_transactions = await sync_to_async(list)(
-                        Transaction.objects.filter(**filters)
-                    )
-
-                    logger.info(f"Encontradas {len(pending_transactions)} transacciones pendientes expiradas")
-
-                    # Procesar cada transacción
-                    confirmed_count = 0
-                    failed_count = 0
-                    
-                    for tx in pending_transactions:
-                        try:
-                            # Verificar si el hash es válido (no es la dirección de wallet)
-                            if not tx.transaction_hash or len(tx.transaction_hash) < 42 or tx.transaction_hash.startswith('0x') and len(tx.transaction_hash) <= 42:
-                                logger.warning(f"Transacción {tx.id} tiene un hash inválido (es una dirección de wallet): {tx.transaction_hash}")
-                                await self.handle_failed_transaction(tx)
-                                failed_count += 1
-                                continue
-                            
-                            result = await self.process_transaction(w3, contract, tx)
-                            if result == 'confirmed':
-                                confirmed_count += 1
-                            elif result == 'failed':
-                                failed_count += 1
-                        except Exception as e:
-                            logger.error(f"Error procesando transacción {tx.id}: {str(e)}")
-                            # En caso de error, marcar como failed y reponer stock
-                            await self.handle_failed_transaction(tx)
-                            failed_count += 1
-
-                    return {
-                        'success': True,
-                        'processed': len(pending_transactions),
-                        'confirmed': confirmed_count,
-                        'failed': failed_count                        
-                    }
-
-            except Exception as e:
-                logger.warning(f"Intento {attempt + 1}/{max_retries} - Error de conexión: {str(e)}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay * (attempt + 1))
-                else:
-                    logger.error("No se pudo establecer conexión después de varios intentos")
-                    return {
-                        'success': False,
-                        'error': str(e),
-                        'message': "No se pudo establecer conexión después de varios intentos"
-                    }
-
-    async def handle_failed_transaction(self, transaction):
-        """Maneja una transacción fallida: repone stock y marca OrderItems como cancelled"""
-        try:
-            # Usar una función sincrónica envuelta con sync_to_async
-            @sync_to_async
-            def process_failed_transaction():
-                with db_transaction.atomic():
-                    # Obtener los OrderItems asociados
-                    order_items = OrderItem.objects.filter(transaction=transaction).select_related('product')
-                    
-                    # Reponer el stock de cada producto
-                    items_restored = 0
-                    for order_item in order_items:
-                        product = order_item.product
-                        # Restaurar la cantidad que se había descontado
-                        product.stock_quantity += order_item.quantity
-                        product.save()
-                        
-                        # Marcar OrderItem como cancelled
-                        order_item.status = 'cancelled'
-                        order_item.save()
-                        items_restored += 1
-                    
-                    # Marcar la transacción como failed
-                    transaction.status = 'failed'
-                    # Cambiar el transaction_hash para evitar reintentos
-                    transaction.transaction_hash = f"failed_{transaction.id}_{timezone.now().timestamp()}"
-                    transaction.save()
-                    
-                    logger.info(f"Transacción {transaction.id} marcada como fallida. Se repusieron {items_restored} items al inventario.")
-                    return items_restored
-            
-            await process_failed_transaction()
-            
-        except Exception as e:
-            logger.error(f"Error al manejar transacción fallida {transaction.id}: {str(e)}")
-            # Si falla incluso el manejo de error, al menos marcar la transacción como failed
-            try:
-                @sync_to_async
-                def force_fail():
-                    transaction.status = 'failed'
-                    transaction.transaction_hash = f"failed_{transaction.id}_{timezone.now().timestamp()}"
-                    transaction.save()
-                await force_fail()
-            except:
-                pass
-
-    async def process_transaction(self, w3, contract, transaction):
-        """Procesa una transacción individual"""
         try:
-            # Verificar nuevamente que el hash sea válido antes de consultar
-            if not transaction.transaction_hash or len(transaction.transaction_hash) < 42:
-                logger.warning(f"Transacción {transaction.id} hash inválido: {transaction.transaction_hash}")
-                await self.handle_failed_transaction(transaction)
-                return 'failed'
-            
-            # Intentar obtener el recibo de la transacción
-            try:
-                receipt = await w3.eth.get_transaction_receipt(transaction.transaction_hash)
-            except Exception as e:
-                logger.warning(f"No se pudo obtener recibo para transacción {transaction.id}: {str(e)}")
-                await self.handle_failed_transaction(transaction)
-                return 'failed'
-            
-            if receipt is None:
-                logger.warning(f"Recibo no encontrado para transacción {transaction.id}")
-                await self.handle_failed_transaction(transaction)
-                return 'failed'
-                
-            block_number = receipt['blockNumber']
-
-            # Filtrar eventos por transactionId
-            events = await contract.events.PaymentReceived.get_logs(
-                argument_filters={'transactionId': transaction.id},
-                from_block=block_number,
-                to_block=block_number
+            contract = w3.eth.contract(
+                address=settings.PAYMENT_CONTRACT_ADDRESS,
+                abi=settings.PAYMENT_CONTRACT_ABI
             )
 
-            logger.debug(f"Eventos encontrados para transacción {transaction.id}:")
-            for event in events:
-                logger.debug(json.dumps(dict(event), indent=2, default=str))
+            # Las reservas y claves de idempotencia caducadas se eliminan de golpe antes de revisar las transacciones
+            await sync_to_async(purge_expired_reservations)()
+            await sync_to_async(purge_expired_keys)()
+
+            # Obtener transacciones pendientes con más de X tiempo
+            now = timezone.now()
+            expiration_time = now - timedelta(minutes=1)
+
+            # También las que esperan confirmaciones: si el listener estaba parado nadie las confirma
+            filters = {
+                'status__in': ('pending', 'confirming'),
+                'created_at__lte': expiration_time,
+            }
+            if transaction_hash:
+                filters['transaction_hash'] = transaction_hash
 
-            if not events:
-                # Transacción fallida - reponer stock
-                await self.handle_failed_transaction(transaction)
-                return 'failed'
-            else:
-                # Transacción confirmada
-                event = events[0]
-                @sync_to_async
-                def confirm_transaction():
-                    transaction.status = 'confirmed'
-                    transaction.save()
-                await confirm_transaction()
-                logger.info(f"Transacción {transaction.id} confirmada (evento encontrado en {event['blockNumber']})")
-                return 'confirmed'
+            # Aplicar filtros al queryset
+            pending_transactions = await sync_to_async(list)(
+                Transaction.objects.filter(**filters)
+            )
+
+            logger.info(f"Encontradas {len(pending_transactions)} transacciones pendientes expiradas")
+
+            # Recibos de todas las transacciones a la vez, con como mucho `concurrency` en curso
+            async def bounded(tx):
+                async with semaphore:
+                    return tx, await self.fetch_receipt(w3, tx)
+
+            results = await asyncio.gather(*(bounded(tx) for tx in pending_transactions))
+
+            failed = {tx.id for tx, result in results if result == 'failed'}
+            skipped = {tx.id for tx, result in results if result == 'skipped'}
+            receipts = {tx.id: result for tx, result in results if not isinstance(result, str)}
+            # Fuera de la cadena tras una reorganización: se sigue esperando a que se reincluya, hasta CONFIRMING_TIMEOUT
+            dropped = {tx.id for tx, result in results if result == 'dropped'}
+            expired = {tx.id for tx in pending_transactions if tx.created_at <= now - settings.CONFIRMING_TIMEOUT}
+            failed |= dropped & expired
+            dropped -= expired
+
+            # Un eth_getLogs por rango de bloques en lugar de uno por transacción
+            confirmed, confirming = set(), {}
+            hashes = {tx.id: tx.transaction_hash for tx in pending_transactions}
+            if receipts:
+                try:
+                    paid, without_event = await self.match_payment_events(contract, receipts)
+                    failed |= without_event
+                    head = await self.rpc(w3.eth.get_block_number())
+                except Exception as e:
+                    logger.error(f"No se pudieron leer los eventos de pago: {str(e)}")
+                    skipped |= set(receipts)
+                    paid = set()
+                # Con menos de CONFIRMATION_DEPTH confirmaciones quedan en 'confirming', con su bloque
+                for tx_id in paid:
+                    receipt = receipts[tx_id]
+                    if head - receipt['blockNumber'] + 1 >= settings.CONFIRMATION_DEPTH:
+                        confirmed.add(tx_id)
+                    else:
+                        confirming[tx_id] = (hashes[tx_id], receipt['blockNumber'], to_hex(receipt['blockHash']))
+
+            if confirmed:
+                await sync_to_async(confirm_transactions)(sorted(confirmed))
+                logger.info(f"Transacciones confirmadas: {sorted(confirmed)}")
+            if confirming:
+                await sync_to_async(accept_payments)(confirming)
+                logger.info(f"Transacciones {sorted(confirming)} esperando confirmaciones")
+            if dropped:
+                await sync_to_async(settle_confirmations)([], [], sorted(dropped), [])
+                logger.warning(f"Transacciones {sorted(dropped)} fuera de la cadena: siguen en 'confirming'")
+            if failed:
+                # Todas las fallidas en un número fijo de consultas
+                await sync_to_async(fail_transactions)(sorted(failed))
+
+            if skipped:
+                logger.warning(f"{len(skipped)} transacciones se revisarán en la próxima ejecución (RPC sin respuesta)")
+
+            return {
+                'success': True,
+                'processed': len(pending_transactions),
+                'confirmed': len(confirmed),
+                'confirming': len(confirming) + len(dropped),
+                'failed': len(failed),
+                'skipped': len(skipped),
+            }
 
         except Exception as e:
-            logger.error(f"Error al procesar transacción {transaction.id}: {str(e)}")
-            # En caso de error, marcar como failed y reponer stock
-            await self.handle_failed_transaction(transaction)
-            return 'failed'
\ No newline at end of file
+            logger.error(f"Error verificando transacciones pendientes: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'message': "No se pudo completar la verificación de transacciones pendientes"
+            }
+
+    async def fetch_receipt(self, w3, tx):
+        """
+        Recibo de una transacción pendiente, o 'failed' si no existe (o el hash
+        no es válido) y 'skipped' si el proveedor no respondió a tiempo (se deja
+        pendiente para la próxima ejecución). Una en 'confirming' ya se vio en
+        la cadena: sin recibo es 'dropped' y un error del proveedor no la da
+        por fallida.
+        """
+        # Verificar si el hash es válido (no es la dirección de wallet)
+        if not tx.transaction_hash or len(tx.transaction_hash) < 42 or tx.transaction_hash.startswith('0x') and len(tx.transaction_hash) <= 42:
+            logger.warning(f"Transacción {tx.id} tiene un hash inválido (es una dirección de wallet): {tx.transaction_hash}")
+            return 'failed'
+
+        try:
+            receipt = await self.rpc(aget_receipt(w3, tx.transaction_hash))
+        except asyncio.TimeoutError:
+            logger.warning(f"Tiempo de espera agotado consultando la transacción {tx.id}")
+            return 'skipped'
+        except CircuitOpenError:
+            # El proveedor no está respondiendo: no es motivo para dar el pago por fallido
+            return 'skipped'
+        except Exception as e:
+            logger.warning(f"No se pudo obtener recibo para transacción {tx.id}: {str(e)}")
+            return 'skipped' if tx.status == 'confirming' else 'failed'
+
+        if receipt is None:
+            if tx.status == 'confirming':
+                logger.warning(f"El pago de la transacción {tx.id} ya no está en la cadena")
+                return 'dropped'
+            logger.warning(f"Recibo no encontrado para transacción {tx.id}")
+            return 'failed'
+        return receipt
+
+    async def rpc(self, awaitable):
+        """Llamada RPC con el tiempo máximo de --rpc-timeout"""
+        return await asyncio.wait_for(awaitable, timeout=self.rpc_timeout)
+
+    async def match_payment_events(self, contract, receipts):
+        """
+        Casa cada recibo con su evento PaymentReceived: primero entre los ya
+        guardados en PaymentEvent y, para el resto, en unas pocas llamadas por
+        rangos de bloques que también se guardan.
+
+        Args:
+            receipts: {transaction_id: recibo}
+
+        Returns:
+            tuple: (ids con evento en el bloque de su recibo, ids sin evento)
+        """
+        # Primero los eventos ya guardados por el listener: consulta local, sin RPC
+        stored = await sync_to_async(stored_event_blocks)(list(receipts))
+        confirmed = {tx_id for tx_id, receipt in receipts.items() if receipt['blockNumber'] in stored.get(tx_id, ())}
+        receipts = {tx_id: receipt for tx_id, receipt in receipts.items() if tx_id not in confirmed}
+        if confirmed:
+            logger.info(f"{len(confirmed)} transacciones casadas con eventos ya guardados")
+        if not receipts:
+            return confirmed, set()
+
+        scanner = LogScanner(contract.events.PaymentReceived, timeout=self.rpc_timeout)
+        logs = await scanner.scan_blocks({receipt['blockNumber'] for receipt in receipts.values()})
+        events = group_by_transaction_id(logs)
+        logger.info(f"{len(logs)} eventos PaymentReceived leídos en {scanner.calls} llamadas eth_getLogs")
+        await sync_to_async(record_payment_events)(logs)
+
+        failed = set()
+        for tx_id, receipt in receipts.items():
+            matching = [e for e in events.get(tx_id, []) if e['blockNumber'] == receipt['blockNumber']]
+            for event in matching:
+                logger.debug(json.dumps(dict(event), indent=2, default=str))
+            (confirmed if matching else failed).add(tx_id)
+        return confirmed, failed
@@ -0,0 +1,45 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments._services.exports import DATASETS, DEFAULT_CHUNK_SIZE, WRITERS, ExportError, stream_export
+from payments._services.pagination import PaginationError
+
+
+class Command(BaseCommand):
+    help = 'Exporta transacciones, líneas de pedido o el resumen por usuario en streaming (ndjson, csv o parquet)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(DATASETS))
+        parser.add_argument('--format', dest='file_format', choices=list(WRITERS), default='ndjson')
+        parser.add_argument('--output', '-o', default='-', help="Fichero de salida ('-' para stdout)")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Filas por lote')
+        parser.add_argument('--status', help='Estados separados por comas')
+        parser.add_argument('--from', dest='created_from', help='Fecha inicial (YYYY-MM-DD o ISO 8601)')
+        parser.add_argument('--to', dest='created_to', help='Fecha final (YYYY-MM-DD o ISO 8601)')
+
+    def handle(self, *args, **options):
+        params = {key: options[key] for key in ('status', 'created_from', 'created_to') if options[key]}
+        try:
+            chunks = stream_export(options['dataset'], options['file_format'], params, options['chunk_size'])
+        except (ExportError, PaginationError) as e:
+            raise CommandError(str(e))
+
+        to_stdout = options['output'] == '-'
+        output = sys.stdout.buffer if to_stdout else open(options['output'], 'wb')
+        start = time.perf_counter()
+        written = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if not to_stdout:
+                output.close()
+
+        if not to_stdout:
+            self.stdout.write(self.style.SUCCESS(
+                f"Exportados {written / 1024 / 1024:.1f} MB a {options['output']} "
+                f"en {time.perf_counter() - start:.1f}s"
+            ))
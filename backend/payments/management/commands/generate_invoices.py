@@ -0,0 +1,103 @@
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+
+from payments.models import OrderItem, Transaction
+from payments._services.invoices import (
+    invoice_path,
+    invoice_snapshot,
+    invoice_storage,
+    render_invoice_bytes,
+    snapshot_version,
+    store_invoice,
+    warm_up,
+)
+from payments._services.pagination import PaginationError, filter_queryset
+
+
+def render_job(job):
+    """Se ejecuta en los procesos hijos: solo ReportLab, sin base de datos"""
+    snapshot, version = job
+    return snapshot['id'], version, render_invoice_bytes(snapshot)
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera en paralelo las facturas PDF de las transacciones (por defecto las confirmadas) '
+        'en un ZIP o en el almacenamiento de facturas, con el mismo diseño que generate-invoice'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', default='confirmed', help='Estados separados por comas')
+        parser.add_argument('--from', dest='created_from', help='Fecha inicial (YYYY-MM-DD o ISO 8601)')
+        parser.add_argument('--to', dest='created_to', help='Fecha final (YYYY-MM-DD o ISO 8601)')
+        parser.add_argument('--zip', dest='zip_path',
+                            help='Escribe las facturas en este ZIP en lugar del almacenamiento de facturas')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Procesos de renderizado')
+        parser.add_argument('--batch-size', type=int, default=500, help='Transacciones leídas por lote')
+        parser.add_argument('--force', action='store_true',
+                            help='Vuelve a generar las facturas que ya están en el almacenamiento')
+
+    def handle(self, *args, **options):
+        params = {key: options[key] for key in ('status', 'created_from', 'created_to') if options[key]}
+        try:
+            transactions = filter_queryset(params, Transaction.objects.all())
+        except PaginationError as e:
+            raise CommandError(str(e))
+
+        # Dos consultas por lote: transacciones y sus líneas con el producto
+        transactions = transactions.order_by('id').prefetch_related(
+            Prefetch('order_items', queryset=OrderItem.objects.select_related('product').order_by('id'))
+        )
+
+        archive = zipfile.ZipFile(options['zip_path'], 'w', zipfile.ZIP_STORED) if options['zip_path'] else None
+        storage = invoice_storage()
+        self.workers = options['workers']
+        self.force = options['force']
+        self.rendered = self.skipped = self.size = 0
+        start = time.perf_counter()
+
+        try:
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=warm_up) as pool:
+                batch = []
+                for transaction in transactions.iterator(chunk_size=options['batch_size']):
+                    snapshot = invoice_snapshot(transaction, transaction.order_items.all())
+                    version = snapshot_version(snapshot)
+                    if not archive and not options['force'] and storage.exists(invoice_path(snapshot['id'], version)):
+                        self.skipped += 1
+                        continue
+                    batch.append((snapshot, version))
+                    if len(batch) >= options['batch_size']:
+                        self.write_batch(pool, batch, archive)
+                        batch = []
+                if batch:
+                    self.write_batch(pool, batch, archive)
+        finally:
+            if archive:
+                archive.close()
+
+        elapsed = time.perf_counter() - start
+        destination = options['zip_path'] or 'el almacenamiento de facturas'
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.rendered} facturas generadas en {destination} en {elapsed:.1f}s "
+            f"({self.rendered / elapsed if elapsed else 0:.1f} facturas/s, "
+            f"{self.size / 1024 / 1024:.1f} MB, {options['workers']} procesos); "
+            f"{self.skipped} ya estaban generadas"
+        ))
+
+    def write_batch(self, pool, batch, archive):
+        # map conserva el orden; los PDFs se escriben según llegan sin acumular el lote entero
+        chunksize = max(1, len(batch) // (self.workers * 4))
+        for transaction_id, version, pdf in pool.map(render_job, batch, chunksize=chunksize):
+            if archive:
+                archive.writestr(f"factura_{transaction_id}.pdf", pdf)
+            else:
+                if self.force:
+                    invoice_storage().delete(invoice_path(transaction_id, version))
+                store_invoice(transaction_id, version, pdf)
+            self.rendered += 1
+            self.size += len(pdf)
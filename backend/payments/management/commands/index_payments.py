@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from web3 import AsyncHTTPProvider, AsyncWeb3
+
+from payments._services.checkpoints import get_checkpoint
+from payments._services.indexer import ChainIndexer
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Indexa los eventos PaymentReceived y Withdrawn del contrato de pagos entre dos bloques'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-block', type=int,
+                            help='Primer bloque (por defecto el siguiente al checkpoint, o LISTENER_START_BLOCK)')
+        parser.add_argument('--to-block', type=int, help='Último bloque (por defecto la cabeza de la cadena)')
+        parser.add_argument('--workers', type=int, default=4, help='Peticiones eth_getLogs en paralelo')
+        parser.add_argument('--chunk-size', type=int, default=settings.LOG_SCAN_MAX_BLOCKS,
+                            help='Bloques máximos por petición')
+        parser.add_argument('--restart', action='store_true', help='Ignora el checkpoint y empieza desde el principio')
+
+    def handle(self, *args, **options):
+        if not settings.WEB3_PROVIDER:
+            raise CommandError("WEB3_PROVIDER no está configurado")
+        try:
+            asyncio.run(self.async_handler(**options))
+        except ExceptionGroup as group:
+            raise CommandError(f"Indexación interrumpida: {group.exceptions[0]}") from group
+
+    async def async_handler(self, from_block=None, to_block=None, workers=4, chunk_size=None, restart=False, **options):
+        w3 = AsyncWeb3(AsyncHTTPProvider(
+            settings.WEB3_PROVIDER,
+            request_kwargs={'timeout': settings.WEB3_PROVIDER_TIMEOUT},
+        ))
+        contract = w3.eth.contract(address=settings.PAYMENT_CONTRACT_ADDRESS, abi=settings.PAYMENT_CONTRACT_ABI)
+        # Checkpoint propio: no se mezcla con el del listener
+        checkpoint_name = f"index:{contract.address}"
+
+        if from_block is None:
+            checkpoint = None if restart else await sync_to_async(get_checkpoint)(checkpoint_name)
+            if checkpoint is not None:
+                from_block = checkpoint + 1
+            else:
+                from_block = settings.LISTENER_START_BLOCK or 0
+        if to_block is None:
+            to_block = await w3.eth.block_number
+        if from_block > to_block:
+            self.stdout.write(f"Nada que indexar: el checkpoint ya está en el bloque {from_block - 1}")
+            return
+
+        indexer = ChainIndexer(w3, contract, checkpoint_name, workers=workers, max_span=chunk_size)
+        logger.info(f"Indexando bloques {from_block}-{to_block} con {workers} workers")
+        started = time.perf_counter()
+        committed = await indexer.run(from_block, to_block)
+        elapsed = time.perf_counter() - started
+
+        blocks = committed - from_block + 1
+        stored = ', '.join(f"{count} {name}" for name, count in indexer.stored.items())
+        self.stdout.write(
+            f"Bloques {from_block}-{committed}: {stored} en {indexer.calls} peticiones, "
+            f"{elapsed:.1f} s ({blocks / max(elapsed, 1e-6):.0f} bloques/s)"
+        )
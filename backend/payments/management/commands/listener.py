@@ -1,144 +1,609 @@
 # listener.py - Con verificación de transacciones perdidas al iniciar
-import os
 import asyncio
 import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import close_old_connections, connection, connections
 from web3 import AsyncWeb3, WebSocketProvider
-from web3.utils.subscriptions import LogsSubscription
+from web3.utils.subscriptions import LogsSubscription, NewHeadsSubscription
 from payments.models import Transaction
+from payments._services.chain_cache import aget_receipt
+from payments._services.checkpoints import advance_checkpoint, get_checkpoint
+from payments._services.confirmations import (
+    ConfirmationTracker,
+    accept_payments,
+    confirming_transactions,
+    settle_confirmations,
+    to_hex,
+)
+from payments._services.inventory import confirm_transactions, fail_transactions
+from payments._services.leases import (
+    ShardLayoutConflict,
+    acquire_shard,
+    filter_shard,
+    in_shard,
+    lease_owner,
+    release_shard,
+    renew_shard,
+)
+from payments._services.log_scanner import LogScanner
+from payments._services.payment_events import record_payment_events
+from payments._services.pending_events import PendingEventBuffer, TransactionNotifications
+from payments._services.ws_endpoints import EndpointPool
 from asgiref.sync import sync_to_async
 from django.utils import timezone
 from datetime import timedelta
 
 logger = logging.getLogger(__name__)
 
+
+def event_hash(log):
+    return '0x' + log['transactionHash'].hex()
+
+
+def event_payment(event):
+    """(hash, bloque, hash de bloque) del pago de un evento, como espera accept_payments"""
+    return event_hash(event), event['blockNumber'], to_hex(event['blockHash'])
+
+
+class PipelineMetrics:
+    """Eventos guardados y latencia desde su recepción, acumulados entre informes"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.events = 0
+        self.batches = 0
+        self.latencies = []
+
+    def record(self, latencies):
+        self.events += len(latencies)
+        self.batches += 1
+        self.latencies.extend(latencies)
+
+    def report(self, queue, waiting, confirming):
+        latency = ''
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            p50 = ordered[len(ordered) // 2] * 1000
+            p95 = ordered[int((len(ordered) - 1) * 0.95)] * 1000
+            latency = f", latencia p50 {p50:.0f} ms p95 {p95:.0f} ms"
+        logger.info(
+            f"Listener: cola {queue.qsize()}/{queue.maxsize}, {self.events} eventos en {self.batches} lotes"
+            f"{latency}, {waiting} en espera de su transacción, {confirming} en 'confirming'"
+        )
+        self.reset()
+
+
 class Command(BaseCommand):
     help = 'Escucha eventos de PaymentReceived del contrato'
 
+    # Sin reparto todos los eventos son de este proceso
+    shard = 0
+    shards = 1
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, default=settings.LISTENER_SHARDS,
+                            help='Procesos entre los que se reparten los eventos por transactionId')
+
     def handle(self, *args, **options):
         logger.info("Iniciando listener de eventos...")
-        asyncio.run(self.async_handler())
+        asyncio.run(self.async_handler(shards=options['shards']))
 
-    async def async_handler(self):
-        max_retries = 10
-        retry_count = 0
-        ws_provider_url = os.environ.get('WEB3_WS_PROVIDER')
-        
-        if not ws_provider_url:
-            logger.error("WEB3_WS_PROVIDER no está definido en las variables de entorno.")
+    async def async_handler(self, shards=1):
+        if not settings.WEB3_WS_PROVIDERS:
+            logger.error("WEB3_WS_PROVIDERS / WEB3_WS_PROVIDER no está definido en las variables de entorno.")
             return
 
+        # También sin reparto se reserva el shard 0/1: así un despliegue con otro número de shards lo ve
+        await self.run_sharded(shards)
+
+    async def run_sharded(self, shards):
+        """
+        Reserva un shard libre y escucha solo sus eventos mientras mantenga el
+        latido. Si el proceso de otro shard muere, su reserva caduca y la toma
+        un proceso en espera; si este pierde la suya, deja de escuchar y vuelve
+        a buscar shard. Mientras sigan vivos procesos con otro número de shards
+        no se reserva ninguno.
+        """
+        owner = lease_owner()
+        self.shards = shards
+        interval = settings.LISTENER_LEASE_TTL / 3
+
         while True:
             try:
-                async with AsyncWeb3(WebSocketProvider(ws_provider_url)) as w3:
-                    logger.info("Conectado a la blockchain. Configurando contrato...")
-                    
-                    # Verificar transacciones pendientes que puedan haber sido confirmadas
-                    await self.check_pending_transactions(w3)
-                    
-                    contract = w3.eth.contract(
-                        address=settings.PAYMENT_CONTRACT_ADDRESS,
-                        abi=settings.PAYMENT_CONTRACT_ABI
-                    )
-
-                    subscription = LogsSubscription(
-                        address=contract.address,
-                        topics=[contract.events.PaymentReceived().topic],
-                        handler=lambda ctx: self.handle_payment_event(ctx, contract)
-                    )
-
-                    await w3.subscription_manager.subscribe([subscription])
-                    logger.info("Escuchando eventos...")
-                    retry_count = 0
-                    await w3.subscription_manager.handle_subscriptions()
+                shard = await sync_to_async(acquire_shard)(owner, shards)
+            except ShardLayoutConflict as e:
+                logger.warning(f"{e}: no se escucha hasta que paren; reintentando en {interval:.0f}s")
+                await asyncio.sleep(interval)
+                continue
+            if shard is None:
+                logger.info(f"Los {shards} shards tienen dueño; reintentando en {interval:.0f}s")
+                await asyncio.sleep(interval)
+                continue
 
+            self.shard = shard
+            logger.info(f"Shard {shard}/{shards} reservado por {owner}")
+            listening = asyncio.create_task(self.listen())
+            heartbeat = asyncio.create_task(self.heartbeat(owner, interval))
+            try:
+                await asyncio.wait([listening, heartbeat], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in (listening, heartbeat):
+                    task.cancel()
+                await asyncio.gather(listening, heartbeat, return_exceptions=True)
+                await sync_to_async(release_shard)(owner, shard, shards)
+            if heartbeat.done() and not heartbeat.cancelled():
+                logger.warning(f"Reserva del shard {shard}/{shards} perdida; se busca otro")
+            elif not listening.cancelled() and listening.exception():
+                logger.error(f"El shard {shard}/{shards} dejó de escuchar: {listening.exception()}; se libera")
+
+    async def heartbeat(self, owner, interval):
+        """Renueva la reserva del shard; termina si otro proceso la ha tomado o no se ha podido renovar a tiempo"""
+        deadline = time.monotonic() + settings.LISTENER_LEASE_TTL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await sync_to_async(renew_shard)(owner, self.shard, self.shards):
+                    return
+                deadline = time.monotonic() + settings.LISTENER_LEASE_TTL
             except Exception as e:
-                wait_time = min(60, 2 ** retry_count)
-                logger.warning(f"Error: {e}. Reintentando conexión en {wait_time}s...")
-                await asyncio.sleep(wait_time)
-                retry_count = min(retry_count + 1, max_retries)
+                logger.warning(f"No se pudo renovar la reserva del shard {self.shard}: {e}")
+                if time.monotonic() >= deadline:
+                    return
+
+    def owns(self, transaction_id):
+        return in_shard(transaction_id, self.shard, self.shards)
+
+    async def listen(self):
+        # La cola, los consumidores y los eventos en espera se mantienen entre reconexiones
+        await self.start_pipeline()
+        try:
+            # Todos los endpoints a la vez: si uno se cae o se retrasa, los demás siguen entregando eventos
+            await asyncio.gather(*(self.listen_endpoint(endpoint) for endpoint in self.endpoints.endpoints))
+        finally:
+            await self.stop_pipeline()
+
+    async def listen_endpoint(self, endpoint):
+        """Mantiene conectado un endpoint, reconectando con espera exponencial si se cae o se queda atrás"""
+        max_retries = 10
+
+        while True:
+            endpoint.session = asyncio.create_task(self.connect_and_listen(endpoint))
+            try:
+                await asyncio.wait([endpoint.session])
+            except asyncio.CancelledError:
+                endpoint.session.cancel()
+                raise
+            self.endpoints.disconnected(endpoint)
+
+            if endpoint.session.cancelled():
+                reason = "desconectado por retraso"
+            elif endpoint.session.exception():
+                reason = f"Error: {endpoint.session.exception()}"
+            else:
+                reason = "conexión cerrada"
+            wait_time = min(60, 2 ** endpoint.failures)
+            logger.warning(f"{endpoint.name}: {reason}. Reintentando conexión en {wait_time}s...")
+            await asyncio.sleep(wait_time)
+            endpoint.failures = min(endpoint.failures + 1, max_retries)
+
+    async def connect_and_listen(self, endpoint):
+        async with AsyncWeb3(WebSocketProvider(endpoint.url)) as w3:
+            logger.info(f"Conectado a la blockchain por {endpoint.name}. Configurando contrato...")
+
+            contract = w3.eth.contract(
+                address=settings.PAYMENT_CONTRACT_ADDRESS,
+                abi=settings.PAYMENT_CONTRACT_ABI
+            )
+            self.checkpoint_name = f"PaymentReceived:{contract.address}"
+            if self.shards > 1:
+                # Cada shard avanza a su ritmo: checkpoint propio
+                self.checkpoint_name += f":{self.shard}/{self.shards}"
+
+            subscriptions = [
+                LogsSubscription(
+                    address=contract.address,
+                    topics=[contract.events.PaymentReceived().topic],
+                    handler=lambda ctx: self.handle_payment_event(ctx, contract, endpoint)
+                ),
+                # Cabeceras: retraso de cada endpoint y confirmaciones de las transacciones en 'confirming'
+                NewHeadsSubscription(handler=lambda ctx: self.handle_new_head(ctx, endpoint)),
+            ]
+
+            # Suscribirse antes de rellenar el hueco: lo que llegue mientras tanto
+            # queda en cola, y un evento repetido no confirma dos veces
+            await w3.subscription_manager.subscribe(subscriptions)
+            self.endpoints.connected(endpoint, w3, await w3.eth.block_number)
+            async with self.backfill_lock:
+                await self.backfill(w3, contract)
+            logger.info(f"Escuchando eventos por {endpoint.name}...")
+            endpoint.failures = 0
+            await w3.subscription_manager.handle_subscriptions()
+
+    async def backfill(self, w3, contract):
+        """
+        Procesa los eventos PaymentReceived emitidos desde el último bloque
+        guardado hasta el actual, por tramos de eth_getLogs. El coste depende
+        de los bloques perdidos, no del número de transacciones pendientes.
+        """
+        head = await w3.eth.block_number
+        checkpoint = await sync_to_async(get_checkpoint)(self.checkpoint_name)
+
+        # Los últimos CONFIRMATION_DEPTH bloques aún pueden reorganizarse: se vuelven a leer en el próximo arranque
+        safe = head - settings.CONFIRMATION_DEPTH
+
+        if checkpoint is None:
+            if settings.LISTENER_START_BLOCK is None:
+                # Primer arranque sin bloque de partida: se revisan una vez los recibos de las pendientes
+                await self.check_pending_transactions(w3)
+                await sync_to_async(advance_checkpoint)(self.checkpoint_name, safe)
+                return
+            checkpoint = settings.LISTENER_START_BLOCK - 1
+
+        if checkpoint >= head:
+            return
+
+        logger.info(f"Rellenando eventos de los bloques {checkpoint + 1}-{head} ({head - checkpoint} bloques)")
+        scanner = LogScanner(contract.events.PaymentReceived)
+        confirmed = 0
+        # El checkpoint avanza tras cada tramo: si se corta la conexión no se repite lo ya procesado
+        for from_block in range(checkpoint + 1, head + 1, scanner.max_span):
+            to_block = min(from_block + scanner.max_span - 1, head)
+            events = await scanner.scan(from_block, to_block)
+            confirmed += await self.process_events(events)
+            await sync_to_async(advance_checkpoint)(self.checkpoint_name, min(to_block, safe))
+
+        logger.info(f"Relleno completado: {confirmed} pagos registrados en {scanner.calls} llamadas eth_getLogs")
+
+    async def process_events(self, events):
+        """Registra en bloque los pagos de una lista de eventos PaymentReceived ya decodificados"""
+        events = [event for event in events if self.owns(event['args']['transactionId'])]
+        if not events:
+            return 0
+        await sync_to_async(record_payment_events)(events)
+        # Las ya confirmadas o desconocidas se ignoran
+        payments = {event['args']['transactionId']: event_payment(event) for event in events}
+        confirmed, tracked = await sync_to_async(accept_payments)(payments)
+        for entry in tracked:
+            self.tracker.add(*entry)
+        if confirmed or tracked:
+            logger.info(f"Relleno: {len(confirmed)} transacciones confirmadas y {len(tracked)} esperando confirmaciones")
+        return len(confirmed) + len(tracked)
 
     async def check_pending_transactions(self, w3):
         """Verifica transacciones pendientes que podrían haberse confirmado mientras el listener estaba offline"""
         try:
             # Buscar transacciones pendientes con hash que parezca real (no placeholder)
             pending_transactions = await sync_to_async(list)(
-                Transaction.objects.filter(
+                filter_shard(Transaction.objects.filter(
                     status='pending'
                 ).exclude(
                     transaction_hash__regex=r'^0x[a-fA-F0-9]{40}$'  # Excluir placeholders que son direcciones de wallet
-                )
+                ), self.shard, self.shards)
             )
             
             if not pending_transactions:
                 return
                 
             logger.info(f"Verificando {len(pending_transactions)} transacciones pendientes...")
-            
+
+            confirmed, reverted = [], []
             for tx in pending_transactions:
                 try:
-                    # Verificar si la transacción ya está confirmada en blockchain
-                    receipt = await w3.eth.get_transaction_receipt(tx.transaction_hash)
-                    
+                    # Verificar si la transacción ya está minada en blockchain
+                    receipt = await aget_receipt(w3, tx.transaction_hash)
+
                     if receipt and receipt.status == 1:
                         logger.info(f"Transacción pendiente {tx.id} encontrada como confirmada en blockchain")
-                        tx.status = 'confirmed'
-                        # El hash ya es correcto, solo actualizar estado
-                        await sync_to_async(tx.save)()
-                        logger.info(f"Transacción {tx.id} marcada como confirmed")
-                        
+                        confirmed.append(tx.id)
+                    elif receipt and receipt.status == 0:
+                        logger.info(f"Transacción pendiente {tx.id} revertida en blockchain")
+                        reverted.append(tx.id)
+
                 except Exception as e:
                     logger.debug(f"Error verificando transacción {tx.id}: {e}")
-                    
+
+            # El hash ya es correcto: solo se actualiza el estado y el stock, en bloque
+            if confirmed:
+                await sync_to_async(confirm_transactions)(confirmed)
+                logger.info(f"Transacciones {confirmed} marcadas como confirmed")
+            if reverted:
+                await sync_to_async(fail_transactions)(reverted)
+
         except Exception as e:
             logger.error(f"Error en check_pending_transactions: {e}")
 
-    async def handle_payment_event(self, context, contract):
+    async def start_pipeline(self):
+        """
+        Etapas del listener: el manejador de la suscripción solo decodifica y
+        encola; N consumidores guardan los eventos por lotes. La cola está
+        acotada, así que si la base de datos no da abasto se frena la lectura
+        del websocket en lugar de acumular memoria.
+        """
+        self.queue = asyncio.Queue(maxsize=settings.LISTENER_QUEUE_SIZE)
+        self.endpoints = EndpointPool(settings.WEB3_WS_PROVIDERS)
+        self.backfill_lock = asyncio.Lock()
+        self.in_flight = Counter()  # bloque -> eventos encolados o en proceso
+        self.last_block = 0  # bloque más alto visto en un evento o una cabecera
+        self.metrics = PipelineMetrics()
+        # Eventos que llegan antes que su transacción
+        self.pending = PendingEventBuffer()
+        self.notifications = TransactionNotifications()
+        await self.notifications.start()
+        # Transacciones en 'confirming' esperando profundidad, incluidas las de ejecuciones anteriores
+        self.new_head = asyncio.Event()
+        await self.reload_tracker()
+
+        # Cada consumidor guarda en su propio hilo y con su propia conexión: los lotes se escriben en paralelo
+        # en lugar de turnarse en el hilo único de sync_to_async. SQLite no admite escrituras simultáneas,
+        # así que con SQLite se sigue usando ese hilo único, el mismo del checkpoint
+        self.db_executor = None
+        if connection.vendor != 'sqlite':
+            self.db_executor = ThreadPoolExecutor(
+                max_workers=settings.LISTENER_WORKERS, thread_name_prefix='listener-db'
+            )
+        self.tasks = [asyncio.create_task(self.consume_events()) for _ in range(settings.LISTENER_WORKERS)]
+        self.tasks += [
+            asyncio.create_task(self.watch_pending_events()),
+            asyncio.create_task(self.track_confirmations()),
+            asyncio.create_task(self.report_metrics()),
+        ]
+
+    async def stop_pipeline(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.notifications.stop()
+        await self.close_consumer_connections()
+
+    async def close_consumer_connections(self):
+        """
+        Cierra la conexión a la base de datos de cada hilo de los consumidores.
+        Se lanza una tarea por hilo y todas esperan en una barrera, así que
+        ninguna puede ejecutarse en el hilo de otra.
+        """
+        if self.db_executor is None:
+            return
+        threads = self.db_executor._max_workers
+        barrier = threading.Barrier(threads)
+
+        def close():
+            connections.close_all()
+            barrier.wait(timeout=30)
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *[loop.run_in_executor(self.db_executor, close) for _ in range(threads)], return_exceptions=True
+        )
+        self.db_executor.shutdown(wait=True)
+
+    async def handle_payment_event(self, context, contract, endpoint):
+        """Etapa de decodificación: no toca la base de datos"""
         log = context.result
+        if log.get('removed'):
+            # Log retirado por una reorganización: lo resuelve el tracker de confirmaciones
+            return
         try:
             event = contract.events.PaymentReceived().process_log(log)
+        except Exception as e:
+            logger.error(f"Error decodificando evento: {e}", exc_info=True)
+            return
+        # Se marca como visto solo una vez decodificado: si falla, la copia de otro endpoint aún puede procesarse
+        if not self.endpoints.first_event(endpoint, log):
+            # Ya llegó por otro endpoint más rápido
+            return
+        if not self.owns(event['args']['transactionId']):
+            # Lo procesa el proceso de otro shard
+            return
+
+        logger.info(
+            f"Evento recibido: TX Hash {event_hash(event)}, Transaction ID {event['args']['transactionId']}, "
+            f"Sender {event['args']['sender'].lower()}"
+        )
+        self.in_flight[event['blockNumber']] += 1
+        self.last_block = max(self.last_block, event['blockNumber'])
+        await self.queue.put((time.monotonic(), event))
+
+    async def consume_events(self):
+        """Etapa de guardado: toma todos los eventos disponibles (hasta el tamaño de lote) y los resuelve juntos"""
+        if self.db_executor is None:
+            ingest_events = sync_to_async(self.ingest_events)
+        else:
+            ingest_events = sync_to_async(self.ingest_events, thread_sensitive=False, executor=self.db_executor)
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < settings.LISTENER_BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            events = [event for _, event in batch]
+
+            try:
+                waiting, tracked = await ingest_events(events)
+            except Exception as e:
+                # Se reintentan al guardarse la transacción o al caducar, sin adelantar el checkpoint
+                logger.error(f"Error procesando {len(events)} eventos: {e}", exc_info=True)
+                waiting, tracked = events, []
+            for entry in tracked:
+                self.tracker.add(*entry)
+            for event in waiting:
+                self.pending.add(event['args']['transactionId'], event)
+            if waiting:
+                try:
+                    await self.notifications.catch_up([event['args']['transactionId'] for event in waiting])
+                except Exception as e:
+                    logger.error(f"Error revisando los eventos en espera: {e}")
+                logger.info(f"{len(waiting)} eventos en espera de su transacción ({len(self.pending)} en total)")
+
+            for event in events:
+                self.in_flight[event['blockNumber']] -= 1
+                if not self.in_flight[event['blockNumber']]:
+                    del self.in_flight[event['blockNumber']]
+            now = time.monotonic()
+            self.metrics.record([now - received for received, _ in batch])
+
+            try:
+                await self.save_checkpoint()
+            except Exception as e:
+                logger.error(f"Error guardando el checkpoint: {e}")
+            # El lote cuenta como terminado con el checkpoint ya guardado: queue.join() no vuelve antes
+            for _ in batch:
+                self.queue.task_done()
+
+    def ingest_events(self, events):
+        """Guarda los eventos en el registro de PaymentEvent y registra sus pagos, en un solo paso por la base de datos"""
+        # Como en cada petición: la conexión del hilo se cierra si está rota o superó CONN_MAX_AGE
+        close_old_connections()
+        try:
+            record_payment_events(events)
+            return self.resolve_events(events)
+        finally:
+            close_old_connections()
+
+    def resolve_events(self, events, expired=False):
+        """
+        Registra de una vez los pagos de los eventos cuya transacción ya existe
+        con la wallet del remitente. Al caducar la espera se descartan los que
+        siguen sin una transacción guardada que coincida.
+
+        Returns:
+            tuple: (eventos que deben seguir esperando a su transacción,
+            entradas para el tracker de confirmaciones)
+        """
+        wallets = dict(
+            Transaction.objects.filter(
+                id__in={event['args']['transactionId'] for event in events}
+            ).values_list('id', 'wallet_address')
+        )
+
+        payments, waiting = {}, []
+        for event in events:
             transaction_id = event['args']['transactionId']
-            sender_address = event['args']['sender'].lower()
-            tx_hash = '0x' + log['transactionHash'].hex()  
+            wallet = wallets.get(transaction_id)
+            if wallet is not None and wallet.lower() == event['args']['sender'].lower():
+                payments[transaction_id] = event_payment(event)
+            elif expired and wallet is None:
+                logger.error(f"Transacción {transaction_id} no existe: se descarta su evento")
+            elif expired:
+                logger.error(
+                    f"Transacción {transaction_id} de otra wallet que el remitente "
+                    f"{event['args']['sender'].lower()}: se descarta su evento"
+                )
+            else:
+                waiting.append(event)
 
-            logger.info(f"Evento recibido: TX Hash {tx_hash}, Transaction ID {transaction_id}, Sender {sender_address}")
+        tracked = []
+        if payments:
+            # Actualizar las transacciones con el hash real: confirmadas o en 'confirming' según la profundidad
+            confirmed, tracked = accept_payments(payments)
+            if confirmed:
+                logger.info(f"Transacciones {confirmed} confirmadas - Hash actualizado")
+            if tracked:
+                logger.info(f"Transacciones {[tx_id for _, tx_id, _, _ in tracked]} esperando confirmaciones")
+            already = set(payments) - set(confirmed) - {tx_id for _, tx_id, _, _ in tracked}
+            if already:
+                logger.info(f"Transacciones {sorted(already)} ya confirmadas.")
+        return waiting, tracked
 
-            max_retries = 5
-            base_delay = 5
+    async def watch_pending_events(self):
+        """Resuelve los eventos en espera en cuanto se guarda su transacción y descarta los caducados"""
+        while True:
+            try:
+                saved = await self.notifications.wait(self.pending.ids(), settings.PENDING_EVENT_POLL)
+                ready = [self.pending.get(tx_id) for tx_id in saved if tx_id in self.pending]
+                if ready:
+                    waiting, tracked = await sync_to_async(self.resolve_events)(ready)
+                    for entry in tracked:
+                        self.tracker.add(*entry)
+                    still_waiting = {event['args']['transactionId'] for event in waiting}
+                    for event in ready:
+                        if event['args']['transactionId'] not in still_waiting:
+                            self.pending.discard(event['args']['transactionId'])
+                expired = self.pending.pop_expired()
+                if expired:
+                    _, tracked = await sync_to_async(self.resolve_events)([event for _, event in expired], expired=True)
+                    for entry in tracked:
+                        self.tracker.add(*entry)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error resolviendo eventos en espera: {e}", exc_info=True)
 
-            tx = None
-            await asyncio.sleep(base_delay)
+    async def save_checkpoint(self):
+        """
+        Guarda el último bloque procesado por completo: el anterior al evento
+        más antiguo que sigue en cola, en proceso o en espera. Sin ninguno, el
+        anterior a la última cabecera o evento recibido, por si aún llegan
+        más eventos de ese bloque. Se descuentan los CONFIRMATION_DEPTH
+        bloques que aún pueden reorganizarse, para releerlos al arrancar.
+        """
+        blocks = list(self.in_flight)
+        oldest = self.pending.oldest_block()
+        if oldest is not None:
+            blocks.append(oldest)
+        block = min(blocks, default=self.last_block) - 1 - settings.CONFIRMATION_DEPTH
+        if block > 0:
+            await sync_to_async(advance_checkpoint)(self.checkpoint_name, block)
 
-            for attempt in range(max_retries):
-                try:
-                    tx = await sync_to_async(
-                        Transaction.objects.get
-                    )(id=transaction_id, wallet_address__iexact=sender_address)
-                    break
-                except Transaction.DoesNotExist:
-                    if attempt == max_retries - 1:
-                        tx = await sync_to_async(
-                            Transaction.objects.filter(id=transaction_id).first
-                        )()
-                        if not tx:
-                            logger.error(f"Transacción {transaction_id} no existe")
-                            return
-                    else:
-                        delay = base_delay * (2 ** attempt)
-                        logger.warning(f"Transacción no encontrada (intento {attempt + 1}/{max_retries}). Reintentando en {delay}s...")
-                        await asyncio.sleep(delay)
-
-            if tx.status == 'confirmed':
-                logger.info(f"Transacción {tx.id} ya confirmada.")
-                return
+    async def handle_new_head(self, context, endpoint):
+        if self.endpoints.first_head(endpoint, context.result):
+            # Solo importa la última cabecera: si llegan varias seguidas se procesa la más reciente,
+            # y el tracker consulta al endpoint que la anunció primero
+            self.w3 = endpoint.w3
+            self.latest_header = context.result
+            # Sin pagos el checkpoint también avanza con las cabeceras
+            self.last_block = max(self.last_block, context.result['number'])
+            self.new_head.set()
 
-            # Actualizar la transacción con el hash real y marcarla como confirmada
-            tx.transaction_hash = tx_hash
-            tx.status = 'confirmed'
-            await sync_to_async(tx.save)()
-            
-            logger.info(f"Transacción {tx.id} confirmada - Hash actualizado a {tx_hash}")
+        for laggard in self.endpoints.laggards():
+            if laggard.session and not laggard.session.done():
+                logger.warning(
+                    f"{laggard.name} va {self.endpoints.best - laggard.head} bloques por detrás: se desconecta"
+                )
+                laggard.session.cancel()
 
-        except Exception as e:
-            logger.error(f"Error procesando evento: {e}", exc_info=True)
\ No newline at end of file
+    async def track_confirmations(self):
+        """Confirma en lote las transacciones que alcanzan la profundidad con cada cabecera nueva"""
+        while True:
+            await self.new_head.wait()
+            self.new_head.clear()
+            try:
+                if self.tracker_stale:
+                    await self.reload_tracker()
+                result = await self.tracker.on_head(self.w3, self.latest_header)
+                if any(result):
+                    confirmed = await sync_to_async(settle_confirmations)(*result)
+                    if confirmed:
+                        logger.info(
+                            f"Transacciones {confirmed} confirmadas con {self.tracker.depth} confirmaciones "
+                            f"({len(self.tracker)} en 'confirming')"
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Las entradas sacadas del heap pueden haberse perdido: se reconstruye desde la base de datos
+                logger.error(f"Error en el tracker de confirmaciones: {e}", exc_info=True)
+                self.tracker_stale = True
+            try:
+                await self.save_checkpoint()
+            except Exception as e:
+                logger.error(f"Error guardando el checkpoint: {e}")
+
+    async def reload_tracker(self):
+        head = self.tracker.head if getattr(self, 'tracker', None) else None
+        self.tracker = ConfirmationTracker()
+        self.tracker.head = head
+        for entry in await sync_to_async(confirming_transactions)(self.shard, self.shards):
+            self.tracker.add(*entry)
+        self.tracker_stale = False
+
+    async def report_metrics(self):
+        while True:
+            await asyncio.sleep(settings.LISTENER_METRICS_INTERVAL)
+            self.metrics.report(self.queue, len(self.pending), len(self.tracker))
+            for line in self.endpoints.report():
+                logger.info(f"Endpoint {line}")
@@ -0,0 +1,36 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments._services.reconciliation import (
+    discrepancies,
+    load_payment_events,
+    load_transactions,
+    reconcile,
+    summarize,
+)
+
+
+class Command(BaseCommand):
+    help = 'Compara las transacciones con los eventos PaymentReceived indexados y lista las diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='Fichero CSV con las filas que no cuadran')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        transactions = load_transactions()
+        events = load_payment_events()
+        loaded = time.perf_counter()
+
+        report, duplicated = reconcile(transactions, events)
+        rows = discrepancies(report)
+        summary = summarize(report, duplicated)
+        summary['load_seconds'] = round(loaded - start, 2)
+        summary['compare_seconds'] = round(time.perf_counter() - loaded, 2)
+
+        if options['output']:
+            rows.to_csv(options['output'], index=False)
+            self.stderr.write(f"{len(rows)} filas con diferencias en {options['output']}")
+        self.stdout.write(json.dumps(summary))
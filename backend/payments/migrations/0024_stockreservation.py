@@ -0,0 +1,81 @@
+# Generated by Django 5.2.5 on 2026-10-17 19:23
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, PositiveIntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+
+def _add_to_stock(Product, quantities, sign):
+    """Un único UPDATE agregado por producto, como commit_stock/restore_stock"""
+    if not quantities:
+        return
+    per_product = Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=PositiveIntegerField(),
+    )
+    if sign > 0:
+        stock = F('stock_quantity') + per_product
+    else:
+        stock = Greatest(F('stock_quantity') - per_product, Value(0))
+    Product.objects.filter(id__in=quantities).update(stock_quantity=stock)
+
+
+def convert_pending_stock_to_reservations(apps, schema_editor):
+    """Las transacciones pendientes ya habían descontado stock: se devuelve y se reserva"""
+    OrderItem = apps.get_model('payments', 'OrderItem')
+    Product = apps.get_model('company', 'Product')
+    StockReservation = apps.get_model('payments', 'StockReservation')
+
+    items = OrderItem.objects.filter(
+        transaction__status__in=['pending', 'confirming']
+    ).select_related('transaction')
+
+    quantities, reservations = defaultdict(int), []
+    for item in items:
+        quantities[item.product_id] += item.quantity
+        reservations.append(StockReservation(
+            transaction_id=item.transaction_id,
+            product_id=item.product_id,
+            quantity=item.quantity,
+            expires_at=item.transaction.created_at + settings.STOCK_RESERVATION_TTL,
+        ))
+    _add_to_stock(Product, quantities, 1)
+    StockReservation.objects.bulk_create(reservations)
+
+
+def convert_reservations_to_pending_stock(apps, schema_editor):
+    StockReservation = apps.get_model('payments', 'StockReservation')
+    Product = apps.get_model('company', 'Product')
+
+    reserved = StockReservation.objects.values('product_id').annotate(total=Sum('quantity'))
+    _add_to_stock(Product, {row['product_id']: row['total'] for row in reserved}, -1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0005_remove_product_quantity_product_stock_quantity'),
+        ('payments', '0023_remove_cart_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='company.product')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='payments.transaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'expires_at'], name='payments_st_product_ecb2c2_idx'), models.Index(fields=['expires_at'], name='payments_st_expires_8c42cd_idx')],
+            },
+        ),
+        migrations.RunPython(convert_pending_stock_to_reservations, convert_reservations_to_pending_stock),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-17 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0027_listenercheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='block_hash',
+            field=models.CharField(blank=True, max_length=66, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='block_number',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-17 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0028_transaction_block'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListenerLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('shards', models.PositiveSmallIntegerField()),
+                ('owner', models.CharField(blank=True, max_length=100)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shards', 'shard'), name='unique_listener_shard')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-17 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0029_listenerlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tx_hash', models.CharField(max_length=66)),
+                ('log_index', models.PositiveIntegerField()),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('block_hash', models.CharField(max_length=66)),
+                ('transaction_id', models.DecimalField(decimal_places=0, max_digits=78)),
+                ('sender', models.CharField(max_length=42)),
+                ('token', models.CharField(max_length=42)),
+                ('currency', models.CharField(max_length=32)),
+                ('amount', models.DecimalField(decimal_places=0, max_digits=78)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['transaction_id', 'block_number'], name='paymentevent_tx_block_idx'), models.Index(fields=['block_number'], name='paymentevent_block_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tx_hash', 'log_index'), name='unique_payment_event')],
+            },
+        ),
+    ]
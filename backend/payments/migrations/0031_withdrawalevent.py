@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0030_paymentevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WithdrawalEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tx_hash', models.CharField(max_length=66)),
+                ('log_index', models.PositiveIntegerField()),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('block_hash', models.CharField(max_length=66)),
+                ('receiver', models.CharField(max_length=42)),
+                ('token', models.CharField(max_length=42)),
+                ('amount', models.DecimalField(decimal_places=0, max_digits=78)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['block_number'], name='withdrawalevent_block_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tx_hash', 'log_index'), name='unique_withdrawal_event')],
+            },
+        ),
+    ]
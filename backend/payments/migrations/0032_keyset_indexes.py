@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0005_remove_product_quantity_product_stock_quantity'),
+        ('payments', '0031_withdrawalevent'),
+    ]
+
+    operations = [
+        # Se crean los nuevos antes de quitar los que sustituyen
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['-created_at', '-id'], name='orderitem_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet_address', '-created_at', '-id'], name='tx_wallet_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-created_at', '-id'], name='tx_created_id_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='orderitem',
+            name='orderitem_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='tx_wallet_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='tx_created_idx',
+        ),
+    ]
@@ -16,6 +16,27 @@ class Transaction(models.Model):
         ('cancelled', 'Cancelada'),    # Cancelada por el usuario o sistema        
     ], default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bloque en el que se vio el pago, para contar confirmaciones y detectar reorganizaciones
+    block_number = models.PositiveBigIntegerField(null=True, blank=True)
+    block_hash = models.CharField(max_length=66, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Historial y pendientes de una wallet
+            models.Index(fields=['wallet_address', 'status'], name='tx_wallet_status_idx'),
+            # Mismo orden que la paginación por cursor (created_at, id): el salto a la página siguiente no ordena
+            models.Index(fields=['wallet_address', '-created_at', '-id'], name='tx_wallet_created_id_idx'),
+            # Tendencias del dashboard y barrido de expiradas por estado y fecha
+            models.Index(fields=['status', 'created_at'], name='tx_status_created_idx'),
+            # Solo las transacciones abiertas, que son pocas frente al histórico
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(status__in=['pending', 'confirming']),
+                name='tx_open_created_idx',
+            ),
+            # Listado general, en el orden de la paginación por cursor
+            models.Index(fields=['-created_at', '-id'], name='tx_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.wallet_address} - {self.transaction_hash} - {self.amount} - {self.status}"
@@ -47,9 +68,137 @@ class OrderItem(models.Model):
         default='pending'
     )
 
+    class Meta:
+        indexes = [
+            # En el orden de la paginación por cursor (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='orderitem_created_id_idx'),
+        ]
+
     def __str__(self):
         return f"Order: {self.quantity} x {self.product.name} @ {self.price_at_sale}"
 
     @property
     def subtotal(self):
         return self.price_at_sale * self.quantity
+
+
+class StockReservation(models.Model):
+    """Stock retenido por una transacción pendiente hasta expires_at"""
+    transaction = models.ForeignKey(
+        'Transaction',
+        on_delete=models.CASCADE,
+        related_name='reservations'
+    )
+    product = models.ForeignKey(
+        'company.Product',
+        on_delete=models.CASCADE,
+        related_name='reservations'
+    )
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'expires_at']),
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"Reserva: {self.quantity} x {self.product_id} (tx {self.transaction_id}) hasta {self.expires_at}"
+
+
+class IdempotencyKey(models.Model):
+    """Respuesta guardada para una cabecera Idempotency-Key, reutilizada en los reintentos"""
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=64)   # endpoint
+    owner = models.CharField(max_length=64)   # usuario que envió la petición
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)  # None: en curso
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'owner', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.response_status or 'en curso'})"
+
+
+class PaymentEvent(models.Model):
+    """Evento PaymentReceived tal como se emitió en la cadena. Solo se insertan filas, nunca se modifican."""
+    tx_hash = models.CharField(max_length=66)
+    log_index = models.PositiveIntegerField()
+    block_number = models.PositiveBigIntegerField()
+    block_hash = models.CharField(max_length=66)
+    # uint256 del contrato: sin límite práctico, no tiene por qué existir la transacción
+    transaction_id = models.DecimalField(max_digits=78, decimal_places=0)
+    sender = models.CharField(max_length=42)
+    token = models.CharField(max_length=42)  # dirección del token
+    currency = models.CharField(max_length=32)
+    amount = models.DecimalField(max_digits=78, decimal_places=0)  # en la unidad mínima del token
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tx_hash', 'log_index'], name='unique_payment_event'),
+        ]
+        indexes = [
+            models.Index(fields=['transaction_id', 'block_number'], name='paymentevent_tx_block_idx'),
+            models.Index(fields=['block_number'], name='paymentevent_block_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tx_hash}#{self.log_index}: transacción {self.transaction_id}, {self.amount} {self.currency}"
+
+
+class WithdrawalEvent(models.Model):
+    """Evento Withdrawn del contrato (retirada de fondos por el propietario). Solo se insertan filas."""
+    tx_hash = models.CharField(max_length=66)
+    log_index = models.PositiveIntegerField()
+    block_number = models.PositiveBigIntegerField()
+    block_hash = models.CharField(max_length=66)
+    receiver = models.CharField(max_length=42)
+    token = models.CharField(max_length=42)
+    amount = models.DecimalField(max_digits=78, decimal_places=0)  # en la unidad mínima del token
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tx_hash', 'log_index'], name='unique_withdrawal_event'),
+        ]
+        indexes = [
+            models.Index(fields=['block_number'], name='withdrawalevent_block_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tx_hash}#{self.log_index}: {self.amount} de {self.token} a {self.receiver}"
+
+
+class ListenerCheckpoint(models.Model):
+    """Último bloque cuyos eventos ya procesó un listener; al reconectar se rellena el hueco desde aquí"""
+    name = models.CharField(max_length=100, unique=True)  # evento y contrato escuchados
+    block_number = models.PositiveBigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.block_number}"
+
+
+class ListenerLease(models.Model):
+    """Shard del listener reservado por un proceso hasta expires_at; se renueva con cada latido"""
+    shard = models.PositiveSmallIntegerField()
+    shards = models.PositiveSmallIntegerField()  # número total de shards del despliegue
+    owner = models.CharField(max_length=100, blank=True)  # host:pid del proceso
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shards', 'shard'], name='unique_listener_shard'),
+        ]
+
+    def __str__(self):
+        return f"Shard {self.shard}/{self.shards}: {self.owner or 'libre'} hasta {self.expires_at}"
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Transaction
+from ._services.pending_events import WAITED_STATUSES, announce_transaction
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, **kwargs):
+    # El listener puede tener eventos esperando a que esta transacción sea visible
+    if instance.status in WAITED_STATUSES:
+        announce_transaction(instance.id)
@@ -1,3 +1,1539 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+from web3.exceptions import TransactionNotFound, Web3RPCError
+
+from company.models import Product
+from users.models import UserProfile
+from . import async_views
+from .decorators import idempotent
+from .management.commands.check_pending_transactions import Command as CheckPendingCommand
+from .management.commands.listener import Command as ListenerCommand
+from .models import (
+    IdempotencyKey, ListenerCheckpoint, ListenerLease, OrderItem, PaymentEvent, StockReservation, Transaction,
+    WithdrawalEvent,
+)
+from ._services.chain_cache import get_receipt
+from ._services.checkpoints import advance_checkpoint
+from ._services.confirmations import (
+    ConfirmationTracker,
+    accept_payments,
+    confirming_transactions,
+    settle_confirmations,
+)
+from ._services.leases import ShardLayoutConflict, acquire_shard, release_shard, renew_shard
+from ._services.checkout import CheckoutError, create_pending_transaction
+from ._services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from ._services.exports import stream_export
+from ._services.idempotency import purge_expired_keys
+from ._services.indexer import ChainIndexer
+from ._services.log_scanner import LogScanner, covering_ranges
+from ._services.pagination import PaginationError, keyset_page, seek
+from ._services.payment_events import record_payment_events
+from ._services.pending_events import PendingEventBuffer, TransactionNotifications
+from ._services import web3_client
+from ._services.reconciliation import (
+    OUT_OF_RANGE_ID,
+    discrepancies,
+    load_payment_events,
+    load_transactions,
+    reconcile,
+    summarize,
+)
+from ._services.ws_endpoints import Endpoint, EndpointPool
+from ._services.inventory import confirm_transactions, fail_transactions, purge_expired_reservations, with_available_stock
+
+
+def _wallet(n):
+    return '0x' + f'{n:040x}'
+
+
+class CheckoutTests(TestCase):
+
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Producto {i}', amount_usd=Decimal('10.00'), stock_quantity=50)
+            for i in range(20)
+        ]
+
+    def _checkout(self, wallet, products, quantity=1):
+        return create_pending_transaction(
+            wallet_address=wallet,
+            amount=Decimal('1'),
+            token='USDT',
+            cart_items=[{'product_id': p.id, 'quantity': quantity} for p in products],
+            transaction_hash=wallet,
+        )
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self._checkout(_wallet(1), self.products[:1])
+        with CaptureQueriesContext(connection) as large:
+            self._checkout(_wallet(2), self.products)
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(OrderItem.objects.filter(transaction__wallet_address=_wallet(2)).count(), 20)
+
+    def test_second_buyer_of_the_last_unit_is_rejected_after_the_ordered_lock(self):
+        last = Product.objects.create(name='Última unidad', amount_usd=Decimal('10.00'), stock_quantity=1)
+        with CaptureQueriesContext(connection) as queries:
+            self._checkout(_wallet(1), [last, self.products[0]])
+
+        # Los productos se bloquean en orden de id aunque el carrito venga desordenado
+        lock = next(q['sql'] for q in queries if 'FROM "company_product"' in q['sql'])
+        self.assertIn('ORDER BY "company_product"."id" ASC', lock)
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', lock)
+
+        with self.assertRaises(CheckoutError) as error:
+            self._checkout(_wallet(2), [last])
+        self.assertIn('Disponible: 0', str(error.exception))
+        self.assertEqual(OrderItem.objects.filter(product=last).count(), 1)
+
+    def test_catalog_shows_stock_net_of_reservations(self):
+        product = self.products[0]
+        self._checkout(_wallet(1), [product], quantity=3)
+
+        listed = {row['id']: row for row in self.client.get('/api/company/products/').json()}
+        detail = self.client.get(f'/api/company/products/{product.id}/').json()
+
+        self.assertEqual(listed[product.id]['stock_quantity'], 50)
+        self.assertEqual(listed[product.id]['available_stock'], 47)
+        self.assertEqual(detail['available_stock'], 47)
+
+    def test_confirming_after_the_reservation_expired_reports_the_oversell(self):
+        product = Product.objects.create(name='Última unidad', amount_usd=Decimal('10.00'), stock_quantity=1)
+        late, _ = self._checkout(_wallet(1), [product])
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        other, _ = self._checkout(_wallet(2), [product])
+        confirm_transactions([other.id])
+
+        with self.assertLogs('payments._services.inventory', level='WARNING') as logs:
+            confirm_transactions([late.id])
+
+        self.assertIn('Sobreventa', logs.output[0])
+        self.assertIn(f'{product.id}: 1', logs.output[0])
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 0)
+
+    def _available(self, product):
+        return with_available_stock(Product.objects.filter(id=product.id)).get().available_stock
+
+    def test_stock_is_reserved_and_totals_computed(self):
+        tx, items_count = self._checkout(_wallet(1), self.products[:2], quantity=3)
+
+        self.assertEqual(items_count, 2)
+        self.assertEqual(tx.amount_usd, Decimal('60.00'))
+        for product in self.products[:2]:
+            product.refresh_from_db()
+            self.assertEqual(product.stock_quantity, 50)
+            self.assertEqual(self._available(product), 47)
+
+    def test_expired_reservations_stop_holding_stock(self):
+        product = self.products[0]
+        self._checkout(_wallet(1), [product], quantity=50)
+        with self.assertRaises(CheckoutError):
+            self._checkout(_wallet(2), [product])
+
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self._available(product), 50)
+        self._checkout(_wallet(3), [product])
+
+        self.assertEqual(purge_expired_reservations(), 1)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_confirmation_consumes_reserved_stock_once(self):
+        product = self.products[0]
+        tx, _ = self._checkout(_wallet(1), [product], quantity=4)
+
+        self.assertEqual(confirm_transactions([tx.id], {tx.id: '0x' + 'ab' * 32}), [tx.id])
+        self.assertEqual(confirm_transactions([tx.id]), [])
+
+        product.refresh_from_db()
+        tx.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 46)
+        self.assertEqual(self._available(product), 46)
+        self.assertEqual(tx.status, 'confirmed')
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_bulk_failure_uses_constant_queries_and_restocks_only_confirmed(self):
+        small = [self._checkout(_wallet(n), self.products[:2])[0].id for n in range(1, 3)]
+        large = [self._checkout(_wallet(n), self.products)[0].id for n in range(3, 13)]
+        confirmed, _ = self._checkout(_wallet(20), self.products[:1], quantity=5)
+        confirm_transactions([confirmed.id])
+
+        with CaptureQueriesContext(connection) as few:
+            fail_transactions(small)
+        with CaptureQueriesContext(connection) as many:
+            failed, released = fail_transactions(large + [confirmed.id])
+
+        # La confirmada no se toca por defecto y el número de consultas no depende del lote
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(failed, large)
+        self.assertEqual(released, 200)
+        self.assertFalse(OrderItem.objects.filter(transaction_id__in=small + large).exclude(status='cancelled').exists())
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock_quantity, 45)
+
+        # Revertir una confirmada devuelve al stock lo que ya se había descontado
+        fail_transactions([confirmed.id], statuses=('confirmed',))
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock_quantity, 50)
+        self.assertTrue(Transaction.objects.get(id=confirmed.id).transaction_hash.startswith(f'failed_{confirmed.id}_'))
+
+    def test_insufficient_stock_rolls_back_everything(self):
+        with self.assertRaises(CheckoutError):
+            self._checkout(_wallet(1), self.products[:2], quantity=51)
+
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(Product.objects.filter(stock_quantity=50).count(), 20)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """Cientos de carritos compitiendo por el mismo producto no pueden perder ni sobrevender stock"""
+
+    carts = 300
+    workers = 32
+    stock = 120
+
+    def _buy(self, n, product_id):
+        try:
+            create_pending_transaction(
+                wallet_address=_wallet(n),
+                amount=Decimal('1'),
+                token='USDT',
+                cart_items=[{'product_id': product_id, 'quantity': 1}],
+                transaction_hash=_wallet(n),
+            )
+            return True
+        except CheckoutError:
+            return False
+        finally:
+            connection.close()
+
+    def test_concurrent_checkouts_never_oversell(self):
+        product = Product.objects.create(name='Oferta', amount_usd=Decimal('5.00'), stock_quantity=self.stock)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(lambda n: self._buy(n, product.id), range(self.carts)))
+
+        self.assertEqual(sum(results), self.stock)
+        self.assertEqual(with_available_stock(Product.objects.filter(id=product.id)).get().available_stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), self.stock)
+
+
+class CircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker('test', failure_rate=0.5, min_calls=4, open_seconds=30)
+
+    def _fail(self):
+        raise ConnectionError("proveedor caído")
+
+    def test_opens_after_failure_rate_and_fails_fast(self):
+        self.breaker.call(lambda: 'ok')
+        self.breaker.call(lambda: 'ok')
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.breaker.call(self._fail)
+
+        self.assertEqual(self.breaker.state(), CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: self.fail("no debería llamarse al proveedor"))
+
+    def test_a_failed_slow_call_counts_once(self):
+        for _ in range(3):
+            self.breaker.call(lambda: 'ok')
+        self.breaker.record(self.breaker.slow_call_seconds + 1, failed=True)
+
+        # 1 de 4 llamadas mala: 25 %, por debajo del 50 %
+        self.assertEqual(self.breaker.stats(), {'calls': 4, 'failures': 1, 'slow': 1, 'bad': 1})
+        self.assertEqual(self.breaker.state(), CircuitBreaker.CLOSED)
+
+    def test_half_open_probe_closes_the_circuit(self):
+        self.breaker._open("prueba")
+        cache.set(self.breaker._state_key(), 0, timeout=None)  # ya ha pasado open_seconds
+        self.assertEqual(self.breaker.state(), CircuitBreaker.HALF_OPEN)
+
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.breaker.state(), CircuitBreaker.CLOSED)
+
+
+@override_settings(WEB3_PROVIDER='http://127.0.0.1:8545', WEB3_PROVIDER_TIMEOUT=7, WEB3_HTTP_POOL_SIZE=3,
+                   WEB3_HEALTH_TTL=30, WEB3_UNHEALTHY_TTL=5)
+class Web3ClientTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        web3_client.reset_web3_client()
+        self.addCleanup(web3_client.reset_web3_client)
+
+    def test_client_is_shared_and_configured_from_settings(self):
+        client = web3_client.get_web3()
+
+        self.assertIs(web3_client.get_web3(), client)
+        self.assertEqual(client.provider.endpoint_uri, 'http://127.0.0.1:8545')
+        self.assertEqual(client.provider.get_request_kwargs()['timeout'], 7)
+        adapter = client.provider._request_session_manager.cache_and_return_session(
+            client.provider.endpoint_uri
+        ).get_adapter('http://127.0.0.1:8545')
+        self.assertEqual(adapter._pool_maxsize, 3)
+
+        with override_settings(WEB3_PROVIDER=None):
+            with self.assertRaises(web3_client.Web3ProviderNotConfigured):
+                web3_client.get_web3()
+
+    def test_health_is_cached_for_its_ttl(self):
+        client = web3_client.get_web3()
+        now = [1000.0]
+        with patch.object(client, 'is_connected', return_value=True) as is_connected, \
+                patch.object(web3_client.time, 'monotonic', side_effect=lambda: now[0]):
+            self.assertTrue(web3_client.provider_is_healthy())
+            now[0] += 29
+            self.assertTrue(web3_client.provider_is_healthy())
+            self.assertEqual(is_connected.call_count, 1)
+
+            now[0] += 2
+            is_connected.return_value = False
+            self.assertFalse(web3_client.provider_is_healthy())
+            # Caído se vuelve a comprobar antes: WEB3_UNHEALTHY_TTL
+            now[0] += 4
+            self.assertFalse(web3_client.provider_is_healthy())
+            now[0] += 2
+            is_connected.return_value = True
+            self.assertTrue(web3_client.provider_is_healthy())
+            self.assertEqual(is_connected.call_count, 3)
+
+
+class HungProviderTests(TestCase):
+    """Proveedor que acepta la conexión y nunca responde"""
+
+    def setUp(self):
+        cache.clear()
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(16)
+        self.addCleanup(self.server.close)
+        url = 'http://127.0.0.1:%d' % self.server.getsockname()[1]
+
+        web3_client.reset_web3_client()
+        self.addCleanup(web3_client.reset_web3_client)
+        self.addCleanup(web3_client.provider_breaker.reset)
+        settings_override = override_settings(WEB3_PROVIDER=url, WEB3_PROVIDER_TIMEOUT=0.3)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for name, value in {'min_calls': 3, 'failure_rate': 0.5}.items():
+            patcher = patch.object(web3_client.provider_breaker, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_each_request_fails_within_one_timeout_and_the_circuit_opens(self):
+        client = web3_client.get_web3()
+        for _ in range(3):
+            start = time.monotonic()
+            with self.assertRaises(Exception) as error:
+                client.eth.get_transaction_receipt('0x' + 'ab' * 32)
+            self.assertNotIsInstance(error.exception, CircuitOpenError)
+            self.assertLess(time.monotonic() - start, 1)
+
+        self.assertEqual(web3_client.provider_breaker.stats()['failures'], 3)
+        with self.assertRaises(CircuitOpenError):
+            client.eth.get_transaction_receipt('0x' + 'ab' * 32)
+
+    def test_async_client_does_not_retry_either(self):
+        async def receipt():
+            start = time.monotonic()
+            with self.assertRaises(Exception):
+                await web3_client.get_async_web3().eth.get_transaction_receipt('0x' + 'ab' * 32)
+            return time.monotonic() - start
+
+        self.assertLess(run_async(receipt()), 1)
+
+
+class FakeEth:
+    """Nodo simulado que cuenta las llamadas RPC"""
+
+    def __init__(self, receipts, block_number=1000):
+        self.receipts = receipts
+        self.block_number = block_number
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get_transaction_receipt(self, tx_hash):
+        with self._lock:
+            self.calls += 1
+        time.sleep(0.05)
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.receipts[tx_hash]
+
+
+class ChainCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.mined = '0x' + 'aa' * 32
+        self.w3 = AttributeDict({'eth': FakeEth({self.mined: AttributeDict({'blockNumber': 10, 'status': 1})})})
+
+    def test_concurrent_lookups_share_one_rpc_call_and_final_receipts_stay_cached(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            receipts = list(pool.map(lambda _: get_receipt(self.w3, self.mined), range(8)))
+
+        self.assertTrue(all(r['status'] == 1 for r in receipts))
+        self.assertEqual(self.w3.eth.calls, 1)
+        get_receipt(self.w3, self.mined)
+        self.assertEqual(self.w3.eth.calls, 1)
+
+    def test_unmined_hashes_are_negatively_cached(self):
+        pending = '0x' + 'bb' * 32
+        for _ in range(3):
+            with self.assertRaises(TransactionNotFound):
+                get_receipt(self.w3, pending)
+        self.assertEqual(self.w3.eth.calls, 1)
+
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.user = User.objects.create_user('comprador', password='x')
+        self.calls = 0
+
+        @api_view(['POST'])
+        @idempotent('test')
+        def view(request):
+            self.calls += 1
+            return Response({'success': True, 'call': self.calls}, status=201)
+
+        self.view = view
+        self.factory = APIRequestFactory()
+
+    def _post(self, body, key='clave-1'):
+        request = self.factory.post('/pagos/', body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def test_retry_replays_original_response(self):
+        first = self._post({'amount': '1'})
+        retry = self._post({'amount': '1'})
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_same_key_with_different_body_is_rejected(self):
+        self._post({'amount': '1'})
+        self.assertEqual(self._post({'amount': '2'}).status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_key_of_a_request_that_never_finished_is_released_after_the_lease(self):
+        self._post({'amount': '1'})
+        # El worker murió a mitad de petición: la clave quedó en curso
+        IdempotencyKey.objects.update(response_status=None, response_body=None,
+                                      expires_at=timezone.now() + settings.IDEMPOTENCY_LEASE)
+        self.assertEqual(self._post({'amount': '1'}).status_code, 409)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(self._post({'amount': '1'}).status_code, 201)
+        self.assertEqual(self.calls, 2)
+
+    def test_saved_response_is_kept_for_the_key_ttl(self):
+        started = timezone.now()
+        self._post({'amount': '1'})
+
+        expires_at = IdempotencyKey.objects.get().expires_at
+        self.assertGreaterEqual(expires_at, started + settings.IDEMPOTENCY_KEY_TTL)
+
+    def test_expired_keys_are_purged(self):
+        self._post({'amount': '1'})
+        self.assertEqual(purge_expired_keys(now=timezone.now() + timedelta(days=2)), 1)
+        self._post({'amount': '1'})
+        self.assertEqual(self.calls, 2)
+
+
+@override_settings(WEB3_PROVIDER='http://127.0.0.1:8545')
+class AsyncPaymentViewTests(TestCase):
+    """Vistas async del perfil ASGI: mismos contratos que las vistas DRF"""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        cache.clear()
+        self.wallet = _wallet(1)
+        self.user = User.objects.create_user('comprador')
+        UserProfile.objects.create(user=self.user, wallet_address=self.wallet)
+        self.product = Product.objects.create(name='Producto', amount_usd=Decimal('10.00'), stock_quantity=5)
+        self.factory = AsyncRequestFactory()
+        self.token = f'Bearer {AccessToken.for_user(self.user)}'
+
+        healthy = patch.object(async_views, 'aprovider_is_healthy', side_effect=self._healthy)
+        healthy.start()
+        self.addCleanup(healthy.stop)
+
+    async def _healthy(self, force=False):
+        return True
+
+    def _register_body(self):
+        return {
+            'wallet_address': self.wallet, 'amount': '0.01', 'token': 'ETH',
+            'cart_items': [{'product_id': self.product.id, 'quantity': 2}],
+        }
+
+    async def _register(self, body, authorization=None, key=None):
+        headers = {'Authorization': authorization or self.token}
+        if key:
+            headers['Idempotency-Key'] = key
+        request = self.factory.post('/api/payments/register-transaction', body,
+                                    content_type='application/json', headers=headers)
+        return await async_views.register_transaction(request)
+
+    async def _update(self, transaction_id, sender):
+        body = {'wallet_address': self.wallet, 'amount': '0.01', 'transaction_hash': '0x' + 'ab' * 32, 'token': 'ETH'}
+        started = {'receipt': asyncio.Event(), 'tx': asyncio.Event()}
+
+        # Cada consulta espera a que la otra haya empezado: solo terminan si se piden a la vez
+        async def receipt(web3, tx_hash):
+            started['receipt'].set()
+            await asyncio.wait_for(started['tx'].wait(), timeout=1)
+            return AttributeDict({'status': 1})
+
+        async def transaction(web3, tx_hash):
+            started['tx'].set()
+            await asyncio.wait_for(started['receipt'].wait(), timeout=1)
+            return AttributeDict({'from': sender})
+
+        request = self.factory.put(f'/api/payments/update-transaction/{transaction_id}', body,
+                                   content_type='application/json', headers={'Authorization': self.token})
+        with patch.object(async_views, 'get_async_web3'), \
+                patch.object(async_views, 'aget_receipt', receipt), \
+                patch.object(async_views, 'aget_transaction', transaction):
+            return await async_views.update_transaction(request, transaction_id)
+
+    async def test_missing_or_invalid_token_is_rejected(self):
+        request = self.factory.post('/api/payments/register-transaction', self._register_body(),
+                                    content_type='application/json')
+        self.assertEqual((await async_views.register_transaction(request)).status_code, 401)
+        self.assertEqual((await self._register(self._register_body(), authorization='Bearer roto')).status_code, 401)
+        self.assertFalse(await Transaction.objects.aexists())
+
+    async def test_register_creates_the_order_and_replays_on_retry(self):
+        first = await self._register(self._register_body(), key='clave-1')
+        retry = await self._register(self._register_body(), key='clave-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(json.loads(first.content)['items_count'], 1)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        self.assertEqual(await Transaction.objects.acount(), 1)
+        self.assertEqual(await StockReservation.objects.filter(product=self.product).acount(), 1)
+
+    async def test_update_fetches_receipt_and_transaction_concurrently(self):
+        registered = json.loads((await self._register(self._register_body())).content)
+
+        response = await self._update(registered['transaction_id'], self.wallet.upper().replace('0X', '0x'))
+
+        self.assertEqual(response.status_code, 200)
+        tx = await Transaction.objects.aget(id=registered['transaction_id'])
+        self.assertEqual(tx.transaction_hash, '0x' + 'ab' * 32)
+
+    async def test_update_rejects_a_different_sender(self):
+        registered = json.loads((await self._register(self._register_body())).content)
+
+        response = await self._update(registered['transaction_id'], _wallet(2))
+
+        self.assertEqual(response.status_code, 400)
+        tx = await Transaction.objects.aget(id=registered['transaction_id'])
+        self.assertEqual(tx.transaction_hash, self.wallet)
+
+    async def test_open_circuit_answers_503_with_retry_after(self):
+        async def circuit_open(web3, tx_hash):
+            raise CircuitOpenError('web3_provider', retry_after=12)
+
+        body = {'wallet_address': self.wallet, 'amount': '0.01', 'transaction_hash': '0x' + 'ab' * 32, 'token': 'ETH'}
+        request = self.factory.put('/api/payments/update-transaction/1', body,
+                                   content_type='application/json', headers={'Authorization': self.token})
+        with patch.object(async_views, 'get_async_web3'), \
+                patch.object(async_views, 'aget_receipt', circuit_open), \
+                patch.object(async_views, 'aget_transaction', circuit_open):
+            response = await async_views.update_transaction(request, 1)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '12')
+
+    async def test_transaction_detail(self):
+        registered = json.loads((await self._register(self._register_body())).content)
+
+        found = await async_views.get_transaction_detail(self.factory.get('/'), self.wallet)
+        missing = await async_views.get_transaction_detail(self.factory.get('/'), '0x' + 'cd' * 32)
+
+        self.assertEqual(found.status_code, 200)
+        data = json.loads(found.content)['data']
+        self.assertEqual(data['wallet_address'], self.wallet)
+        self.assertEqual(data['order_items'][0]['quantity'], 2)
+        self.assertEqual(missing.status_code, 404)
+        self.assertTrue(registered['success'])
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        same_moment = timezone.now()
+        self.transactions = Transaction.objects.bulk_create([
+            Transaction(transaction_hash=_wallet(n), wallet_address=_wallet(1), amount=Decimal('1'),
+                        status='confirmed' if n % 2 else 'failed')
+            for n in range(7)
+        ])
+        # Varias filas con el mismo created_at: el id desempata
+        Transaction.objects.update(created_at=same_moment)
+
+    def _page(self, **params):
+        request = RequestFactory().get('/', params)
+        return keyset_page(request, Transaction.objects.all())
+
+    def test_pages_cover_every_row_once_even_if_rows_are_inserted(self):
+        seen = []
+        rows, page = self._page(page_size=3)
+        seen += rows
+        Transaction.objects.create(transaction_hash=_wallet(99), wallet_address=_wallet(1), amount=Decimal('1'))
+        while page['has_more']:
+            rows, page = self._page(page_size=3, cursor=page['next_cursor'])
+            seen += rows
+
+        self.assertEqual(sorted(tx.id for tx in seen), sorted(tx.id for tx in Transaction.objects.exclude(transaction_hash=_wallet(99))))
+        self.assertIsNone(page['next_cursor'])
+
+    def test_next_page_is_read_from_an_index_in_cursor_order(self):
+        cursor = (timezone.now(), self.transactions[3].id)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as db:
+                # Con tan pocas filas el planificador preferiría leer la tabla entera
+                db.execute('SET LOCAL enable_seqscan = off')
+                db.execute('SET LOCAL enable_bitmapscan = off')
+
+        for queryset, index in (
+            (Transaction.objects.all(), 'tx_created_id_idx'),
+            (Transaction.objects.filter(wallet_address=_wallet(1)), 'tx_wallet_created_id_idx'),
+            (OrderItem.objects.all(), 'orderitem_created_id_idx'),
+        ):
+            plan = seek(queryset, cursor)[:3].explain()
+            self.assertIn(index, plan)
+            # Ni ordenación en SQLite (TEMP B-TREE) ni en PostgreSQL (Sort)
+            self.assertNotIn('TEMP B-TREE', plan)
+            self.assertNotIn('Sort', plan)
+
+    def test_user_detail_counts_transactions_by_status(self):
+        from django.contrib.auth.models import User
+        from company.views import get_user_by_wallet
+        UserProfile.objects.create(user=User.objects.create_user('comprador'), wallet_address=_wallet(1))
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=User.objects.create_user('admin', is_staff=True))
+
+        response = get_user_by_wallet(request, _wallet(1))
+
+        self.assertEqual(response.data['transaction_counts'], {'confirmed': 3, 'failed': 4})
+
+    def test_status_filter_and_invalid_parameters(self):
+        rows, _ = self._page(status='failed')
+        self.assertEqual({tx.status for tx in rows}, {'failed'})
+
+        for params in ({'cursor': 'no-es-un-cursor'}, {'page_size': '0'}, {'created_from': '2024-13-01'}):
+            with self.assertRaises(PaginationError):
+                self._page(**params)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        user = User.objects.create_user('comprador', email='c@example.com', password='x')
+        UserProfile.objects.create(user=user, wallet_address=_wallet(1))
+        product = Product.objects.create(name='Producto', amount_usd=Decimal('10.00'), stock_quantity=50)
+        for n, tx_status in enumerate(['confirmed', 'confirmed', 'pending', 'failed']):
+            tx = Transaction.objects.create(transaction_hash=_wallet(100 + n), wallet_address=_wallet(1),
+                                            amount=Decimal('1.5'), amount_usd=Decimal('10.00'), status=tx_status)
+            OrderItem.objects.create(transaction=tx, product=product, quantity=1, price_at_sale=Decimal('10.00'))
+
+    def _export(self, dataset, file_format, params=None):
+        return b''.join(stream_export(dataset, file_format, params, chunk_size=3))
+
+    def test_formats_contain_every_row(self):
+        import pyarrow.parquet as pq
+
+        lines = self._export('transactions', 'ndjson').splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(json.loads(lines[0])['amount'], '1.500000000000000000')
+
+        rows = list(csv.DictReader(io.StringIO(self._export('order_items', 'csv').decode())))
+        self.assertEqual(len(rows), 4)
+
+        table = pq.read_table(io.BytesIO(self._export('transactions', 'parquet', {'status': 'confirmed'})))
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(pq.ParquetFile(io.BytesIO(self._export('transactions', 'parquet'))).num_row_groups, 2)
+
+    def test_user_summary_is_a_single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            summary = json.loads(self._export('user_summary', 'ndjson'))
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual((summary['confirmed'], summary['pending'], summary['failed']), (2, 1, 1))
+        self.assertEqual(Decimal(summary['total_spent']), Decimal('3'))
+
+
+class InvoiceCacheTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        storages = {**settings.STORAGES, 'invoices': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': self.media},
+        }}
+        self.enterContext(override_settings(STORAGES=storages))
+        product = Product.objects.create(name='Producto', amount_usd=Decimal('10.00'), stock_quantity=50)
+        self.tx = Transaction.objects.create(transaction_hash=_wallet(1), wallet_address=_wallet(1),
+                                             amount=Decimal('1'), status='confirmed')
+        OrderItem.objects.create(transaction=self.tx, product=product, quantity=2, price_at_sale=Decimal('10.00'))
+        self.url = f'/api/payments/generate-invoice/{self.tx.id}'
+
+    def test_repeat_downloads_are_served_from_storage_and_revalidated(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(b''.join(first.streaming_content).startswith(b'%PDF'))
+
+        with patch('payments._services.invoices.render_invoice') as render:
+            second = self.client.get(self.url)
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        render.assert_not_called()
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_status_change_produces_a_new_version(self):
+        etag = self.client.get(self.url)['ETag']
+        Transaction.objects.filter(id=self.tx.id).update(status='failed')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(os.listdir(os.path.join(self.media, 'invoices', str(self.tx.id)))), 1)
+
+    def test_batch_command_prewarms_the_view_cache(self):
+        call_command('generate_invoices', workers=1, stdout=io.StringIO())
+
+        with patch('payments._services.invoices.render_invoice') as render:
+            response = self.client.get(self.url)
+        render.assert_not_called()
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_rendering_does_not_mutate_shared_styles(self):
+        from ._services import invoices
+
+        invoices.render_invoice_bytes(invoices.invoice_snapshot(self.tx))
+        self.assertEqual(invoices.STYLES['Normal'].fontSize, 10)
+
+
+class FakePaymentEvent:
+    """PaymentReceived.get_logs con un límite de bloques por llamada, como los proveedores reales"""
+
+    def __init__(self, logs, max_blocks=4):
+        self.logs = logs
+        self.max_blocks = max_blocks
+        self.calls = 0
+
+    async def get_logs(self, from_block, to_block, argument_filters=None):
+        self.calls += 1
+        if to_block - from_block + 1 > self.max_blocks:
+            raise Web3RPCError('query returned more than 10000 results')
+        return [log for log in self.logs if from_block <= log['blockNumber'] <= to_block]
+
+
+def _payment_args(tx_id, sender):
+    return {
+        'transactionId': tx_id, 'sender': sender, 'token': '0x' + '0' * 40, 'currency': 'ETH', 'amount': 10 ** 18,
+    }
+
+
+def _payment_log(tx_id, block):
+    return AttributeDict({
+        'blockNumber': block,
+        'transactionHash': HexBytes(tx_id.to_bytes(32, 'big')),
+        'logIndex': 0,
+        'blockHash': HexBytes(block.to_bytes(32, 'big')),
+        'args': AttributeDict(_payment_args(tx_id, _wallet(tx_id))),
+    })
+
+
+def run_async(coro):
+    """asyncio.run y cierre de la conexión que sync_to_async abre en su hilo"""
+    try:
+        return asyncio.run(coro)
+    finally:
+        asyncio.run(sync_to_async(connections.close_all)())
+
+
+class LogScannerTests(TestCase):
+
+    def test_covering_ranges_respect_the_span(self):
+        self.assertEqual(covering_ranges([5, 1, 3, 20, 21, 3], max_span=5), [(1, 5), (20, 21)])
+
+    def test_rejected_ranges_are_split_until_the_provider_accepts_them(self):
+        event = FakePaymentEvent([_payment_log(n, n) for n in range(1, 21)], max_blocks=4)
+        logs = asyncio.run(LogScanner(event, max_span=16, timeout=1).scan(1, 20))
+
+        self.assertEqual(sorted(log['args']['transactionId'] for log in logs), list(range(1, 21)))
+        self.assertLess(event.calls, 20)
+
+
+class FakeAsyncWeb3:
+
+    def __init__(self, *args, **kwargs):
+        self.eth = SimpleNamespace(contract=lambda **kwargs: FakeAsyncWeb3.contract, get_block_number=self.head)
+
+    async def head(self):
+        return 1_000_000
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def is_connected(self):
+        return True
+
+
+class PendingCheckerTests(TransactionTestCase):
+
+    def setUp(self):
+        old = timezone.now() - timedelta(minutes=5)
+        self.transactions = Transaction.objects.bulk_create([
+            Transaction(transaction_hash='0x' + f'{n:064x}', wallet_address=_wallet(n), amount=Decimal('1'))
+            for n in range(30)
+        ])
+        Transaction.objects.update(created_at=old)
+        self.ids = list(Transaction.objects.values_list('id', flat=True))
+        # Bloques repartidos en dos zonas alejadas; solo los ids pares emitieron PaymentReceived
+        self.blocks = {tx_id: (1000 if tx_id % 2 else 5000) + tx_id for tx_id in self.ids}
+        self.event = FakePaymentEvent(
+            [_payment_log(tx_id, self.blocks[tx_id]) for tx_id in self.ids if tx_id % 2 == 0], max_blocks=500
+        )
+        FakeAsyncWeb3.contract = SimpleNamespace(events=SimpleNamespace(PaymentReceived=self.event))
+        self.running = self.peak = 0
+
+    def shared_client(self):
+        """El comando usa el cliente compartido del proceso: aquí uno falso y sano"""
+        return patch.multiple(
+            'payments.management.commands.check_pending_transactions',
+            get_async_web3=FakeAsyncWeb3,
+            aprovider_is_healthy=AsyncMock(return_value=True),
+        )
+
+    async def fake_fetch_receipt(self, w3, tx):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if tx.id % 5 == 0:
+            return 'skipped'
+        return AttributeDict({'blockNumber': self.blocks[tx.id], 'status': 1})
+
+    def test_receipts_are_fetched_concurrently_and_logs_scanned_by_range(self):
+        command = CheckPendingCommand()
+        with self.shared_client(), patch.object(command, 'fetch_receipt', self.fake_fetch_receipt):
+            result = run_async(command.async_handler(concurrency=5))
+
+        skipped = {i for i in self.ids if i % 5 == 0}
+        confirmed = {i for i in self.ids if i % 2 == 0} - skipped
+        self.assertEqual(self.peak, 5)
+        self.assertEqual(self.event.calls, 2)
+        self.assertEqual((result['confirmed'], result['skipped']), (len(confirmed), len(skipped)))
+        self.assertEqual(set(Transaction.objects.filter(status='confirmed').values_list('id', flat=True)), confirmed)
+        self.assertEqual(Transaction.objects.filter(status='failed').count(), 30 - len(confirmed) - len(skipped))
+
+    def test_stored_events_are_matched_without_scanning_the_chain(self):
+        record_payment_events(self.event.logs)
+        record_payment_events(self.event.logs)  # repetir no duplica
+        self.assertEqual(PaymentEvent.objects.count(), 15)
+
+        command = CheckPendingCommand()
+        with self.shared_client(), patch.object(command, 'fetch_receipt', self.fake_fetch_receipt), \
+                patch.object(LogScanner, 'scan_blocks', autospec=True, return_value=[]) as scan_blocks:
+            result = run_async(command.async_handler(concurrency=5))
+
+        # Solo se buscan en la cadena los recibos sin evento guardado (ids impares)
+        scanned = scan_blocks.call_args.args[1]
+        self.assertEqual(scanned, {self.blocks[i] for i in self.ids if i % 2 and i % 5})
+        self.assertEqual(result['confirmed'], len({i for i in self.ids if i % 2 == 0 and i % 5}))
+
+    def test_open_circuit_leaves_transactions_pending(self):
+        command = CheckPendingCommand()
+        with self.shared_client(), patch(
+            'payments.management.commands.check_pending_transactions.aget_receipt',
+            AsyncMock(side_effect=CircuitOpenError('web3_provider', retry_after=5)),
+        ):
+            result = run_async(command.async_handler(concurrency=5))
+
+        self.assertEqual((result['skipped'], result['failed']), (30, 0))
+        self.assertEqual(Transaction.objects.filter(status='pending').count(), 30)
+
+    @override_settings(CONFIRMATION_DEPTH=12)
+    def test_confirming_transactions_are_recovered_at_depth(self):
+        confirming = [tx_id for tx_id in self.ids if tx_id % 2 == 0][:3]
+        Transaction.objects.filter(id__in=confirming).update(status='confirming', block_number=None)
+        # El primero ya tiene 12 confirmaciones; el segundo aún no; el pago del tercero salió de la cadena
+        head = self.blocks[confirming[0]] + 11
+        receipts = {
+            confirming[0]: AttributeDict({'blockNumber': self.blocks[confirming[0]], 'status': 1}),
+            confirming[1]: AttributeDict({
+                'blockNumber': head - 5, 'blockHash': HexBytes(b'\x0c' * 32), 'status': 1,
+            }),
+        }
+        self.event.logs.append(_payment_log(confirming[1], head - 5))
+        Transaction.objects.exclude(id__in=confirming).update(status='confirmed')
+
+        async def fetch_receipt(w3, tx):
+            return receipts.get(tx.id, 'dropped')
+
+        command = CheckPendingCommand()
+        with self.shared_client(), patch.object(command, 'fetch_receipt', fetch_receipt), \
+                patch.object(FakeAsyncWeb3, 'head', AsyncMock(return_value=head)):
+            result = run_async(command.async_handler())
+
+        self.assertEqual((result['confirmed'], result['confirming'], result['failed']), (1, 2, 0))
+        statuses = dict(Transaction.objects.filter(id__in=confirming).values_list('id', 'status'))
+        self.assertEqual([statuses[tx_id] for tx_id in confirming], ['confirmed', 'confirming', 'confirming'])
+        self.assertEqual(Transaction.objects.get(id=confirming[1]).block_number, head - 5)
+
+    def test_dropped_payment_fails_after_the_confirming_timeout(self):
+        tx_id = self.ids[0]
+        Transaction.objects.filter(id=tx_id).update(status='confirming', created_at=timezone.now() - timedelta(hours=2))
+        Transaction.objects.exclude(id=tx_id).update(status='confirmed')
+
+        command = CheckPendingCommand()
+        with self.shared_client(), patch(
+            'payments.management.commands.check_pending_transactions.aget_receipt', AsyncMock(return_value=None)
+        ):
+            result = run_async(command.async_handler())
+
+        self.assertEqual(result['failed'], 1)
+        self.assertEqual(Transaction.objects.get(id=tx_id).status, 'failed')
+
+    @override_settings(WEB3_PROVIDER=None)
+    def test_without_provider_nothing_is_checked(self):
+        result = run_async(CheckPendingCommand().async_handler())
+
+        self.assertFalse(result['success'])
+        self.assertEqual(Transaction.objects.filter(status='pending').count(), 30)
+
+
+@override_settings(CONFIRMATION_DEPTH=0)
+class ListenerBackfillTests(TransactionTestCase):
+
+    def setUp(self):
+        self.transactions = Transaction.objects.bulk_create([
+            Transaction(transaction_hash=f'provisional-{n}', wallet_address=_wallet(n), amount=Decimal('1'))
+            for n in range(3)
+        ])
+        ids = [tx.id for tx in self.transactions]
+        # El primer evento es anterior al checkpoint: ya se procesó en una ejecución anterior
+        self.event = FakePaymentEvent(
+            [_payment_log(ids[0], 90), _payment_log(ids[1], 105), _payment_log(ids[2], 180)], max_blocks=1000
+        )
+        self.contract = SimpleNamespace(events=SimpleNamespace(PaymentReceived=self.event))
+        self.command = ListenerCommand()
+        self.command.checkpoint_name = 'PaymentReceived:test'
+
+    def fake_w3(self, head):
+        async def block_number():
+            return head
+        return SimpleNamespace(eth=SimpleNamespace(block_number=block_number()))
+
+    @override_settings(LOG_SCAN_MAX_BLOCKS=50)
+    def test_backfill_scans_only_missed_blocks_and_saves_the_checkpoint(self):
+        advance_checkpoint(self.command.checkpoint_name, 100)
+
+        run_async(self.command.backfill(self.fake_w3(200), self.contract))
+
+        statuses = dict(Transaction.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[tx.id] for tx in self.transactions], ['pending', 'confirmed', 'confirmed'])
+        self.assertEqual(
+            Transaction.objects.get(id=self.transactions[1].id).transaction_hash,
+            '0x' + self.transactions[1].id.to_bytes(32, 'big').hex(),
+        )
+        self.assertEqual(self.event.calls, 2)  # bloques 101-150 y 151-200
+        self.assertEqual(ListenerCheckpoint.objects.get().block_number, 200)
+
+    @override_settings(LOG_SCAN_MAX_BLOCKS=50, CONFIRMATION_DEPTH=5)
+    def test_backfill_checkpoint_leaves_out_the_reorg_window(self):
+        advance_checkpoint(self.command.checkpoint_name, 100)
+        self.command.tracker = ConfirmationTracker()
+
+        run_async(self.command.backfill(self.fake_w3(200), self.contract))
+
+        # Los bloques 196-200 aún pueden reorganizarse: se releen en el próximo arranque
+        self.assertEqual(ListenerCheckpoint.objects.get().block_number, 195)
+
+    @override_settings(LISTENER_START_BLOCK=None)
+    def test_first_start_checks_pending_receipts_once(self):
+        with patch.object(self.command, 'check_pending_transactions') as check:
+            run_async(self.command.backfill(self.fake_w3(200), self.contract))
+
+        check.assert_called_once()
+        self.assertEqual(self.event.calls, 0)
+        self.assertEqual(ListenerCheckpoint.objects.get().block_number, 200)
+
+    def test_checkpoint_never_moves_backwards(self):
+        advance_checkpoint('test', 10)
+        advance_checkpoint('test', 5)
+        self.assertEqual(ListenerCheckpoint.objects.get(name='test').block_number, 10)
+
+
+@override_settings(PENDING_EVENT_POLL=0.01, CONFIRMATION_DEPTH=0)
+class PendingEventTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.wallet = _wallet(7)
+        self.log = AttributeDict({
+            'blockNumber': 300,
+            'transactionHash': HexBytes(b'\x0a' * 32),
+            'logIndex': 0,
+            'blockHash': HexBytes(b'\x0b' * 32),
+            'args': AttributeDict(_payment_args(4242, self.wallet)),
+        })
+        self.contract = SimpleNamespace(events=SimpleNamespace(
+            PaymentReceived=lambda: SimpleNamespace(process_log=lambda log: log)
+        ))
+        self.command = ListenerCommand()
+        self.command.checkpoint_name = 'PaymentReceived:test'
+        self.endpoints = [Endpoint('wss://uno.example/clave'), Endpoint('wss://dos.example/clave')]
+
+    async def receive_then_register(self):
+        await self.command.start_pipeline()
+        try:
+            await self.command.handle_payment_event(SimpleNamespace(result=self.log), self.contract, self.endpoints[0])
+            await self.command.queue.join()
+            self.assertIn(4242, self.command.pending)
+
+            await sync_to_async(Transaction.objects.create)(
+                id=4242, transaction_hash='provisional', wallet_address=self.wallet, amount=Decimal('1')
+            )
+            start = time.perf_counter()
+            while 4242 in self.command.pending and time.perf_counter() - start < 5:
+                await asyncio.sleep(0.005)
+            return time.perf_counter() - start
+        finally:
+            await self.command.stop_pipeline()
+
+    def test_event_waits_for_its_transaction_and_resolves_on_commit(self):
+        elapsed = run_async(self.receive_then_register())
+
+        self.assertLess(elapsed, 1)
+        tx = Transaction.objects.get(id=4242)
+        self.assertEqual((tx.status, tx.transaction_hash), ('confirmed', '0x' + '0a' * 32))
+        # El checkpoint no pasa del evento que estaba en espera
+        self.assertEqual(ListenerCheckpoint.objects.get().block_number, 299)
+
+    @override_settings(CONFIRMATION_DEPTH=5)
+    def test_checkpoint_follows_new_heads_without_payments(self):
+        async def heads():
+            await self.command.start_pipeline()
+            try:
+                for number in (500, 501):
+                    header = {'number': number, 'hash': HexBytes(number.to_bytes(32, 'big')), 'parentHash': HexBytes(b'')}
+                    await self.command.handle_new_head(SimpleNamespace(result=header), self.endpoints[0])
+                    start = time.perf_counter()
+                    saved = ListenerCheckpoint.objects.filter(block_number=number - 6)
+                    while not await saved.aexists():
+                        if time.perf_counter() - start > 5:
+                            break
+                        await asyncio.sleep(0.005)
+            finally:
+                await self.command.stop_pipeline()
+
+        run_async(heads())
+
+        # Sin eventos en curso: la cabecera anterior, menos la ventana de reorganización
+        self.assertEqual(ListenerCheckpoint.objects.get().block_number, 495)
+
+    def test_notify_before_the_event_is_buffered_is_not_lost(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("Sin PostgreSQL cada espera consulta los ids del buffer")
+        ingest_events = self.command.ingest_events
+
+        def ingest_then_register(events):
+            waiting, tracked = ingest_events(events)
+            # Se guarda la transacción tras buscarla: su NOTIFY llega antes de que el evento entre en el buffer
+            Transaction.objects.create(
+                id=4242, transaction_hash='provisional', wallet_address=self.wallet, amount=Decimal('1')
+            )
+            time.sleep(0.05)
+            return waiting, tracked
+
+        async def race():
+            await self.command.start_pipeline()
+            self.command.ingest_events = ingest_then_register
+            try:
+                await self.command.handle_payment_event(SimpleNamespace(result=self.log), self.contract, self.endpoints[0])
+                await self.command.queue.join()
+                start = time.perf_counter()
+                while 4242 in self.command.pending and time.perf_counter() - start < 5:
+                    await asyncio.sleep(0.005)
+                return time.perf_counter() - start
+            finally:
+                await self.command.stop_pipeline()
+
+        self.assertLess(run_async(race()), 1)
+        self.assertEqual(Transaction.objects.get(id=4242).status, 'confirmed')
+
+    def test_each_batch_drops_stale_connections_before_and_after(self):
+        Transaction.objects.create(id=4242, transaction_hash='provisional', wallet_address=self.wallet, amount=Decimal('1'))
+
+        with patch('payments.management.commands.listener.close_old_connections') as close:
+            self.command.ingest_events([self.log])
+
+        self.assertEqual(close.call_count, 2)
+        self.assertEqual(Transaction.objects.get(id=4242).status, 'confirmed')
+
+    def test_a_log_that_fails_to_decode_is_not_marked_as_seen(self):
+        calls = []
+
+        def process_log(log):
+            calls.append(log)
+            if len(calls) == 1:
+                raise ValueError("log truncado")
+            return log
+
+        contract = SimpleNamespace(events=SimpleNamespace(
+            PaymentReceived=lambda: SimpleNamespace(process_log=process_log)
+        ))
+
+        async def receive():
+            await self.command.start_pipeline()
+            try:
+                for endpoint in self.endpoints:
+                    await self.command.handle_payment_event(SimpleNamespace(result=self.log), contract, endpoint)
+                await self.command.queue.join()
+                return 4242 in self.command.pending
+            finally:
+                await self.command.stop_pipeline()
+
+        # La copia del segundo endpoint se procesa (queda esperando a su transacción)
+        # aunque la primera no se pudiera decodificar
+        self.assertTrue(run_async(receive()))
+
+    def test_expired_event_needs_a_matching_transaction(self):
+        Transaction.objects.create(id=4242, transaction_hash='provisional', wallet_address=_wallet(8), amount=Decimal('1'))
+
+        waiting, tracked = self.command.resolve_events([self.log], expired=True)
+
+        # Otra wallet: no basta con que exista el id
+        self.assertEqual((waiting, tracked), ([], []))
+        self.assertEqual(Transaction.objects.get(id=4242).status, 'pending')
+
+    def test_without_postgres_waiting_ids_are_found_by_query(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest("En PostgreSQL se usa LISTEN/NOTIFY")
+        Transaction.objects.create(id=4242, transaction_hash='provisional', wallet_address=self.wallet, amount=Decimal('1'))
+        cache.clear()  # no depende de ningún aviso en caché
+
+        notifications = TransactionNotifications()
+        self.assertEqual(run_async(notifications.wait([4242, 4243], 0.01)), [4242])
+        self.assertEqual(run_async(notifications.wait([], 0.01)), [])
+
+    def test_orphan_events_expire(self):
+        buffer = PendingEventBuffer(ttl=0.01)
+        buffer.add(1, self.log)
+        self.assertEqual(buffer.pop_expired(), [])
+        time.sleep(0.02)
+        self.assertEqual(buffer.pop_expired(), [(1, self.log)])
+        self.assertEqual(len(buffer), 0)
+
+    @override_settings(LISTENER_QUEUE_SIZE=10, LISTENER_WORKERS=2, LISTENER_BATCH_SIZE=20)
+    def test_burst_is_saved_in_batches_through_a_bounded_queue(self):
+        transactions = Transaction.objects.bulk_create([
+            Transaction(transaction_hash=f'provisional-{n}', wallet_address=_wallet(n), amount=Decimal('1'))
+            for n in range(50)
+        ])
+        logs = [
+            AttributeDict({
+                'blockNumber': 400 + n // 10,
+                'transactionHash': HexBytes(tx.id.to_bytes(32, 'big')),
+                'logIndex': 0,
+                'blockHash': HexBytes(b'\x0b' * 32),
+                'args': AttributeDict(_payment_args(tx.id, tx.wallet_address.upper())),
+            })
+            for n, tx in enumerate(transactions)
+        ]
+
+        async def burst():
+            await self.command.start_pipeline()
+            try:
+                for log in logs:
+                    # El mismo log llega por los dos endpoints: solo se procesa el primero
+                    for endpoint in self.endpoints:
+                        await self.command.handle_payment_event(SimpleNamespace(result=log), self.contract, endpoint)
+                    self.assertLessEqual(self.command.queue.qsize(), 10)
+                await self.command.queue.join()
+                self.assertEqual(self.command.metrics.events, 50)
+                return self.command.metrics.batches
+            finally:
+                await self.command.stop_pipeline()
+
+        batches = run_async(burst())
+
+        self.assertEqual(Transaction.objects.filter(status='confirmed').count(), 50)
+        self.assertEqual(PaymentEvent.objects.count(), 50)
+        self.assertLess(batches, 50)
+        self.assertEqual(ListenerCheckpoint.objects.get().block_number, 403)
+
+
+    @override_settings(LISTENER_WORKERS=2, LISTENER_BATCH_SIZE=1)
+    def test_consumers_persist_in_parallel_threads(self):
+        active, peak, threads = [0], [0], set()
+        lock = threading.Lock()
+
+        def ingest_events(events):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                threads.add(threading.get_ident())
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return [], []
+
+        async def burst():
+            await self.command.start_pipeline()
+            self.command.ingest_events = ingest_events
+            try:
+                for n in range(6):
+                    log = AttributeDict({**self.log, 'transactionHash': HexBytes(n.to_bytes(32, 'big'))})
+                    await self.command.handle_payment_event(SimpleNamespace(result=log), self.contract, self.endpoints[0])
+                await self.command.queue.join()
+            finally:
+                await self.command.stop_pipeline()
+
+        run_async(burst())
+
+        # Con SQLite los lotes se guardan en el hilo único de sync_to_async
+        expected = 1 if connection.vendor == 'sqlite' else 2
+        self.assertEqual(peak[0], expected)
+        self.assertEqual(len(threads), expected)
+        self.assertNotIn(threading.get_ident(), threads)
+
+
+class FakeChain:
+    """Cabeceras y recibos de una cadena que se puede reorganizar"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.receipts = {}
+        self.get_block_calls = 0
+
+    def header(self, number, parent=None):
+        return {
+            'number': number,
+            'hash': HexBytes(self.hashes[number]),
+            'parentHash': HexBytes(parent or self.hashes[number - 1]),
+        }
+
+    async def get_block(self, number):
+        self.get_block_calls += 1
+        return {'hash': HexBytes(self.hashes[number])}
+
+    async def get_transaction_receipt(self, tx_hash):
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.receipts[tx_hash]
+
+
+@override_settings(CONFIRMATION_DEPTH=3)
+class ConfirmationTrackerTests(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Camiseta', amount_usd=Decimal('10.00'), stock_quantity=10)
+        self.transactions = [
+            create_pending_transaction(
+                wallet_address=_wallet(n),
+                amount=Decimal('1'),
+                token='USDT',
+                cart_items=[{'product_id': self.product.id, 'quantity': 1}],
+                transaction_hash=f'0x{n:064x}',
+            )[0]
+            for n in range(3)
+        ]
+        self.chain = FakeChain()
+        self.chain.hashes = {n: bytes([n]) * 32 for n in range(8, 16)}
+        self.w3 = SimpleNamespace(eth=self.chain)
+        self.tracker = ConfirmationTracker()
+
+    def accept(self, blocks):
+        payments = {
+            tx.id: (tx.transaction_hash, block, '0x' + self.chain.hashes[block].hex())
+            for tx, block in zip(self.transactions, blocks)
+        }
+        confirmed, tracked = accept_payments(payments)
+        self.assertEqual(confirmed, [])
+        for entry in tracked:
+            self.tracker.add(*entry)
+
+    def on_head(self, number, parent=None):
+        return settle_confirmations(*asyncio.run(self.tracker.on_head(self.w3, self.chain.header(number, parent))))
+
+    def statuses(self):
+        return [Transaction.objects.get(id=tx.id).status for tx in self.transactions]
+
+    def test_transactions_are_confirmed_in_batch_at_depth(self):
+        self.accept([10, 10, 11])
+        self.assertEqual(self.statuses(), ['confirming'] * 3)
+
+        self.assertEqual(self.on_head(11), [])
+        self.assertEqual(self.chain.get_block_calls, 0)
+        self.assertEqual(sorted(self.on_head(12)), sorted(tx.id for tx in self.transactions[:2]))
+        self.assertEqual(self.chain.get_block_calls, 1)  # un hash canónico por bloque, no por transacción
+
+        self.assertEqual(self.statuses(), ['confirmed', 'confirmed', 'confirming'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 8)
+
+    def test_reorg_rechecks_only_the_recent_window(self):
+        self.accept([10, 11, 11])
+        self.on_head(11)
+
+        # El bloque 11 cambia: la primera transacción se reincluye en el 12 y la segunda desaparece
+        self.chain.hashes[11] = b'\xee' * 32
+        self.chain.hashes[12] = b'\xef' * 32
+        moved = self.transactions[1]
+        self.chain.receipts[moved.transaction_hash] = {'status': 1, 'blockNumber': 12, 'blockHash': HexBytes(b'\xef' * 32)}
+
+        self.assertEqual(self.on_head(12), [self.transactions[0].id])
+        # La que desapareció sigue en 'confirming', sin bloque, con su hash real: no vuelve a 'pending'
+        self.assertEqual(self.statuses(), ['confirmed', 'confirming', 'confirming'])
+        moved.refresh_from_db()
+        self.assertEqual((moved.block_number, moved.block_hash), (12, '0x' + 'ef' * 32))
+        gone = Transaction.objects.get(id=self.transactions[2].id)
+        self.assertEqual((gone.block_number, gone.transaction_hash), (None, self.transactions[2].transaction_hash))
+        self.assertEqual(len(self.tracker), 1)
+
+        self.assertEqual(self.on_head(14, parent=b'\x00' * 32), [moved.id])
+
+
+class EndpointPoolTests(TestCase):
+
+    def setUp(self):
+        self.pool = EndpointPool(['wss://rapido.example/clave', 'wss://lento.example/clave'], max_lag=2)
+        self.fast, self.slow = self.pool.endpoints
+        self.pool.connected(self.fast, object(), 100)
+        self.pool.connected(self.slow, object(), 100)
+
+    def header(self, number):
+        return {'number': number, 'hash': HexBytes(number.to_bytes(32, 'big'))}
+
+    def test_each_head_and_event_is_processed_once(self):
+        self.assertTrue(self.pool.first_head(self.fast, self.header(101)))
+        self.assertFalse(self.pool.first_head(self.slow, self.header(101)))
+        self.assertEqual(len(self.slow.delays), 1)
+
+        log = _payment_log(7, 101)
+        self.assertTrue(self.pool.first_event(self.slow, log))
+        self.assertFalse(self.pool.first_event(self.fast, log))
+        self.assertEqual((self.fast.first, self.slow.first), (0, 1))
+
+    def test_endpoints_behind_the_best_head_are_laggards(self):
+        for number in range(101, 104):
+            self.pool.first_head(self.fast, self.header(number))
+        self.assertEqual(self.pool.laggards(), [self.slow])
+        self.assertEqual(self.slow.name, 'lento.example')
+
+        self.pool.disconnected(self.slow)
+        self.assertEqual(self.pool.laggards(), [])
+
+
+class ListenerShardTests(TransactionTestCase):
+
+    def test_each_shard_has_one_owner_and_expired_leases_are_taken_over(self):
+        self.assertEqual(acquire_shard('a', 2), 0)
+        self.assertEqual(acquire_shard('b', 2), 1)
+        self.assertIsNone(acquire_shard('c', 2))
+        self.assertEqual(acquire_shard('a', 2), 0)  # volver a pedirlo no lo cede
+
+        # 'a' deja de latir: su shard pasa al proceso en espera y su renovación falla
+        ListenerLease.objects.filter(owner='a').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(acquire_shard('c', 2), 0)
+        self.assertFalse(renew_shard('a', 0, 2))
+        self.assertTrue(renew_shard('c', 0, 2))
+
+        release_shard('b', 1, 2)
+        self.assertEqual(acquire_shard('a', 2), 1)
+
+    def test_a_different_shard_count_waits_for_live_leases_to_go(self):
+        self.assertEqual(acquire_shard('a', 2), 0)
+
+        # Con otro LISTENER_SHARDS las reservas no chocan: no se toma ninguna mientras 'a' siga viva
+        with self.assertRaises(ShardLayoutConflict) as conflict:
+            acquire_shard('b', 3)
+        self.assertEqual(conflict.exception.others, [2])
+        self.assertFalse(ListenerLease.objects.filter(shards=3).exclude(owner='').exists())
+
+        release_shard('a', 0, 2)
+        self.assertEqual(acquire_shard('b', 3), 0)
+        with self.assertRaises(ShardLayoutConflict):
+            acquire_shard('c', 1)
+
+    def test_heartbeat_stops_when_the_lease_is_lost(self):
+        command = ListenerCommand()
+        command.shard, command.shards = acquire_shard('a', 2), 2
+        ListenerLease.objects.filter(shard=0).update(owner='b')
+
+        run_async(asyncio.wait_for(command.heartbeat('a', 0.01), timeout=5))
+
+    def test_a_shard_only_handles_its_own_transactions(self):
+        transactions = Transaction.objects.bulk_create([
+            Transaction(transaction_hash=f'0x{n:064x}', wallet_address=_wallet(n), amount=Decimal('1'),
+                        status='confirming', block_number=10, block_hash='0x' + 'aa' * 32)
+            for n in range(6)
+        ])
+        odd = sorted(tx.id for tx in transactions if tx.id % 2 == 1)
+        self.assertEqual(sorted(tx_id for _, tx_id, _, _ in confirming_transactions(1, 2)), odd)
+
+        command = ListenerCommand()
+        command.shard, command.shards = 1, 2
+        self.assertEqual([tx.id for tx in transactions if command.owns(tx.id)], odd)
+
+
+class FakeIndexedChain:
+    """eth_getLogs con filtro OR de topics y un límite de bloques por llamada"""
+
+    PAYMENT_TOPIC = '0x' + '01' * 32
+    WITHDRAWN_TOPIC = '0x' + '02' * 32
+
+    def __init__(self, blocks, max_blocks=8):
+        self.max_blocks = max_blocks
+        self.calls = 0
+        self.logs = []
+        for block in range(1, blocks + 1):
+            log = _payment_log(block, block)
+            self.logs.append({**log, 'topics': [HexBytes(self.PAYMENT_TOPIC)], 'decoded': log})
+            if block % 10 == 0:
+                withdrawal = AttributeDict({
+                    **log, 'logIndex': 1, 'args': AttributeDict({
+                        'receiver': _wallet(1), 'token': '0x' + '0' * 40, 'amount': 10 ** 18,
+                    }),
+                })
+                self.logs.append({**withdrawal, 'topics': [HexBytes(self.WITHDRAWN_TOPIC)], 'decoded': withdrawal})
+        self.eth = SimpleNamespace(get_logs=self.get_logs)
+        self.contract = SimpleNamespace(address='0x' + 'cc' * 20, events=SimpleNamespace(
+            PaymentReceived=lambda: SimpleNamespace(topic=self.PAYMENT_TOPIC, process_log=lambda log: log['decoded']),
+            Withdrawn=lambda: SimpleNamespace(topic=self.WITHDRAWN_TOPIC, process_log=lambda log: log['decoded']),
+        ))
+
+    async def get_logs(self, params):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if params['toBlock'] - params['fromBlock'] + 1 > self.max_blocks:
+            raise Web3RPCError('query returned more than 10000 results')
+        topics = set(params['topics'][0])
+        return [
+            log for log in self.logs
+            if params['fromBlock'] <= log['blockNumber'] <= params['toBlock'] and log['topics'][0].to_0x_hex() in topics
+        ]
+
+
+class ChainIndexerTests(TransactionTestCase):
+
+    def test_parallel_ranges_shrink_on_rejection_and_resume_from_the_checkpoint(self):
+        chain = FakeIndexedChain(blocks=100, max_blocks=8)
+        indexer = ChainIndexer(chain, chain.contract, 'index:test', workers=4, max_span=32, timeout=1)
+
+        self.assertEqual(run_async(indexer.run(1, 100)), 100)
+        self.assertEqual(PaymentEvent.objects.count(), 100)
+        self.assertEqual(WithdrawalEvent.objects.count(), 10)
+        self.assertEqual(indexer.stored, {'PaymentReceived': 100, 'Withdrawn': 10})
+        self.assertEqual(ListenerCheckpoint.objects.get(name='index:test').block_number, 100)
+        # Tras el primer rechazo no se vuelve a pedir un tramo mayor que el aceptado
+        self.assertLess(chain.calls, 40)
+
+        # Repetir un tramo ya indexado no duplica filas
+        run_async(ChainIndexer(chain, chain.contract, 'index:test', max_span=8, timeout=1).run(41, 60))
+        self.assertEqual(PaymentEvent.objects.count(), 100)
+
+
+class ReconciliationTests(TestCase):
+
+    def setUp(self):
+        def tx(n, status='confirmed', amount='1', token='ETH'):
+            return Transaction.objects.create(
+                transaction_hash=f'0x{n:064x}', wallet_address=_wallet(n).upper().replace('0X', '0x'),
+                amount=Decimal(amount), token=token, status=status,
+            )
+
+        def event(tx_id, sender, amount, currency='ETH', log_index=0):
+            args = {**_payment_args(tx_id, sender), 'amount': amount, 'currency': currency}
+            record_payment_events([AttributeDict({**_payment_log(tx_id, 10), 'logIndex': log_index, 'args': args})])
+
+        self.ok = tx(1)
+        event(self.ok.id, _wallet(1), 10 ** 18)
+        self.usdc = tx(2, amount='2.5', token='USDC')
+        event(self.usdc.id, _wallet(2), 2_500_000, currency='USDC')
+        self.short = tx(3)
+        event(self.short.id, _wallet(3), 10 ** 17)
+        self.other_sender = tx(4)
+        event(self.other_sender.id, _wallet(99), 10 ** 18)
+        self.no_event = tx(5)
+        tx(6, status='pending')  # sin evento pero no confirmada: no es una diferencia
+        event(10 ** 6, _wallet(7), 10 ** 18)
+        event(2 ** 200, _wallet(8), 10 ** 18)  # transactionId que no cabe en un id
+        event(2 ** 64, _wallet(9), 10 ** 18)  # otro fuera de rango: no es un duplicado del anterior
+        event(self.ok.id, _wallet(1), 10 ** 18, log_index=1)  # segundo pago del mismo transactionId
+
+    def test_differences_are_flagged_per_transaction(self):
+        report, duplicated = reconcile(load_transactions(), load_payment_events())
+        rows = discrepancies(report).set_index('transaction_id')
+
+        self.assertEqual(summarize(report, duplicated), {
+            'amount_mismatch': 1, 'sender_mismatch': 1, 'missing_event': 1, 'orphan_event': 3,
+            'duplicate_events': 1, 'transactions': 6, 'events': 8,
+        })
+        self.assertTrue(rows.loc[self.short.id, 'amount_mismatch'])
+        self.assertTrue(rows.loc[self.other_sender.id, 'sender_mismatch'])
+        self.assertTrue(rows.loc[self.no_event.id, 'missing_event'])
+        self.assertTrue(rows.loc[10 ** 6, 'orphan_event'])
+        self.assertEqual(rows.loc[[OUT_OF_RANGE_ID], 'orphan_event'].tolist(), [True, True])
+        self.assertNotIn(self.ok.id, rows.index)
+        self.assertNotIn(self.usdc.id, rows.index)
+
+    def test_command_writes_the_report(self):
+        path = os.path.join(tempfile.mkdtemp(), 'report.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        out = io.StringIO()
+        call_command('reconcile_payments', output=path, stdout=out, stderr=io.StringIO())
+
+        self.assertEqual(json.loads(out.getvalue())['orphan_event'], 3)
+        with open(path) as f:
+            self.assertEqual(len(list(csv.DictReader(f))), 6)
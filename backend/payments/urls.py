@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.urls import path
+from . import async_views
 from .views import check_pending_transactions, delete_transaction, get_transaction_detail, get_transaction_order_items, get_transactions_by_wallet, register_transaction, update_transaction, generate_invoice
 
 urlpatterns = [
@@ -12,3 +14,13 @@ urlpatterns = [
     path('get-transaction-order-items/<int:transaction_id>', get_transaction_order_items, name='get_transaction-order-items'),
 ]
 
+# Perfil ASGI: los endpoints que esperan a la blockchain se sirven con vistas async nativas
+if settings.PAYMENTS_ASYNC_VIEWS:
+    async_urlpatterns = [
+        path('register-transaction', async_views.register_transaction, name='register_transaction'),
+        path('update-transaction/<int:transaction_id>', async_views.update_transaction, name='update_transaction'),
+        path('get-transaction-detail/<str:tx_hash>', async_views.get_transaction_detail, name='get_transaction_detail'),
+    ]
+    async_names = {pattern.name for pattern in async_urlpatterns}
+    urlpatterns = async_urlpatterns + [pattern for pattern in urlpatterns if pattern.name not in async_names]
+
@@ -1,28 +1,44 @@
 from decimal import Decimal, InvalidOperation
-from django.http import Http404, JsonResponse, HttpResponse
-from .utils.formatters import format_scientific_to_decimal
+from django.http import FileResponse, Http404, JsonResponse
 from .models import OrderItem, Transaction, Product
-from reportlab.lib.pagesizes import letter
 from django.shortcuts import get_object_or_404
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from django.conf import settings
-from web3 import Web3
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import condition
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from users.models import UserProfile
 from .serializers import OrderItemSerializer, TransactionSerializer
+from .decorators import idempotent
+from ._services.checkout import CheckoutError, create_pending_transaction
+from ._services.inventory import fail_transactions
+from ._services.invoices import invoice_last_modified, invoice_snapshot, open_invoice, snapshot_version
+from ._services.pagination import PaginationError, keyset_page
+from ._services.chain_cache import get_receipt, get_transaction
+from ._services.circuit_breaker import CircuitOpenError
+from ._services.web3_client import get_web3, provider_breaker, provider_is_healthy
 from django.db import transaction
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def provider_unavailable(retry_after=None):
+    """Respuesta inmediata mientras el circuito del proveedor Ethereum está abierto"""
+    response = Response(
+        {"success": False, "message": "Proveedor Ethereum no disponible temporalmente"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    response['Retry-After'] = str(retry_after or settings.WEB3_CIRCUIT_OPEN_SECONDS)
+    return response
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent('register_transaction')
 def register_transaction(request):
     data = request.data
     wallet_address = data.get("wallet_address")
@@ -41,13 +57,15 @@ def register_transaction(request):
     except (TypeError, InvalidOperation):
         return Response({"success": False, "message": "El campo 'amount' es inválido"}, status=400)
 
-    # Verificación de WEB3_PROVIDER
+    # Verificación de WEB3_PROVIDER (estado cacheado del cliente compartido)
     provider_url = getattr(settings, 'WEB3_PROVIDER', None)
     if not provider_url:
         return Response({"success": False, "message": "Servicio WEB3_PROVIDER sin servicio"}, status=500)
 
-    web3 = Web3(Web3.HTTPProvider(provider_url))
-    if not web3.is_connected():
+    if provider_breaker.is_open():
+        return provider_unavailable()
+
+    if not provider_is_healthy():
         return Response({"success": False, "message": "No se pudo conectar a la red Ethereum"}, status=500)
 
     transaction_hash = wallet_address
@@ -60,76 +78,30 @@ def register_transaction(request):
     except UserProfile.DoesNotExist:
         return Response({"success": False, "message": "Usuario no encontrado"}, status=404)
 
-    # Validar stock y construir productos
-    products_to_buy = []
-    total_usd = Decimal('0')
-    
-    for item_data in cart_items_data:
-        product_id = item_data.get('product_id')
-        quantity = item_data.get('quantity')
-        
-        if not product_id or not quantity:
-            return Response({"success": False, "message": "Datos de producto inválidos"}, status=400)
-        
-        try:
-            product = Product.objects.get(id=product_id)
-            
-            # Verificar stock
-            if product.stock_quantity < quantity:
-                return Response({
-                    "success": False,
-                    "message": f"Stock insuficiente para {product.name}. Disponible: {product.stock_quantity}"
-                }, status=400)
-            
-            products_to_buy.append({
-                'product': product,
-                'quantity': quantity
-            })
-            
-            total_usd += product.amount_usd * quantity
-            
-        except Product.DoesNotExist:
-            return Response({"success": False, "message": f"Producto {product_id} no encontrado"}, status=404)
-
-    # Crear transacción y OrderItems
-    with transaction.atomic():
-        tx = Transaction.objects.create(
+    # Validar stock disponible, crear la transacción con sus OrderItems y reservar el stock
+    try:
+        tx, items_count = create_pending_transaction(
             wallet_address=wallet_address,
             amount=amount,
-            amount_usd=total_usd,
-            transaction_hash=transaction_hash,
             token=token,
-            status='pending',
+            cart_items=cart_items_data,
+            transaction_hash=transaction_hash,
         )
-        
-        # Crear OrderItems y actualizar stock
-        for item in products_to_buy:
-            product = item['product']
-            quantity = item['quantity']
-            
-            OrderItem.objects.create(
-                transaction=tx,
-                product=product,
-                quantity=quantity,
-                price_at_sale=product.amount_usd,
-                status='pending'
-            )
-            
-            # Actualizar stock
-            product.stock_quantity = max(product.stock_quantity - quantity, 0)
-            product.save()
+    except CheckoutError as e:
+        return Response({"success": False, "message": e.message}, status=e.status)
 
     return Response({
         "success": True,
         "message": "Transacción registrada exitosamente",
         "transaction_id": tx.id,
         "hash_placeholder": transaction_hash,
-        "items_count": len(products_to_buy)
+        "items_count": items_count
     })
 
 
 @api_view(["PUT"])
 @permission_classes([IsAuthenticated])
+@idempotent('update_transaction')
 def update_transaction(request, transaction_id):
     data = request.data
     wallet_address = data.get("wallet_address")
@@ -150,12 +122,18 @@ def update_transaction(request, transaction_id):
     if not provider_url:
         return Response({"success": False, "message": "Servicio WEB3_PROVIDER sin servicio"}, status=500)
 
-    web3 = Web3(Web3.HTTPProvider(provider_url))
-    if not web3.is_connected():
+    if provider_breaker.is_open():
+        return provider_unavailable()
+
+    if not provider_is_healthy():
         return Response({"success": False, "message": "No se pudo conectar a la red Ethereum"}, status=500)
 
+    web3 = get_web3()
+
     try:
-        tx_receipt = web3.eth.get_transaction_receipt(transaction_hash)
+        tx_receipt = get_receipt(web3, transaction_hash)
+    except CircuitOpenError as e:
+        return provider_unavailable(e.retry_after)
     except Exception:
         return Response({"success": False, "message": "Transacción no encontrada"}, status=404)
 
@@ -163,9 +141,11 @@ def update_transaction(request, transaction_id):
         return Response({"success": False, "message": "Transacción fallida o no confirmada"}, status=400)
 
     try:
-        tx_data = web3.eth.get_transaction(transaction_hash)
+        tx_data = get_transaction(web3, transaction_hash)
         if tx_data['from'].lower() != wallet_address.lower():
             return Response({"success": False, "message": "La dirección no coincide con el remitente"}, status=400)
+    except CircuitOpenError as e:
+        return provider_unavailable(e.retry_after)
     except Exception:
         return Response({"success": False, "message": "No se pudo verificar el remitente de la transacción"}, status=500)
 
@@ -208,25 +188,22 @@ def delete_transaction(request, transaction_id):
         
         # Usar atomic para asegurar que todo se ejecute correctamente o nada
         with transaction.atomic():
-            # Obtener los OrderItems asociados a esta transacción
-            order_items = OrderItem.objects.filter(transaction=tx)
-            
-            # Reponer el stock de cada producto
-            items_restored = 0
-            for order_item in order_items:
-                product = order_item.product
-                # Restaurar la cantidad que se había descontado
-                product.stock_quantity += order_item.quantity
-                product.save()
-                items_restored += 1
-                       
+            # Misma ruta que las fallidas del verificador: bloquea la fila y libera
+            # las reservas. Si entre medias se confirmó, no se elimina.
+            failed_ids, items_restored = fail_transactions([tx.id], statuses=('pending',))
+            if not failed_ids:
+                return Response(
+                    {"success": False, "message": "Solo se pueden eliminar transacciones pendientes"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
             # Eliminar la transacción (esto eliminará los OrderItems por CASCADE)
             tx.delete()
             
             return Response(
                 {
                     "success": True, 
-                    "message": f"Transacción eliminada correctamente. Se repusieron {items_restored} items al inventario."
+                    "message": f"Transacción eliminada correctamente. Se liberaron {items_restored} reservas de inventario."
                 },
                 status=status.HTTP_200_OK
             )
@@ -266,95 +243,40 @@ def check_pending_transactions(request, wallet_address):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
+def _invoice_version(request, transaction_id):
+    """Snapshot y versión de la factura, calculados una sola vez por petición"""
+    if not hasattr(request, '_invoice_version'):
+        transaction = get_object_or_404(Transaction, id=transaction_id)
+        snapshot = invoice_snapshot(transaction)
+        request._invoice_version = (snapshot, snapshot_version(snapshot))
+    return request._invoice_version
+
+
+def _invoice_etag(request, transaction_id):
+    return _invoice_version(request, transaction_id)[1]
+
+
+def _invoice_last_modified(request, transaction_id):
+    return invoice_last_modified(*_invoice_version(request, transaction_id))
+
+
 @permission_classes([IsAuthenticated])
+@condition(etag_func=_invoice_etag, last_modified_func=_invoice_last_modified)
 def generate_invoice(request, transaction_id):
-    transaction = get_object_or_404(Transaction, id=transaction_id)
-    order_items = transaction.order_items.select_related('product').all()
-
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="factura_{transaction.id}.pdf"'
-    
-    doc = SimpleDocTemplate(response, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Título
-    title = Paragraph(f'<font size=18><b>Factura de Pago - #{transaction.id}</b></font>', styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 12))
-
-    # Información general de la transacción
-    hash_style = styles["Normal"]
-    hash_style.fontSize = 9
-    transaction_info = [
-        ['ID de Transacción', str(transaction.id)],
-        ['Fecha', transaction.created_at.strftime('%Y-%m-%d %H:%M:%S')],
-        ['Wallet', transaction.wallet_address],
-        ['Monto', f'{format_scientific_to_decimal(transaction.amount)} {transaction.token}'],
-        ['Hash de Transacción', Paragraph(transaction.transaction_hash, hash_style)],
-        ['Estado', transaction.status.title()],
-    ]
-    table = Table(transaction_info, colWidths=[200, 350])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.whitesmoke),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-    elements.append(table)
-    elements.append(Spacer(1, 24))
-
-    # Tabla de productos
-    if order_items:
-        elements.append(Paragraph("<b>Productos Comprados:</b>", styles['Heading4']))
-        elements.append(Spacer(1, 6))
-
-        product_data = [['Producto', 'Cantidad', 'Precio Unitario', 'Subtotal']]
-        total = 0
-
-        for item in order_items:
-            subtotal = item.subtotal
-            total += subtotal
-            product_data.append([
-                item.product.name,
-                str(item.quantity),
-                f"{item.price_at_sale:.2f} {transaction.token}",
-                f"{subtotal:.2f} {transaction.token}"
-            ])
-
-        product_data.append(['', '', 'Total:', f"{total:.2f} {transaction.token}"])
-
-        product_table = Table(product_data, colWidths=[200, 100, 120, 130])
-        product_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('ALIGN', (1, 1), (-1, -2), 'CENTER'),
-            ('ALIGN', (-2, -1), (-1, -1), 'RIGHT'),
-        ]))
-        elements.append(product_table)
-        elements.append(Spacer(1, 24))
-    else:
-        elements.append(Paragraph("<i>No se encontraron productos asociados a esta transacción.</i>", styles['Normal']))
-        elements.append(Spacer(1, 24))
-
-    # Mensaje final
-    elements.append(Paragraph(
-        "<font size=12>Gracias por realizar el pago. Si tiene alguna duda, no dude en ponerse en contacto con nosotros.</font>",
-        styles['Normal']
-    ))
-    elements.append(Spacer(1, 12))
-    elements.append(Paragraph(
-        "<font size=10><i>Este es un documento generado automáticamente. No requiere firma.</i></font>",
-        styles['Normal']
-    ))
-
-    doc.build(elements)
+    # La versión depende del contenido: si cambia el estado o las líneas se genera otro PDF
+    snapshot, version = _invoice_version(request, transaction_id)
+
+    response = FileResponse(
+        open_invoice(snapshot, version),
+        as_attachment=True,
+        filename=f"factura_{snapshot['id']}.pdf",
+        content_type='application/pdf',
+    )
+    last_modified = invoice_last_modified(snapshot, version)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # El navegador revalida con If-None-Match y recibe 304 si no ha cambiado
+    patch_cache_control(response, private=True, no_cache=True)
     return response
 
 
@@ -362,11 +284,12 @@ def generate_invoice(request, transaction_id):
 @permission_classes([IsAuthenticated])
 def get_transactions_by_wallet(request, wallet_address):
     try:
-        transactions = Transaction.objects.filter(wallet_address=wallet_address).order_by('-created_at')
-    except Transaction.DoesNotExist:
-        return Response({"success": False, "error": "No se han encontrado transacciones."}, status=status.HTTP_404_NOT_FOUND)
+        transactions, page = keyset_page(request, Transaction.objects.filter(wallet_address=wallet_address))
+    except PaginationError as e:
+        return Response({"success": False, "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     data = {
+        **page,
         'transactions': [
             {
                 'id': transaction.id,
@@ -4,6 +4,7 @@
 # Authorization: Bearer <token>, extraiga la wallet y la inserte en request.wallet_address. 
 
 from functools import wraps
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
@@ -34,3 +35,22 @@ def wallet_required(view_func):
         request.wallet_address = wallet
         return view_func(request, *args, **kwargs)
     return _wrapped_view
+
+
+def async_jwt_required(view_func):
+    """
+    Equivalente a IsAuthenticated + JWTAuthentication para vistas async nativas
+    (DRF no soporta vistas async). Inyecta el usuario en request.user.
+    """
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        try:
+            auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except (InvalidToken, AuthenticationFailed):
+            return JsonResponse({'detail': 'Token inválido'}, status=401)
+        if auth is None:
+            return JsonResponse({'detail': 'Token JWT no proporcionado'}, status=401)
+
+        request.user, request.auth = auth
+        return await view_func(request, *args, **kwargs)
+    return _wrapped_view
@@ -1,4 +1,11 @@
 #!/bin/bash
 python manage.py migrate --noinput
 python manage.py collectstatic --noinput
-exec gunicorn --bind 0.0.0.0:8000 config.wsgi:application
\ No newline at end of file
+
+# SERVER_PROFILE=asgi: uvicorn con las vistas de pago async (muchas verificaciones en vuelo por proceso)
+# SERVER_PROFILE=wsgi (por defecto): gunicorn con workers síncronos
+if [ "$SERVER_PROFILE" = "asgi" ]; then
+    exec uvicorn config.asgi:application --host 0.0.0.0 --port 8000 \
+        --workers "${WEB_CONCURRENCY:-4}" --proxy-headers --forwarded-allow-ips "*"
+fi
+exec gunicorn --bind 0.0.0.0:8000 config.wsgi:application
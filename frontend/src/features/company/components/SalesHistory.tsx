@@ -11,95 +11,64 @@ import {
   Select,
   Alert,
   Table,
-  Link
+  Link,
+  Button
 } from '@chakra-ui/react';
 import { Transaction, UserProfile } from '@/shared/types/types';
 import { createListCollection } from '@ark-ui/react';
 import { authCompanyAPI } from '../services/companyApi';
 import { toaster } from "@/shared/components/ui/toaster";
+import PaginationControls from "@/shared/components/PaginationControls";
+import { useCursorPagination } from "@/shared/hooks/useCursorPagination";
 import { FaCopy, FaEye } from 'react-icons/fa';
 import TruncateAddress from '@/shared/components/TruncatedAddress';
 
-const itemsPerPageOptions = createListCollection({
-  items: [
-    { label: "10 por página", value: "10" },
-    { label: "20 por página", value: "20" },
-    { label: "30 por página", value: "30" },
-  ],
-});
+// Usuarios por página en el selector
+const USERS_PAGE_SIZE = 100;
 
 type FilterOption = 'all' | 'user';
 
 export function SalesHistory() {
   const [users, setUsers] = useState<UserProfile[]>([]);
+  const [usersCursor, setUsersCursor] = useState<string | null>(null);
   const [selectedUser, setSelectedUser] = useState<UserProfile | null>(null);
   const [filterOption, setFilterOption] = useState<FilterOption>('all');
-  const [transactions, setTransactions] = useState<Transaction[]>([]);
-  const [isLoading, setIsLoading] = useState({
-    users: true,
-    transactions: false,
-  });
-  const [error, setError] = useState<string | null>(null);
-  const [currentPage, setCurrentPage] = useState(1);
-  const [itemsPerPage, setItemsPerPage] = useState(10);
-  
-  // Cargar lista de usuarios al montar el componente
-  useEffect(() => {
-    const loadUsers = async () => {
-      setIsLoading(prev => ({...prev, users: true}));
-      setError(null);
-      
-      const response = await authCompanyAPI.getAllUsers();
-      if (response.success && response.data) {
-        setUsers(response.data);
-      } else {
-        setError(response.error || "Error desconocido al cargar usuarios");
-        setUsers([]);
-      }
-      
-      setIsLoading(prev => ({...prev, users: false}));
-    };
+  const [isLoadingUsers, setIsLoadingUsers] = useState(true);
+  const [usersError, setUsersError] = useState<string | null>(null);
 
-    loadUsers();
-  }, []);
+  // Usuarios del selector por páginas: los siguientes solo se piden con "Cargar más usuarios"
+  const loadUsers = async (cursor: string | null = null) => {
+    setIsLoadingUsers(true);
+    setUsersError(null);
 
-  // Cargar transacciones según el filtro seleccionado
-  useEffect(() => {
-    const loadTransactions = async () => {
-      setIsLoading(prev => ({...prev, transactions: true}));
-      setError(null);
-      
-      try {
-        let response;
-        
-        if (filterOption === 'user' && selectedUser?.wallet_address) {
-          response = await authCompanyAPI.getTransactionsByWallet(selectedUser.wallet_address);
-        } else {
-          response = await authCompanyAPI.getAllTransactions();
-        }
+    const response = await authCompanyAPI.getAllUsers({ page_size: USERS_PAGE_SIZE, cursor });
+    if (response.success && response.data) {
+      const page = response.data;
+      setUsers(prev => cursor ? [...prev, ...page.items] : page.items);
+      setUsersCursor(page.next_cursor);
+    } else {
+      setUsersError(response.error || "Error desconocido al cargar usuarios");
+    }
 
-        if (response.success && response.data) {
-          setTransactions(response.data);
-          setCurrentPage(1);
-        } else {
-          setError(response.error || "Error desconocido al cargar transacciones");
-          setTransactions([]);
-        }
-      } catch (err) {
-        setError(err instanceof Error ? err.message : "Error al cargar transacciones");
-      } finally {
-        setIsLoading(prev => ({...prev, transactions: false}));
-      }
-    };
+    setIsLoadingUsers(false);
+  };
 
-    loadTransactions();
-  }, [filterOption, selectedUser]);
+  // Cargar la primera página de usuarios al montar el componente
+  useEffect(() => {
+    loadUsers();
+  }, []);
 
-  // Calcular transacciones para la página actual
-  const indexOfLastItem = currentPage * itemsPerPage;
-  const indexOfFirstItem = indexOfLastItem - itemsPerPage;
-  const currentTransactions = transactions.slice(indexOfFirstItem, indexOfLastItem);
-  const totalPages = Math.ceil(transactions.length / itemsPerPage);
+  // Transacciones según el filtro seleccionado, una página cada vez
+  const wallet = filterOption === 'user' ? selectedUser?.wallet_address : undefined;
+  const {
+    items: transactions, isLoading: isLoadingTransactions, error: transactionsError, ...pagination
+  } = useCursorPagination<Transaction>(
+    params => wallet
+      ? authCompanyAPI.getTransactionsByWallet(wallet, params)
+      : authCompanyAPI.getAllTransactions(params),
+    [wallet],
+  );
+  const error = usersError || transactionsError;
 
   const copyToClipboard = (hash: string) => {
       navigator.clipboard.writeText(hash);
@@ -132,7 +101,7 @@ export function SalesHistory() {
       
       <Box mb={6}>
         <Text fontWeight="medium" mb={2}>Filtrar por:</Text>
-        {isLoading.users ? (
+        {isLoadingUsers && users.length === 0 ? (
           <Spinner size="sm" />
         ) : (
           <Flex gap={4} direction={{ base: "column", md: "row" }}>
@@ -201,6 +170,17 @@ export function SalesHistory() {
                 </Portal>
               </Select.Root>
             )}
+
+            {filterOption === 'user' && usersCursor && (
+              <Button
+                size="sm"
+                variant="outline"
+                loading={isLoadingUsers}
+                onClick={() => loadUsers(usersCursor)}
+              >
+                Cargar más usuarios
+              </Button>
+            )}
           </Flex>
         )}
       </Box>
@@ -223,11 +203,11 @@ export function SalesHistory() {
           <Alert.Indicator />
           <Alert.Title>{error}</Alert.Title>
         </Alert.Root>
-      ) : isLoading.transactions ? (
+      ) : isLoadingTransactions ? (
         <Flex justify="center" py={10}>
           <Spinner size="xl" />
         </Flex>
-      ) : transactions.length === 0 ? (
+      ) : transactions.length === 0 && !pagination.hasPrevious ? (
         <Alert.Root status="info">
           <Alert.Indicator />
           <Alert.Title>
@@ -250,7 +230,7 @@ export function SalesHistory() {
                 </Table.Row>
               </Table.Header>
               <Table.Body>
-                {currentTransactions.map((tx) => (
+                {transactions.map((tx) => (
                   <Table.Row key={tx.transaction_hash}>
                     <Table.Cell truncate><TruncateAddress address={tx.transaction_hash} />
                       <IconButton
@@ -281,66 +261,7 @@ export function SalesHistory() {
           </Box>  
 
           {/* Controles de paginación */}
-          <Flex justifyContent="space-between" alignItems="center" mt={4}>
-            <Flex gap={2} alignItems="center">
-              <IconButton
-                aria-label="Página anterior"
-                onClick={() => setCurrentPage(currentPage - 1)}
-                disabled={currentPage === 1}
-                size="sm"
-                variant="ghost"
-              >
-                ←
-              </IconButton>
-              
-              <Text fontSize="sm">
-                Página {currentPage} de {totalPages}
-              </Text>
-
-              <IconButton
-                aria-label="Página siguiente"
-                onClick={() => setCurrentPage(currentPage + 1)}
-                disabled={currentPage === totalPages}
-                size="sm"
-                variant="ghost"
-              >
-                →
-              </IconButton>
-            </Flex>
-
-            <Select.Root
-              collection={itemsPerPageOptions}
-              value={[itemsPerPage.toString()]}
-              onValueChange={({ value }) => {
-                setItemsPerPage(Number(value[0]));
-                setCurrentPage(1);
-              }}
-              size="sm"
-              width="150px"
-            >
-              <Select.HiddenSelect />
-              <Select.Control>
-                <Select.Trigger>
-                  <Select.ValueText placeholder="Items por página" />
-                </Select.Trigger>
-                <Select.IndicatorGroup>
-                  <Select.Indicator />
-                </Select.IndicatorGroup>
-              </Select.Control>
-              <Portal>
-                <Select.Positioner>
-                  <Select.Content>
-                    {itemsPerPageOptions.items.map((option) => (
-                      <Select.Item key={option.value} item={option}>
-                        {option.label}
-                        <Select.ItemIndicator />
-                      </Select.Item>
-                    ))}
-                  </Select.Content>
-                </Select.Positioner>
-              </Portal>
-            </Select.Root>
-          </Flex>
+          <PaginationControls {...pagination} />
         </>
       )}
     </Box>
@@ -18,15 +18,25 @@ import { toaster } from "@/shared/components/ui/toaster";
 import { FaCopy, FaEye } from 'react-icons/fa';
 import { useNavigate } from 'react-router-dom';
 import TruncateAddress from "@/shared/components/TruncatedAddress";
+import PaginationControls from "@/shared/components/PaginationControls";
+import { useCursorPagination } from "@/shared/hooks/useCursorPagination";
 
 export const UserDetailPage = () => {
   const { wallet_address } = useParams<{ wallet_address: string }>();
   const [user, setUser] = useState<UserProfile | null>(null);
-  const [transactions, setTransactions] = useState<Transaction[]>([]);
+  const [transactionCounts, setTransactionCounts] = useState<Record<string, number>>({});
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const navigate = useNavigate();
 
+  // Transacciones de la wallet, una página cada vez
+  const {
+    items: transactions, isLoading: loadingTransactions, error: transactionsError, ...pagination
+  } = useCursorPagination<Transaction>(
+    params => authCompanyAPI.getTransactionsByWallet(wallet_address!, params),
+    [wallet_address],
+  );
+
   const copyToClipboard = (hash: string) => {
       navigator.clipboard.writeText(hash);
       toaster.create({ title: "Hash copiado", type: "success", duration: 2000 });
@@ -34,9 +44,12 @@ export const UserDetailPage = () => {
 
   const loadData = async () => {
     try {
+      setLoading(true);
       const userData = await authCompanyAPI.getUserByWallet(wallet_address!);
       if (userData.data){
           setUser(userData.data);
+          // Recuento por estado calculado en el backend: no hace falta cargar todas las transacciones
+          setTransactionCounts(userData.transaction_counts || {});
       } else {
           setUser(null);
           setError("Usuario no encontrado");   
@@ -46,29 +59,13 @@ export const UserDetailPage = () => {
     } finally {
       setLoading(false);
     }
-
-    try {
-      setLoading(true);
-      const response = await authCompanyAPI.getTransactionsByWallet(wallet_address!);
-      if (response.data) {
-        setTransactions(response.data);
-      } else {
-        setError("No se encontraron transacciones para esta wallet");
-        setTransactions([]);
-      }   
-    } catch (err) {
-      setError(err instanceof Error ? err.message : "Error al cargar las transacciones");
-    } finally {
-      setLoading(false);
-    }
   };
 
   useEffect(() => {
     loadData();
   }, [wallet_address]);
 
-  const countByStatus = (status: string) =>
-    transactions.filter((t) => t.status === status).length;
+  const countByStatus = (status: string) => transactionCounts[status] || 0;
 
   return (
     <Box p={{ base: 4, md: 6 }}>
@@ -108,7 +105,16 @@ export const UserDetailPage = () => {
             <Text color="red.500">❌ Fallidas: {countByStatus("failed")}</Text>
           </Flex>
         </Box>
-        { transactions.length === 0 ? (
+        { transactionsError ? (
+          <Alert.Root status="error" mb={4}>
+            <Alert.Indicator />
+            <Alert.Title>{transactionsError}</Alert.Title>
+          </Alert.Root>
+        ) : loadingTransactions ? (
+          <Flex justify="center" py={6}>
+            <Spinner size="md" />
+          </Flex>
+        ) : transactions.length === 0 && !pagination.hasPrevious ? (
           <Text fontSize="md" color="gray.500" textAlign="center" py={6}>
             No hay transacciones registradas para este usuario.
           </Text>
@@ -154,9 +160,8 @@ export const UserDetailPage = () => {
                 ))}
               </Table.Body>
             </Table.Root>
+            <PaginationControls {...pagination} />
           </Box>
-
-
         ) 
         }
         </>
@@ -1,9 +1,6 @@
-import { useEffect, useState } from 'react';
 import { 
   Box, 
   Flex, 
-  Text, 
-  IconButton, 
   Portal,
   Heading,
   Spinner,
@@ -15,6 +12,8 @@ import { createListCollection } from '@ark-ui/react';
 import { authCompanyAPI } from '../services/companyApi';
 import { OrderItem } from '@/shared/types/types';
 import { toaster } from "@/shared/components/ui/toaster";
+import PaginationControls from "@/shared/components/PaginationControls";
+import { useCursorPagination } from "@/shared/hooks/useCursorPagination";
 
 const statusOptions = createListCollection({
   items: [
@@ -25,14 +24,6 @@ const statusOptions = createListCollection({
   ],
 });
 
-const itemsPerPageOptions = createListCollection({
-  items: [
-    { label: "10 por página", value: "10" },
-    { label: "20 por página", value: "20" },
-    { label: "30 por página", value: "30" },
-  ],
-});
-
 const statusColors = {
   pending: 'yellow.600',
   processed: 'blue.400',
@@ -41,62 +32,21 @@ const statusColors = {
 };
 
 export function OrderHistoryPage() {
-  const [orders, setOrders] = useState<OrderItem[]>([]);
-  const [isLoading, setIsLoading] = useState(true);
-  const [error, setError] = useState<string | null>(null);
-  const [currentPage, setCurrentPage] = useState(1);
-  const [itemsPerPage, setItemsPerPage] = useState(10);
-  
-  
-  const loadOrders = async () => {
-    setIsLoading(true);
-    setError(null);
-    
-    try {
-      const response = await authCompanyAPI.getAllOrders();
-      if (response.success && response.data) {
-        // Ordenar por fecha (más reciente primero)
-        const sortedOrders = [...response.data].sort(
-          (a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime()
-        );
-        setOrders(sortedOrders);
-      } else {
-        setError(response.error || "Error desconocido al cargar órdenes");
-        setOrders([]);
-      }
-    } catch (err) {
-      let errorMessage = "Ocurrió un error al cargar las órdenes";
-      if (err instanceof Error) {
-        errorMessage = err.message;
-      }
-      setError(errorMessage);
-      setOrders([]);
-    } finally {
-      setIsLoading(false);
-    }
-  };
-
-  // Cargar todas las órdenes al montar el componente
-  useEffect(() => {
-    loadOrders();
-  }, []);
+  // Una página de órdenes cada vez, ya ordenadas por fecha (más reciente primero) en el backend
+  const {
+    items: orders, isLoading, error, reload, ...pagination
+  } = useCursorPagination<OrderItem>(params => authCompanyAPI.getAllOrders(params));
 
   const handleStatusChange = async (orderItemId: number, newStatus: string) => {
     try {
       const response = await authCompanyAPI.updateOrderItemStatus(orderItemId, newStatus);
       toaster.create({ title: response.message, type: "success" });
-      loadOrders(); // recargar el estado actualizado
+      reload(); // recargar el estado actualizado
     } catch (err) {
       toaster.create({ title: `${err}`, type: "error", duration: 3000 });
     }
   };
 
-  // Calcular órdenes para la página actual
-  const indexOfLastItem = currentPage * itemsPerPage;
-  const indexOfFirstItem = indexOfLastItem - itemsPerPage;
-  const currentOrders = orders.slice(indexOfFirstItem, indexOfLastItem);
-  const totalPages = Math.ceil(orders.length / itemsPerPage);
-
   return (
     <Box p={{ base: 3, md: 5 }}>
       <Heading size="lg" mb={6}>Historial de Órdenes</Heading>
@@ -111,7 +61,7 @@ export function OrderHistoryPage() {
           <Alert.Indicator />
           <Alert.Title>{error}</Alert.Title>
         </Alert.Root>
-      ) : orders.length === 0 ? (
+      ) : orders.length === 0 && !pagination.hasPrevious ? (
         <Alert.Root status="info">
           <Alert.Indicator />
           <Alert.Title>No se encontraron órdenes registradas.</Alert.Title>
@@ -131,7 +81,7 @@ export function OrderHistoryPage() {
             </Table.Header>
             <Table.Body>
 
-              {currentOrders.map((order) => (
+              {orders.map((order) => (
                 <Table.Row key={order.id}>
                   <Table.Cell>{order.product.name}</Table.Cell>
                   <Table.Cell>0x...{order.transaction.transaction_hash.substring(order.transaction.transaction_hash.length-10)}</Table.Cell>                  
@@ -175,66 +125,7 @@ export function OrderHistoryPage() {
             </Table.Root>
 
           {/* Controles de paginación */}
-          <Flex justifyContent="space-between" alignItems="center" mt={4}>
-            <Flex gap={2} alignItems="center">
-              <IconButton
-                aria-label="Página anterior"
-                onClick={() => setCurrentPage(currentPage - 1)}
-                disabled={currentPage === 1}
-                size="sm"
-                variant="ghost"
-              >
-                ←
-              </IconButton>
-              
-              <Text fontSize="sm">
-                Página {currentPage} de {totalPages}
-              </Text>
-
-              <IconButton
-                aria-label="Página siguiente"
-                onClick={() => setCurrentPage(currentPage + 1)}
-                disabled={currentPage === totalPages}
-                size="sm"
-                variant="ghost"
-              >
-                →
-              </IconButton>
-            </Flex>
-
-            <Select.Root
-              collection={itemsPerPageOptions}
-              value={[itemsPerPage.toString()]}
-              onValueChange={({ value }) => {
-                setItemsPerPage(Number(value[0]));
-                setCurrentPage(1);
-              }}
-              size="sm"
-              width="150px"
-            >
-              <Select.HiddenSelect />
-              <Select.Control>
-                <Select.Trigger>
-                  <Select.ValueText placeholder="Items por página" />
-                </Select.Trigger>
-                <Select.IndicatorGroup>
-                  <Select.Indicator />
-                </Select.IndicatorGroup>
-              </Select.Control>
-              <Portal>
-                <Select.Positioner>
-                  <Select.Content>
-                    {itemsPerPageOptions.items.map((option) => (
-                      <Select.Item key={option.value} item={option}>
-                        {option.label}
-                        <Select.ItemIndicator />
-                      </Select.Item>
-                    ))}
-                  </Select.Content>
-                </Select.Positioner>
-              </Portal>
-            </Select.Root>
-          </Flex>
+          <PaginationControls {...pagination} />
         </>
       )}
     </Box>
@@ -1,7 +1,8 @@
 import { API_PATHS } from '@/config/paths';
 import axios from 'axios';
 import { authCompanyAxios } from "../auth/api/authCompanyAxios";
-import { Product, UserProfile, Transaction, ApiResponse, DashboardDataType, OrderItem, UserStats, UpdateResponseType } from "@/shared/types/types";
+import { Product, UserProfile, Transaction, ApiResponse, DashboardDataType, OrderItem, UserStats, UpdateResponseType, CursorPage, PageParams } from "@/shared/types/types";
+import fetchPage from "@/shared/utils/fetchPage";
 
 export const authCompanyAPI = {
 
@@ -14,10 +15,10 @@ export const authCompanyAPI = {
     }
   },
 
-  getAllUsers: async (): Promise<ApiResponse<UserProfile[]>> => {
+  getAllUsers: async (params?: PageParams): Promise<ApiResponse<CursorPage<UserProfile>>> => {
     try {
-      const { data } = await authCompanyAxios.get(`${API_PATHS.company}/get-all-users`);
-      return { success: true, data: data.users || [] };
+      const users = await fetchPage<UserProfile>(authCompanyAxios, `${API_PATHS.company}/get-all-users`, 'users', params);
+      return { success: true, data: users };
     } catch (err) {
       const errorMessage = err instanceof Error ? err.message : 'Error al obtener los usuarios';
       console.error("API Error - getAllUsers:", err);
@@ -26,10 +27,10 @@ export const authCompanyAPI = {
   },
 
 
-  getAllOrders: async (): Promise<ApiResponse<OrderItem[]>> => {
+  getAllOrders: async (params?: PageParams): Promise<ApiResponse<CursorPage<OrderItem>>> => {
     try {
-      const { data } = await authCompanyAxios.get(`${API_PATHS.company}/get-all-orders`);
-      return { success: true, data: data.orders };
+      const orders = await fetchPage<OrderItem>(authCompanyAxios, `${API_PATHS.company}/get-all-orders`, 'orders', params);
+      return { success: true, data: orders };
     } catch (error) {
       const errorMessage = error instanceof Error ? error.message : 'Error al obtener obtener las órdenes';
       console.error("API Error - getAllOrders:", error);
@@ -38,10 +39,12 @@ export const authCompanyAPI = {
   },  
 
 
-  getTransactionsByWallet: async (walletAddress: string): Promise<ApiResponse<Transaction[]>> => {
+  getTransactionsByWallet: async (walletAddress: string, params?: PageParams): Promise<ApiResponse<CursorPage<Transaction>>> => {
     try {
-      const { data } = await authCompanyAxios.get(`${API_PATHS.company}/get-transactions-by-wallet/${walletAddress}`);
-      return { success: true, data: data.transactions || [] };
+      const transactions = await fetchPage<Transaction>(
+        authCompanyAxios, `${API_PATHS.company}/get-transactions-by-wallet/${walletAddress}`, 'transactions', params
+      );
+      return { success: true, data: transactions };
     } catch (err) {
       const errorMessage = err instanceof Error ? err.message : 'Error al obtener transacciones';
       console.error(`API Error - getTransactionsByWallet(${walletAddress}):`, err);
@@ -50,10 +53,12 @@ export const authCompanyAPI = {
   },
 
 
-  getAllTransactions: async (): Promise<ApiResponse<Transaction[]>> => {
+  getAllTransactions: async (params?: PageParams): Promise<ApiResponse<CursorPage<Transaction>>> => {
     try {
-      const { data } = await authCompanyAxios.get(`${API_PATHS.company}/get-all-transactions`);
-      return { success: true, data: data.transactions || [] };
+      const transactions = await fetchPage<Transaction>(
+        authCompanyAxios, `${API_PATHS.company}/get-all-transactions`, 'transactions', params
+      );
+      return { success: true, data: transactions };
     } catch (err) {
       const errorMessage = err instanceof Error ? err.message : 'Error al obtener transacciones';
       console.error(`API Error - getAllTransactions():`, err);
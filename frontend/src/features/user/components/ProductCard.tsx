@@ -2,6 +2,7 @@
 import { Card, Button, Text, Image, Flex, Badge } from "@chakra-ui/react";
 import { useCart } from "../context/CartContext";
 import { Product } from "@/shared/types/types";
+import availableStock from "@/shared/utils/availableStock";
 
 interface ProductCardProps {
   product: Product;
@@ -12,7 +13,7 @@ export const ProductCard = ({ product, variant = 'catalog' }: ProductCardProps)
   const { cart, addToCart, removeFromCart, updateQuantity } = useCart();
   const cartItem = cart.find(item => item.product.id === product.id);
   const currentQty = cartItem?.quantity || 0;
-  const available = product.stock_quantity - currentQty;
+  const available = availableStock(product) - currentQty;
 
   const handleAddToCart = () => {
     addToCart(product);
@@ -21,7 +22,7 @@ export const ProductCard = ({ product, variant = 'catalog' }: ProductCardProps)
   const handleUpdateQuantity = async (newQuantity: number) => {
     if (newQuantity < 1) {
       await removeFromCart(product.id);
-    } else if (newQuantity <= product.stock_quantity) {
+    } else if (newQuantity <= availableStock(product)) {
       await updateQuantity(product.id, newQuantity);
     }
   };
@@ -64,7 +65,7 @@ export const ProductCard = ({ product, variant = 'catalog' }: ProductCardProps)
                 size="xs"
                 variant="outline"
                 onClick={() => handleUpdateQuantity(currentQty + 1)}
-                disabled={currentQty >= product.stock_quantity}
+                disabled={currentQty >= availableStock(product)}
               >
                 +
               </Button>
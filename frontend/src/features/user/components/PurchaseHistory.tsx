@@ -1,12 +1,6 @@
-import { useEffect, useState } from 'react';
 import { 
   Box, 
-  Flex, 
   Text, 
-  IconButton, 
-  Select, 
-  Portal, 
-  createListCollection,
   Stack,
   Heading,
   Alert,
@@ -16,47 +10,20 @@ import TransactionData from "./TransactionData";
 import { authUserAPI } from '../services/userApi';
 import { useWallet } from '@/features/user/hooks/useWallet';
 import TruncateAddress from '@/shared/components/TruncatedAddress';
-
-const itemsPerPageOptions = createListCollection({
-  items: [
-    { label: "10 por página", value: "10" },
-    { label: "20 por página", value: "20" },
-    { label: "30 por página", value: "30" },
-  ],
-});
+import PaginationControls from '@/shared/components/PaginationControls';
+import { useCursorPagination } from '@/shared/hooks/useCursorPagination';
 
 export function PurchaseHistory() {
-  const [transactions, setTransactions] = useState<Transaction[]>([]);
-  const [isLoading, setIsLoading] = useState(true);
-  const [currentPage, setCurrentPage] = useState(1);
-  const [itemsPerPage, setItemsPerPage] = useState(10);
-  const [ error, setError ] = useState<string | null>(null);
   const { address } = useWallet();
-   
-  useEffect(() => {
-    if (address) {
-
-      setIsLoading(true);
-      authUserAPI.getTransactionsByWallet(address)
-      .then(response => {
-        setTransactions(response.data.transactions);
-        setCurrentPage(1);
-      })
-      .catch((err) => {
-        setError(err instanceof Error ? err.message : "Error al cargar transacciones");        
-      })
-      .finally(() => {
-        setIsLoading(false);
-      });
-    }
-  }, [address]);
-
-
-  // Calcular transacciones para la página actual
-  const indexOfLastItem = currentPage * itemsPerPage;
-  const indexOfFirstItem = indexOfLastItem - itemsPerPage;
-  const currentTransactions = transactions.slice(indexOfFirstItem, indexOfLastItem);
-  const totalPages = Math.ceil(transactions.length / itemsPerPage);
+  // Una página de transacciones cada vez; sin wallet conectada no se pide nada
+  const {
+    items: transactions, isLoading, error, ...pagination
+  } = useCursorPagination<Transaction>(
+    params => address
+      ? authUserAPI.getTransactionsByWallet(address, params)
+      : Promise.resolve({ success: true, data: { items: [], next_cursor: null, has_more: false } }),
+    [address],
+  );
 
    return (
     <Box p={{ base: 3, md: 6 }}>
@@ -70,77 +37,18 @@ export function PurchaseHistory() {
           <Alert.Indicator />
           <Alert.Title>{error}</Alert.Title>
         </Alert.Root>
-      ) : transactions.length === 0 ? (
+      ) : transactions.length === 0 && !pagination.hasPrevious ? (
         <Text>No se encontraron transacciones.</Text>
       ) : (
         <>
           <Stack gap={4} marginX={'auto'} maxW={{ base: "100%", md: "900px" }}>
-            {currentTransactions.map((transaction) => (
+            {transactions.map((transaction) => (
               <TransactionData key={transaction.id} tx={transaction} />
             ))}
           </Stack>
 
           {/* Controles de paginación */}
-          <Flex justifyContent="space-between" alignItems="center" mt={4}>
-            <Flex gap={2} alignItems="center">
-              <IconButton
-                aria-label="Página anterior"
-                onClick={() => setCurrentPage(currentPage - 1)}
-                disabled={currentPage === 1}
-                size="sm"
-                variant="ghost"
-              >
-                ←
-              </IconButton>
-              
-              <Text fontSize="sm">
-                Página {currentPage} de {totalPages}
-              </Text>
-
-              <IconButton
-                aria-label="Página siguiente"
-                onClick={() => setCurrentPage(currentPage + 1)}
-                disabled={currentPage === totalPages}
-                size="sm"
-                variant="ghost"
-              >
-                →
-              </IconButton>
-            </Flex>
-
-            <Select.Root
-              collection={itemsPerPageOptions}
-              value={[itemsPerPage.toString()]}
-              onValueChange={({ value }) => {
-                setItemsPerPage(Number(value[0]));
-                setCurrentPage(1);
-              }}
-              size="sm"
-              width="150px"
-            >
-              <Select.HiddenSelect />
-              <Select.Control>
-                <Select.Trigger>
-                  <Select.ValueText placeholder="Items por página" />
-                </Select.Trigger>
-                <Select.IndicatorGroup>
-                  <Select.Indicator />
-                </Select.IndicatorGroup>
-              </Select.Control>
-              <Portal>
-                <Select.Positioner>
-                  <Select.Content>
-                    {itemsPerPageOptions.items.map((option) => (
-                      <Select.Item key={option.value} item={option}>
-                        {option.label}
-                        <Select.ItemIndicator />
-                      </Select.Item>
-                    ))}
-                  </Select.Content>
-                </Select.Positioner>
-              </Portal>
-            </Select.Root>
-          </Flex>
+          <PaginationControls {...pagination} />
         </>
       )}
     </Box>
@@ -1,6 +1,7 @@
 import { createContext, useContext, useState, useEffect, useCallback, useRef } from "react";
 import { useAccount } from "wagmi";
 import { CartContextType, CartItem, Product } from "@/shared/types/types";
+import availableStock from "@/shared/utils/availableStock";
 import { useWallet } from "@/features/user/hooks/useWallet";
 
 const CART_STORAGE_KEY = "shopping_cart";
@@ -55,8 +56,8 @@ export const CartProvider: React.FC<{ children: React.ReactNode }> = ({ children
       const currentQty = existing?.quantity || 0;
       
       // Verificar stock disponible
-      if (currentQty >= product.stock_quantity) {
-        alert(`No hay suficiente stock. Máximo disponible: ${product.stock_quantity} unidades`);
+      if (currentQty >= availableStock(product)) {
+        alert(`No hay suficiente stock. Máximo disponible: ${availableStock(product)} unidades`);
         return prev;
       }
       
@@ -100,11 +101,11 @@ export const CartProvider: React.FC<{ children: React.ReactNode }> = ({ children
       if (!item) return prev;
       
       // Verificar que no exceda el stock disponible
-      if (newQuantity > item.product.stock_quantity) {
-        alert(`No puedes agregar más de ${item.product.stock_quantity} unidades de "${item.product.name}"`);
+      if (newQuantity > availableStock(item.product)) {
+        alert(`No puedes agregar más de ${availableStock(item.product)} unidades de "${item.product.name}"`);
         const updatedCart = prev.map(i =>
           i.product.id === productId
-            ? { ...i, quantity: item.product.stock_quantity }
+            ? { ...i, quantity: availableStock(item.product) }
             : i
         );
         persistCart(updatedCart);
@@ -138,13 +139,13 @@ export const CartProvider: React.FC<{ children: React.ReactNode }> = ({ children
         // Validar que los productos en el carrito aún tengan stock disponible
         // Esto es importante para evitar que el usuario compre productos sin stock
         const validatedCart = storedCart.filter(item => {
-          if (item.product.stock_quantity <= 0) {
+          if (availableStock(item.product) <= 0) {
             console.warn(`Producto ${item.product.name} sin stock, eliminando del carrito`);
             return false;
           }
-          if (item.quantity > item.product.stock_quantity) {
-            console.warn(`Ajustando cantidad de ${item.product.name} de ${item.quantity} a ${item.product.stock_quantity}`);
-            item.quantity = item.product.stock_quantity;
+          if (item.quantity > availableStock(item.product)) {
+            console.warn(`Ajustando cantidad de ${item.product.name} de ${item.quantity} a ${availableStock(item.product)}`);
+            item.quantity = availableStock(item.product);
           }
           return true;
         });
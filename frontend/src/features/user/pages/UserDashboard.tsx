@@ -9,6 +9,8 @@ import { Transaction } from "@/shared/types/types";
 import TransactionData from "../components/TransactionData";
 import TruncateAddress from "@/shared/components/TruncatedAddress";
 
+const RECENT_TRANSACTIONS = 5;
+
 export default function Home() {
   const { address, isConnected, isWalletRegistered, isAuthenticated, authenticate } = useWallet();
   const navigate = useNavigate();
@@ -26,9 +28,14 @@ export default function Home() {
   useEffect(() => {
     if (address && isAuthenticated) {
       setLoading(true);
-      authUserAPI.getTransactionsByWallet(address)
+      // Solo se muestran las 5 últimas: el backend ya las devuelve de la más reciente a la más antigua
+      authUserAPI.getTransactionsByWallet(address, { page_size: RECENT_TRANSACTIONS })
         .then(response => {
-          setTransactions(response.data.transactions);
+          if (response.success && response.data) {
+            setTransactions(response.data.items);
+          } else {
+            setError(response.error || "Error al cargar transacciones");
+          }
         })
         .catch((err) => {
           console.error("Error fetching transactions:", err);
@@ -216,10 +223,7 @@ export default function Home() {
                 </Alert.Root>
               ) : transactions.length > 0 ? (
                 <Stack spaceY={4}>
-                  {transactions
-                    .sort((a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime())
-                    .slice(0, 5)
-                    .map((tx) => (
+                  {transactions.map((tx) => (
                       <TransactionData key={tx.id} tx={tx} />
                     ))}
                   </Stack>
@@ -1,7 +1,8 @@
 import { API_PATHS } from '@/config/paths';
 import axios from 'axios';
 import { authUserAxios } from '../auth/authUserAxios';
-import { ApiResponse, UserProfile, OrderItem, Transaction } from '@/shared/types/types';
+import { ApiResponse, UserProfile, OrderItem, Transaction, CursorPage, PageParams } from '@/shared/types/types';
+import fetchPage from '@/shared/utils/fetchPage';
 
 
 // Función auxiliar para manejar errores de API
@@ -50,8 +51,16 @@ export const authUserAPI = {
   }) => axios.post(`${API_PATHS.users}/wallet-auth`, payload),
   
 
-  getTransactionsByWallet: (wallet: string) =>
-    authUserAxios.get(`${API_PATHS.payments}/get-transactions-by-wallet/${wallet}`),
+  getTransactionsByWallet: async (wallet: string, params?: PageParams): Promise<ApiResponse<CursorPage<Transaction>>> => {
+    try {
+      const transactions = await fetchPage<Transaction>(
+        authUserAxios, `${API_PATHS.payments}/get-transactions-by-wallet/${wallet}`, 'transactions', params
+      );
+      return { success: true, data: transactions };
+    } catch (err) {
+      return handleApiError<CursorPage<Transaction>>(err);
+    }
+  },
 
 
   // getTransactionOrderItems: async (id: number): Promise<ApiResponse<OrderItem[]>> => {
@@ -0,0 +1,85 @@
+import { Flex, IconButton, Portal, Select, Text, createListCollection } from "@chakra-ui/react";
+
+const itemsPerPageOptions = createListCollection({
+  items: [
+    { label: "10 por página", value: "10" },
+    { label: "20 por página", value: "20" },
+    { label: "30 por página", value: "30" },
+  ],
+});
+
+// Los mismos nombres que devuelve useCursorPagination
+interface PaginationControlsProps {
+  pageNumber: number;
+  hasPrevious: boolean;
+  hasNext: boolean;
+  previous: () => void;
+  next: () => void;
+  pageSize: number;
+  setPageSize: (pageSize: number) => void;
+}
+
+// Anterior / siguiente sobre un listado paginado por cursor (sin total de páginas: el backend no hace COUNT)
+const PaginationControls = ({
+  pageNumber, hasPrevious, hasNext, previous, next, pageSize, setPageSize,
+}: PaginationControlsProps) => (
+  <Flex justifyContent="space-between" alignItems="center" mt={4}>
+    <Flex gap={2} alignItems="center">
+      <IconButton
+        aria-label="Página anterior"
+        onClick={previous}
+        disabled={!hasPrevious}
+        size="sm"
+        variant="ghost"
+      >
+        ←
+      </IconButton>
+
+      <Text fontSize="sm">
+        Página {pageNumber}
+      </Text>
+
+      <IconButton
+        aria-label="Página siguiente"
+        onClick={next}
+        disabled={!hasNext}
+        size="sm"
+        variant="ghost"
+      >
+        →
+      </IconButton>
+    </Flex>
+
+    <Select.Root
+      collection={itemsPerPageOptions}
+      value={[pageSize.toString()]}
+      onValueChange={({ value }) => setPageSize(Number(value[0]))}
+      size="sm"
+      width="150px"
+    >
+      <Select.HiddenSelect />
+      <Select.Control>
+        <Select.Trigger>
+          <Select.ValueText placeholder="Items por página" />
+        </Select.Trigger>
+        <Select.IndicatorGroup>
+          <Select.Indicator />
+        </Select.IndicatorGroup>
+      </Select.Control>
+      <Portal>
+        <Select.Positioner>
+          <Select.Content>
+            {itemsPerPageOptions.items.map((option) => (
+              <Select.Item key={option.value} item={option}>
+                {option.label}
+                <Select.ItemIndicator />
+              </Select.Item>
+            ))}
+          </Select.Content>
+        </Select.Positioner>
+      </Portal>
+    </Select.Root>
+  </Flex>
+);
+
+export default PaginationControls;
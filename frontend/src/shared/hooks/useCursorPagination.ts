@@ -0,0 +1,65 @@
+import { useEffect, useState } from "react";
+import { ApiResponse, CursorPage, PageParams } from "@/shared/types/types";
+
+type PageFetcher<T> = (params: PageParams) => Promise<ApiResponse<CursorPage<T>>>;
+
+// Listado paginado por cursor: en memoria solo está la página visible.
+// Se guarda el cursor con el que se pidió cada página ya vista para poder volver atrás.
+// `filters` son los valores de los que depende fetchPage: si cambian se vuelve a la primera página.
+export function useCursorPagination<T>(fetchPage: PageFetcher<T>, filters: unknown[] = [], initialPageSize = 10) {
+  const filtersKey = JSON.stringify(filters);
+  const [state, setState] = useState({ filtersKey, pageSize: initialPageSize, cursors: [null] as (string | null)[] });
+  const [page, setPage] = useState<CursorPage<T>>({ items: [], next_cursor: null, has_more: false });
+  const [isLoading, setIsLoading] = useState(true);
+  const [error, setError] = useState<string | null>(null);
+  const [reloads, setReloads] = useState(0);
+
+  if (state.filtersKey !== filtersKey) {
+    setState({ ...state, filtersKey, cursors: [null] });
+  }
+
+  const cursor = state.cursors[state.cursors.length - 1];
+
+  useEffect(() => {
+    let cancelled = false;
+    setIsLoading(true);
+    setError(null);
+
+    fetchPage({ page_size: state.pageSize, cursor })
+      .then(response => {
+        if (cancelled) return;
+        if (response.success && response.data) {
+          setPage(response.data);
+        } else {
+          setError(response.error || "Error desconocido al cargar el listado");
+          setPage({ items: [], next_cursor: null, has_more: false });
+        }
+      })
+      .catch(err => {
+        if (!cancelled) setError(err instanceof Error ? err.message : "Error al cargar el listado");
+      })
+      .finally(() => {
+        if (!cancelled) setIsLoading(false);
+      });
+
+    return () => { cancelled = true; };
+    // fetchPage se crea en cada render: lo que cambia su resultado está en filtersKey
+  }, [state.filtersKey, state.pageSize, cursor, reloads]);
+
+  return {
+    items: page.items,
+    pageNumber: state.cursors.length,
+    hasNext: page.has_more,
+    hasPrevious: state.cursors.length > 1,
+    next: () => {
+      if (page.next_cursor) setState({ ...state, cursors: [...state.cursors, page.next_cursor] });
+    },
+    previous: () => setState({ ...state, cursors: state.cursors.slice(0, -1) }),
+    pageSize: state.pageSize,
+    setPageSize: (pageSize: number) => setState({ ...state, pageSize, cursors: [null] }),
+    // Vuelve a pedir la página actual (tras modificar una fila)
+    reload: () => setReloads(n => n + 1),
+    isLoading,
+    error,
+  };
+}
@@ -22,6 +22,7 @@ export interface ApiCartItem {
     description: string;
     amount_usd: number;
     stock_quantity: number;
+    available_stock?: number;
     category: string;
     image?: string | null;
   }
@@ -36,6 +37,7 @@ export interface Product {
   image?: string | null;
   amount_usd: number;
   stock_quantity: number;
+  available_stock?: number;
 }
   
 export interface UserProfile {
@@ -86,6 +88,18 @@ export interface OrderItem {
   transaction: Transaction
 }  
 
+// Una página de un listado del backend paginado por cursor: la siguiente se pide con next_cursor
+export interface CursorPage<T> {
+  items: T[];
+  next_cursor: string | null;
+  has_more: boolean;
+}
+
+export interface PageParams {
+  page_size?: number;
+  cursor?: string | null;
+}
+
 export interface ApiError extends Error {
   response?: {
       status: number;
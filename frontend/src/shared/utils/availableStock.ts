@@ -0,0 +1,7 @@
+import { Product } from "@/shared/types/types";
+
+// Stock que se puede comprar: el total menos lo reservado por pedidos pendientes.
+// Los carritos guardados antes de existir available_stock solo traen stock_quantity.
+export default function availableStock(product: Pick<Product, 'stock_quantity' | 'available_stock'>): number {
+  return product.available_stock ?? product.stock_quantity;
+}
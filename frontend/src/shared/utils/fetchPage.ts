@@ -0,0 +1,13 @@
+import { AxiosInstance } from "axios";
+import { CursorPage, PageParams } from "@/shared/types/types";
+
+// Una sola página de un listado del backend. Las exportaciones completas ya se descargan en streaming desde /export
+export default async function fetchPage<T>(
+  client: AxiosInstance, url: string, key: string, { page_size, cursor }: PageParams = {}
+): Promise<CursorPage<T>> {
+  const params: Record<string, string | number> = {};
+  if (page_size) params.page_size = page_size;
+  if (cursor) params.cursor = cursor;
+  const { data } = await client.get(url, { params });
+  return { items: data[key] || [], next_cursor: data.next_cursor ?? null, has_more: Boolean(data.has_more) };
+}